@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+asyncio/aiohttp fetch engine. crawl_core's Engine downloads through it
+instead of its requests thread pool when get.py or jimdo_fetch.py run with
+``--engine async``.
+
+One event loop thread keeps hundreds of requests in flight over a single
+pooled connector. Concurrency is bounded globally (``max_connections``) and
+per host (``per_host``), both by the connector's own limits. Retries mirror the requests sessions'
+``Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])``,
+and also cover connection errors and timeouts.
+
+Downloads use the same .part / sidecar protocol as atomic_download.py, so a
+transfer interrupted under either engine can be resumed by the other.
+
+Example:
+
+  async with AsyncFetcher(per_host=32) as fetcher:
+      page = await fetcher.get_cached(url, cache)
+      results = await asyncio.gather(*(fetcher.download(u, p) for u, p in jobs))
+"""
+
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+import aiohttp
+
+from atomic_download import (
+    CHUNK_SIZE,
+    PART_SUFFIX,
+    DownloadError,
+    discard_part,
+    expected_md5,
+    finalize_part,
+    range_total,
+    resume_state,
+    save_resume_validator,
+)
+from http_cache import HttpCache
+import telemetry
+
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: int
+    headers: Mapping[str, str]
+    body: Optional[bytes] = None
+    encoding: Optional[str] = None
+    from_cache: bool = False
+    size: int = 0  # body bytes transferred (downloads)
+
+    @property
+    def status_code(self) -> int:  # same spelling as requests.Response
+        return self.status
+
+    @property
+    def text(self) -> str:
+        return (self.body or b"").decode(self.encoding or "utf-8", errors="replace")
+
+
+class AsyncFetcher:
+    """Pooled aiohttp client with per-host limits, timeouts and retries."""
+
+    def __init__(
+        self,
+        max_connections: int = 256,
+        per_host: int = 32,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.headers = headers or {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "AsyncFetcher":
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            headers=self.headers,
+            trace_configs=[telemetry.aiohttp_trace_config()] if telemetry.active() else None,
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _backoff(self, attempt: int) -> None:
+        await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)))
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """GET ``url`` into memory (pages, feeds)."""
+        assert self._session is not None, "use 'async with AsyncFetcher()'"
+        attempt = 0
+        while True:
+            attempt += 1
+            rec = None
+            try:
+                rec = telemetry.start_request(url)
+                async with self._session.get(url, headers=headers, trace_request_ctx=rec) as resp:
+                    if resp.status not in RETRY_STATUSES or attempt > self.retries:
+                        body = await resp.read()
+                        telemetry.finish_request(
+                            rec, resp.status, len(body), resp.headers.get("Content-Type"), attempt - 1
+                        )
+                        return FetchResult(url, resp.status, resp.headers, body, resp.charset)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt > self.retries:
+                    telemetry.finish_request(rec, None, retries=attempt - 1, error=e)
+                    raise
+            await self._backoff(attempt)
+
+    async def get_cached(
+        self, url: str, cache: Optional[HttpCache] = None, headers: Optional[Dict[str, str]] = None
+    ) -> FetchResult:
+        """Like http_cache.cached_get: a 304 is served from the cached page copy."""
+        req_headers = dict(headers or {})
+        page_path = cache.page_path(url) if cache else None
+        if cache:
+            req_headers.update(cache.conditional_headers(url, page_path))
+        result = await self.get(url, req_headers)
+        if cache and page_path:
+            if result.status == 304:
+                ent = cache.entry(url) or {}
+                with open(page_path, "rb") as f:
+                    body = f.read()
+                return FetchResult(url, 200, result.headers, body, ent.get("encoding"), True)
+            if result.status == 200:
+                os.makedirs(cache.pages_dir, exist_ok=True)
+                with open(page_path, "wb") as f:
+                    f.write(result.body or b"")
+                cache.store(url, result, page_path, encoding=result.encoding)
+        return result
+
+    async def download(
+        self,
+        url: str,
+        dest_path: str,
+        headers: Optional[Dict[str, str]] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> FetchResult:
+        """Stream ``url`` to ``dest_path`` (atomic rename, Range resume).
+
+        Status 200/206 means the file is complete; anything else (304, 404,
+        ...) leaves the destination untouched.
+        """
+        assert self._session is not None, "use 'async with AsyncFetcher()'"
+        parent = os.path.dirname(dest_path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        attempt = 0
+        while True:
+            attempt += 1
+            rec = None
+            try:
+                rec = telemetry.start_request(url)
+                result = await self._download_once(url, dest_path, headers or {}, chunk_size, rec)
+                if result.status in RETRY_STATUSES and attempt <= self.retries:
+                    await self._backoff(attempt)
+                    continue
+                telemetry.finish_request(
+                    rec, result.status, result.size, result.headers.get("Content-Type"), attempt - 1
+                )
+                return result
+            except (aiohttp.ClientError, asyncio.TimeoutError, DownloadError) as e:
+                if attempt > self.retries:
+                    telemetry.finish_request(rec, None, retries=attempt - 1, error=e)
+                    raise
+                await self._backoff(attempt)
+
+    async def _download_once(
+        self, url: str, dest_path: str, headers: Dict[str, str], chunk_size: int, rec: Optional[dict] = None
+    ) -> FetchResult:
+        req_headers = dict(headers)
+        offset, validator = resume_state(dest_path, url)
+        if offset and validator:
+            req_headers["Range"] = f"bytes={offset}-"
+            req_headers["If-Range"] = validator
+        part_path = dest_path + PART_SUFFIX
+
+        async with self._session.get(url, headers=req_headers, trace_request_ctx=rec) as resp:
+            if resp.status == 206:
+                total = range_total(resp.headers, offset)
+                if total is False:
+                    discard_part(dest_path)
+                    raise DownloadError(f"unexpected Content-Range {resp.headers.get('Content-Range')!r}")
+            elif resp.status == 200:
+                offset = 0
+                total = resp.content_length
+            else:
+                return FetchResult(url, resp.status, resp.headers)
+
+            # The body is decoded as it streams, as in atomic_download
+            encoded = resp.headers.get("Content-Encoding", "identity") not in ("", "identity")
+            if encoded:
+                total = None  # Content-Length counts the encoded bytes
+            save_resume_validator(dest_path, url, resp.headers.get("ETag") or resp.headers.get("Last-Modified"))
+            md5 = hashlib.md5()
+            if offset:
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        md5.update(chunk)
+            size = offset
+            with open(part_path, "ab" if offset else "wb") as f:
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+
+            if total is not None and size != total:
+                if size > total:
+                    discard_part(dest_path)
+                raise DownloadError(f"got {size} of {total} bytes")
+            expected = None if encoded else expected_md5(resp.headers)
+            if expected and md5.hexdigest() != expected:
+                discard_part(dest_path)
+                raise DownloadError("checksum mismatch")
+            finalize_part(dest_path)
+            return FetchResult(url, resp.status, resp.headers, size=size - offset)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streamed, resumable, atomic file downloads shared by get.py and jimdo_fetch.py.
+
+Bodies are written in chunks to ``<dest>.part`` and only renamed onto
+``<dest>`` once the byte count (Content-Length / Content-Range) and, when the
+server sends one, the MD5 checksum (Content-MD5 or x-goog-hash) check out.
+An interrupted transfer leaves the .part file plus a small sidecar holding
+the URL and validator it was fetched under; the next attempt for the same
+URL asks for the remaining bytes with Range + If-Range instead of starting
+over, so a half-written JPEG never ends up at the final path. A .part left
+by another URL for the same destination (e.g. a different --max-size
+variant) is discarded rather than spliced onto.
+
+Example:
+
+  resp = stream_download(session, url, "images/2008-2011/居酒屋.jpg", timeout=30)
+  if resp.status_code in (200, 206):
+      ...  # file is complete and in place
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+import requests
+
+
+CHUNK_SIZE = 64 * 1024
+PART_SUFFIX = ".part"
+# Bytes of an error body kept on the returned response (challenge detection)
+ERROR_PEEK = 64 * 1024
+
+
+class DownloadError(Exception):
+    """The body did not match the advertised length or checksum."""
+
+
+def expected_md5(headers) -> Optional[str]:
+    """Hex MD5 advertised by the server, if any."""
+    value = headers.get("Content-MD5")
+    if value:
+        try:
+            return base64.b64decode(value).hex()
+        except Exception:
+            return None
+    for part in (headers.get("x-goog-hash") or "").split(","):
+        name, _, digest = part.strip().partition("=")
+        if name == "md5" and digest:
+            try:
+                return base64.b64decode(digest).hex()
+            except Exception:
+                return None
+    return None
+
+
+def _load_meta(meta_path: str) -> dict:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def resume_state(dest_path: str, url: str) -> Tuple[int, Optional[str]]:
+    """(bytes already in <dest>.part, validator they were fetched under).
+
+    Returns (0, None) when there is nothing that can safely be resumed. A
+    .part fetched from another URL is discarded.
+    """
+    part_path = dest_path + PART_SUFFIX
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    meta = _load_meta(part_path + ".json") if offset else {}
+    if offset and meta.get("url") != url:
+        discard_part(dest_path)
+        return 0, None
+    validator = meta.get("validator")
+    if not validator:
+        return 0, None
+    return offset, validator
+
+
+def save_resume_validator(dest_path: str, url: str, validator: Optional[str]) -> None:
+    if validator:
+        with open(dest_path + PART_SUFFIX + ".json", "w", encoding="utf-8") as f:
+            json.dump({"url": url, "validator": validator}, f)
+
+
+def range_total(headers, offset: int):
+    """Total size from a 206 Content-Range starting at ``offset``.
+
+    Returns None if the total is unknown ("*") and False if the range does
+    not start where the .part file ends.
+    """
+    m = re.match(r"bytes (\d+)-\d+/(\d+|\*)", headers.get("Content-Range", ""))
+    if not m or int(m.group(1)) != offset:
+        return False
+    return int(m.group(2)) if m.group(2) != "*" else None
+
+
+def _cleanup(*paths: str) -> None:
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def discard_part(dest_path: str) -> None:
+    """Drop a partial download that cannot be resumed."""
+    part_path = dest_path + PART_SUFFIX
+    _cleanup(part_path, part_path + ".json")
+
+
+def finalize_part(dest_path: str) -> None:
+    """Atomically move a verified <dest>.part onto <dest>."""
+    part_path = dest_path + PART_SUFFIX
+    os.replace(part_path, dest_path)
+    _cleanup(part_path + ".json")
+
+
+def peek_body(resp: requests.Response, limit: int = ERROR_PEEK) -> None:
+    """Read up to ``limit`` bytes of a streamed body into ``resp.content``.
+
+    The response is closed when it is returned; this keeps the start of an
+    error page (e.g. an anti-bot challenge) readable for the caller.
+    """
+    data = b""
+    try:
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            data += chunk
+            if len(data) >= limit:
+                break
+    except requests.RequestException:
+        pass
+    resp._content = data[:limit]
+    resp._content_consumed = True
+
+
+def _fetch_once(
+    session: requests.Session,
+    url: str,
+    dest_path: str,
+    timeout: float,
+    headers: Dict[str, str],
+    chunk_size: int,
+) -> requests.Response:
+    part_path = dest_path + PART_SUFFIX
+    req_headers = dict(headers)
+
+    offset, validator = resume_state(dest_path, url)
+    if offset and validator:
+        req_headers["Range"] = f"bytes={offset}-"
+        req_headers["If-Range"] = validator
+
+    with session.get(url, timeout=timeout, headers=req_headers, stream=True) as resp:
+        if resp.status_code == 206:
+            total = range_total(resp.headers, offset)
+            if total is False:
+                discard_part(dest_path)
+                raise DownloadError(f"unexpected Content-Range {resp.headers.get('Content-Range')!r}")
+        elif resp.status_code == 200:
+            offset = 0
+            length = resp.headers.get("Content-Length")
+            total = int(length) if length and length.isdigit() else None
+        else:
+            if resp.status_code >= 400:
+                peek_body(resp)
+            return resp
+
+        encoded = resp.headers.get("Content-Encoding", "identity") not in ("", "identity")
+        if encoded:
+            total = None  # Content-Length counts the encoded bytes
+        save_resume_validator(dest_path, url, resp.headers.get("ETag") or resp.headers.get("Last-Modified"))
+
+        md5 = hashlib.md5()
+        if offset:
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    md5.update(chunk)
+        size = offset
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    md5.update(chunk)
+                    size += len(chunk)
+
+        if total is not None and size != total:
+            if size > total:
+                discard_part(dest_path)
+            # A short body stays as .part so the next attempt can resume it
+            raise DownloadError(f"got {size} of {total} bytes")
+        expected = None if encoded else expected_md5(resp.headers)
+        if expected and md5.hexdigest() != expected:
+            discard_part(dest_path)
+            raise DownloadError("checksum mismatch")
+
+        finalize_part(dest_path)
+        return resp
+
+
+def stream_download(
+    session: requests.Session,
+    url: str,
+    dest_path: str,
+    timeout: float = 30,
+    headers: Optional[Dict[str, str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+    attempts: int = 3,
+) -> requests.Response:
+    """Download ``url`` to ``dest_path`` via a .part file and atomic rename.
+
+    Returns the (closed) response. 200/206 mean the file is complete at
+    ``dest_path``; any other status (e.g. 304 for a conditional request)
+    leaves the destination untouched. Connection drops and short bodies are
+    retried up to ``attempts`` times, resuming from the bytes already on disk.
+    """
+    parent = os.path.dirname(dest_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    attempt = 1
+    while True:
+        try:
+            return _fetch_once(session, url, dest_path, timeout, headers or {}, chunk_size)
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            DownloadError,
+        ):
+            if attempt >= attempts:
+                raise
+            attempt += 1
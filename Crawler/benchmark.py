@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark suite for the crawler and dedupe hot paths.
+
+Everything runs against synthetic fixtures, so results are reproducible and
+need no network:
+
+- a generated JPEG corpus (count and size configurable, fixed seed);
+- synthetic Blogspot (get.py) and Jimdo (jimdo_fetch.py) gallery pages with
+  thousands of entries;
+- a local HTTP server that serves those pages and the corpus, with
+  configurable per-request latency and per-connection bandwidth. It can also
+  act as a throttling stub: with --server-max-inflight it answers 503 +
+  Retry-After while more requests than that are in flight.
+
+Stages (select with --stages):
+
+  dhash, ahash, phash   open + decode + one hash per image (hash_engine)
+  hash_batch            all three hashes from one draft-mode decode
+  best_match_scan       best_match over the plain dict (linear scan)
+  best_match_bktree     best_match over a BKTree
+  best_match_mih        best_match over a MultiIndex (what the merge tools use)
+
+The best_match stages query at --threshold. Half of the queries are a few
+bits off a library hash and half match nothing, like the new images of a
+merge run (--new-queries sets the share); those still report their nearest
+image, as the merge report does.
+  index_cold            build_existing_hash_index with an empty cache
+  index_warm            the same, reusing the persisted cache
+  process_page          get.process_page on the synthetic Blogspot page
+  process_feed          the same post through its Blogger JSON feed (--source feed)
+  collect_image_urls    jimdo_fetch.collect_image_urls on the Jimdo page
+  download_threads      stream_download on a fixed thread pool
+  download_adaptive     the same through rate_control's adaptive controller
+  download_async        AsyncFetcher.download (skipped without aiohttp)
+
+Each stage reports per-item p50/p99/mean in milliseconds and throughput.
+Results are saved as JSON, and --compare prints the change against an
+earlier run.
+
+Usage examples:
+
+  # Default run, results in Crawler/benchmark_results.json
+  python Crawler/benchmark.py
+
+  # Bigger corpus, slow link, only the hashing and download stages
+  python Crawler/benchmark.py --images 500 --latency-ms 80 --bandwidth-kbps 2000 \\
+      --stages dhash hash_batch download_threads download_async
+
+  # Fixed vs adaptive concurrency against a server that sheds load above 8
+  python Crawler/benchmark.py --stages download_threads download_adaptive \\
+      --server-max-inflight 8 --workers 32
+
+  # Full page vs JSON feed, with ~300 KB of theme/widgets around the post
+  python Crawler/benchmark.py --stages process_page process_feed --theme-kb 300
+
+  # Compare with a previous run
+  python Crawler/benchmark.py --out after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+DEFAULT_RESULTS = os.path.join("Crawler", "benchmark_results.json")
+STAGES = (
+    "dhash",
+    "ahash",
+    "phash",
+    "hash_batch",
+    "best_match_scan",
+    "best_match_bktree",
+    "best_match_mih",
+    "index_cold",
+    "index_warm",
+    "process_page",
+    "process_feed",
+    "collect_image_urls",
+    "download_threads",
+    "download_adaptive",
+    "download_async",
+)
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+
+def make_corpus(out_dir: str, count: int, size: Tuple[int, int], seed: int = 0) -> List[str]:
+    """Write ``count`` synthetic JPEGs (gradient, shapes and noise)."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    paths = []
+    for i in range(count):
+        path = os.path.join(out_dir, f"{i:05d}.jpg")
+        paths.append(path)
+        if os.path.isfile(path):
+            continue
+        c0, c1 = rng.integers(0, 256, 3), rng.integers(0, 256, 3)
+        t = ((xx * rng.random() + yy * rng.random()) / (w + h))[..., None]
+        px = c0 * (1 - t) + c1 * t + rng.normal(0, 12, (h, w, 3))
+        img = Image.fromarray(np.clip(px, 0, 255).astype(np.uint8))
+        draw = ImageDraw.Draw(img)
+        for _ in range(int(rng.integers(3, 9))):
+            x0, y0 = int(rng.integers(0, w)), int(rng.integers(0, h))
+            x1, y1 = x0 + int(rng.integers(w // 10, w // 2)), y0 + int(rng.integers(h // 10, h // 2))
+            fill = tuple(int(v) for v in rng.integers(0, 256, 3))
+            (draw.ellipse if rng.random() < 0.5 else draw.rectangle)([x0, y0, x1, y1], fill=fill)
+        img.save(path, quality=88)
+    return paths
+
+
+def blogspot_body(entries: int, base_url: str, images: int) -> str:
+    """Blogspot-style post body: image link, then a ●title, grouped by ●20xx headers."""
+    parts = []
+    for i in range(entries):
+        if i % 100 == 0:
+            parts.append(f"<div><b>●20{10 + i // 100:02d}</b></div>")
+        src = f"{base_url}/img/s400/{i % images:05d}.jpg"
+        parts.append(
+            f'<div class="separator"><a href="{src.replace("/s400/", "/s1600/")}">'
+            f'<img border="0" src="{src}" width="320" /></a></div><div>●作品{i:05d}</div>'
+        )
+    return "\n".join(parts)
+
+
+def blogspot_html(entries: int, base_url: str, images: int, theme_kb: int = 0) -> str:
+    """The full post page; ``theme_kb`` adds that much theme/widget markup around the body."""
+    theme = []
+    while sum(map(len, theme)) < theme_kb * 1024:
+        n = len(theme)
+        theme.append(
+            f'<script>var _w{n}={{"id":{n},"cfg":"{"x" * 200}"}};</script>'
+            f'<div class="widget LinkList" id="LinkList{n}"><h2>リンク</h2><ul>'
+            + "".join(f'<li><a href="{base_url}/p/{n}-{k}.html">ページ {n}-{k}</a></li>' for k in range(5))
+            + "</ul></div>"
+        )
+    head = "".join(theme[: len(theme) // 2])
+    tail = "".join(theme[len(theme) // 2:])
+    return (
+        f'<html><head><meta charset="utf-8">{head}</head><body><div class="post-body entry-content">\n'
+        f"{blogspot_body(entries, base_url, images)}\n</div>{tail}</body></html>"
+    )
+
+
+def blogger_feed_json(body: str, page_url: str) -> str:
+    """alt=json posts feed with a single entry holding ``body``."""
+    entry = {
+        "title": {"type": "text", "$t": "bench"},
+        "content": {"type": "html", "$t": body},
+        "link": [{"rel": "alternate", "type": "text/html", "href": page_url}],
+    }
+    return json.dumps({"version": "1.0", "encoding": "UTF-8", "feed": {"entry": [entry]}}, ensure_ascii=False)
+
+
+def jimdo_html(entries: int, base_url: str, images: int) -> str:
+    """Jimdo-style gallery: linked thumbnails with srcset candidates."""
+    parts = ['<html><head><meta charset="utf-8"></head><body><main><div class="cc-m-gallery">']
+    for i in range(entries):
+        full = f"{base_url}/img/{i % images:05d}.jpg?v={i}"
+        parts.append(
+            f'<a href="{full}" data-href="{full}"><img src="{full}&w=150" '
+            f'srcset="{full}&w=150 150w, {full}&w=600 600w, {full}&w=1200 1200w" /></a>'
+        )
+    parts.append('<img src="/pixel.gif" width="1" height="1" /></div></main></body></html>')
+    return "\n".join(parts)
+
+
+class BenchServer:
+    """Local HTTP server for pages and corpus images with simulated link speed.
+
+    ``latency_ms`` is added before every response; ``bandwidth_kbps`` (0 =
+    unlimited) throttles each response body. With ``max_inflight`` image
+    requests beyond that many concurrent ones get 503 + ``Retry-After: 1``.
+    """
+
+    def __init__(
+        self,
+        pages: Dict[str, bytes],
+        images: List[str],
+        latency_ms: float,
+        bandwidth_kbps: float,
+        max_inflight: int = 0,
+    ) -> None:
+        self.pages = pages
+        self.images = []
+        for p in images:
+            with open(p, "rb") as f:
+                self.images.append(f.read())
+        self.latency = latency_ms / 1000.0
+        self.bandwidth = bandwidth_kbps * 1000 / 8  # bytes per second
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.httpd: Optional[ThreadingHTTPServer] = None
+
+    def __enter__(self) -> "BenchServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                path = self.path.split("?", 1)[0]
+                if path in server.pages:
+                    ctype = "application/json" if path.startswith("/feeds/") else "text/html; charset=utf-8"
+                    body = server.pages[path]
+                elif path.startswith("/img/") and path.endswith(".jpg"):
+                    idx = int(os.path.basename(path)[:-4]) % len(server.images)
+                    body, ctype = server.images[idx], "image/jpeg"
+                else:
+                    self.send_error(404)
+                    return
+                with server._lock:
+                    overloaded = bool(server.max_inflight) and server.inflight >= server.max_inflight
+                    if overloaded:
+                        server.rejected += 1
+                    else:
+                        server.inflight += 1
+                if overloaded:
+                    self.send_response(503)
+                    self.send_header("Retry-After", "1")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                try:
+                    self.send_body(body, ctype)
+                finally:
+                    with server._lock:
+                        server.inflight -= 1
+
+            def send_body(self, body: bytes, ctype: str) -> None:
+                if server.latency:
+                    time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                chunk = max(1024, int(server.bandwidth / 20))
+                for i in range(0, len(body), chunk):
+                    self.wfile.write(body[i: i + chunk])
+                    time.sleep(len(body[i: i + chunk]) / server.bandwidth)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self) -> str:
+        assert self.httpd is not None
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __exit__(self, *exc) -> None:
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+
+def summarize(samples: Sequence[float], total: float, items: int, unit: str, nbytes: int = 0) -> dict:
+    """Per-item latency percentiles (ms) plus throughput over the wall time."""
+    ms = np.asarray(samples, dtype=float) * 1000.0
+    out = {
+        "count": items,
+        "total_s": round(total, 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 3) if len(ms) else None,
+        "mean_ms": round(float(ms.mean()), 3) if len(ms) else None,
+        "throughput": round(items / total, 2) if total > 0 else None,
+        "unit": unit,
+    }
+    if nbytes:
+        out["mb_per_s"] = round(nbytes / total / 1e6, 3) if total > 0 else None
+    return out
+
+
+def time_each(fn: Callable, items: Sequence) -> Tuple[List[float], float]:
+    """Call ``fn(item)`` for each item; returns (per-call seconds, wall seconds)."""
+    samples = []
+    start = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - t)
+    return samples, time.perf_counter() - start
+
+
+def time_concurrent(fn: Callable, items: Sequence, workers: int) -> Tuple[List[float], float]:
+    """Like time_each, but on a thread pool (per-call latency includes queueing)."""
+    def one(item):
+        t = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - t
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        samples = list(ex.map(one, items))
+    return samples, time.perf_counter() - start
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+
+def bench_hash(paths: List[str], method: str) -> dict:
+    import hash_engine
+
+    fn = getattr(hash_engine, method)
+
+    def one(p: str) -> None:
+        with Image.open(p) as img:
+            fn(img)
+
+    samples, total = time_each(one, paths)
+    return summarize(samples, total, len(paths), "img/s")
+
+
+def bench_hash_batch(paths: List[str]) -> dict:
+    from hash_engine import hash_batch
+
+    samples, total = time_each(lambda p: hash_batch([p]), paths)
+    return summarize(samples, total, len(paths), "img/s")
+
+
+def bench_best_match(hashes: Dict[str, int], queries: List[int], kind: str, threshold: int) -> dict:
+    from hamming_index import BKTree, MultiIndex
+    from jimdo_compare_and_merge import best_match
+
+    index = {"scan": hashes, "bktree": BKTree.from_dict(hashes), "mih": MultiIndex.from_dict(hashes)}[kind]
+    samples, total = time_each(lambda q: best_match(q, index, threshold), queries)
+    return summarize(samples, total, len(queries), "queries/s")
+
+
+def bench_index(corpus_dir: str, cache_path: Optional[str], workers: Optional[int]) -> dict:
+    from hash_engine import build_existing_hash_index
+
+    count = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        count = len(build_existing_hash_index([corpus_dir], [], "dhash", workers=workers, cache_path=cache_path))
+    total = time.perf_counter() - start
+    return summarize([total / max(count, 1)] * count, total, count, "img/s")
+
+
+def bench_process_page(url: str, repeat: int, feed: bool = False) -> dict:
+    import get
+    from blogger_feed import FeedSource
+
+    session = get.setup_requests_session()
+    found = []
+    sources = []
+
+    def one(_):
+        # A fresh FeedSource per parse, so every repeat fetches the feed again
+        source = FeedSource(session) if feed else None
+        sources.append(source)
+        with contextlib.redirect_stdout(io.StringIO()):
+            found.append(len(get.process_page(url, session=session, feed=source)))
+
+    samples, total = time_each(one, range(repeat))
+    result = summarize(samples, total, repeat, "pages/s")
+    result["entries_per_page"] = found[0] if found else 0
+    result["bytes_per_page"] = sources[0].bytes if feed and sources else len(session.get(url).content)
+    return result
+
+
+def bench_collect(url: str, repeat: int) -> dict:
+    from jimdo_fetch import collect_image_urls, setup_requests_session
+
+    session = setup_requests_session()
+    found = []
+    samples, total = time_each(lambda _: found.append(len(collect_image_urls(session, url))), range(repeat))
+    result = summarize(samples, total, repeat, "pages/s")
+    result["entries_per_page"] = found[0] if found else 0
+    return result
+
+
+def bench_download_threads(urls: List[str], dest: str, workers: int, controller=None) -> dict:
+    from atomic_download import stream_download
+    from jimdo_fetch import setup_requests_session
+    from rate_control import throttle
+
+    session = setup_requests_session()
+    if controller is not None:
+        throttle(session, controller)
+    shutil.rmtree(dest, ignore_errors=True)
+    jobs = [(u, os.path.join(dest, f"{i:05d}.jpg")) for i, u in enumerate(urls)]
+    samples, total = time_concurrent(lambda j: stream_download(session, j[0], j[1], timeout=60), jobs, workers)
+    done = [p for _, p in jobs if os.path.isfile(p)]
+    result = summarize(samples, total, len(urls), "files/s", sum(os.path.getsize(p) for p in done))
+    result["failed"] = len(urls) - len(done)
+    if controller is not None:
+        result["concurrency"] = controller.stats()
+    return result
+
+
+def bench_download_async(urls: List[str], dest: str, per_host: int) -> Optional[dict]:
+    try:
+        from async_engine import AsyncFetcher
+    except ImportError:
+        return None
+
+    shutil.rmtree(dest, ignore_errors=True)
+    jobs = [(u, os.path.join(dest, f"{i:05d}.jpg")) for i, u in enumerate(urls)]
+
+    async def run() -> List[float]:
+        async with AsyncFetcher(per_host=per_host) as fetcher:
+            async def one(job):
+                t = time.perf_counter()
+                await fetcher.download(*job)
+                return time.perf_counter() - t
+
+            return await asyncio.gather(*(one(j) for j in jobs))
+
+    start = time.perf_counter()
+    samples = asyncio.run(run())
+    total = time.perf_counter() - start
+    done = [p for _, p in jobs if os.path.isfile(p)]
+    result = summarize(samples, total, len(urls), "files/s", sum(os.path.getsize(p) for p in done))
+    result["failed"] = len(urls) - len(done)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+
+def run_benchmarks(args) -> dict:
+    stages = set(args.stages)
+    work = tempfile.mkdtemp(prefix="crawler-bench-")
+    corpus_dir = args.corpus_dir or os.path.join(work, "corpus")
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    results: Dict[str, dict] = {}
+
+    def report(name: str, result: Optional[dict]) -> None:
+        if result is None:
+            print(f"  {name:<20} skipped")
+            return
+        results[name] = result
+        extra = f"  {result['mb_per_s']} MB/s" if "mb_per_s" in result else ""
+        if result.get("failed"):
+            extra += f"  {result['failed']} failed"
+        if result.get("rejected"):
+            extra += f"  {result['rejected']} x 503"
+        print(
+            f"  {name:<20} p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  "
+            f"{result['throughput']:>9} {result['unit']}{extra}"
+        )
+
+    try:
+        print(f"Corpus: {args.images} x {width}x{height} JPEG in {corpus_dir}")
+        paths = make_corpus(corpus_dir, args.images, (width, height), args.seed)
+
+        for method in ("dhash", "ahash", "phash"):
+            if method in stages:
+                report(method, bench_hash(paths, method))
+        if "hash_batch" in stages:
+            report("hash_batch", bench_hash_batch(paths))
+
+        if stages & {"best_match_scan", "best_match_bktree", "best_match_mih"}:
+            from hash_engine import compute_hash
+
+            rng = random.Random(args.seed)
+            base = {p: compute_hash(p, "dhash") for p in paths}
+            base = {p: h for p, h in base.items() if h is not None}
+            # Pad to --index-size with random hashes so the index is library-sized
+            while len(base) < args.index_size:
+                base[f"synthetic/{len(base):06d}"] = rng.getrandbits(64)
+            values = list(base.values())
+            queries = []
+            for _ in range(args.queries):
+                if rng.random() < args.new_queries:
+                    queries.append(rng.getrandbits(64))  # new image: nothing within the threshold
+                else:
+                    q = values[rng.randrange(len(values))]
+                    for bit in rng.sample(range(64), rng.randint(1, 3)):
+                        q ^= 1 << bit
+                    queries.append(q)
+            for kind in ("scan", "bktree", "mih"):
+                if f"best_match_{kind}" in stages:
+                    report(f"best_match_{kind}", bench_best_match(base, queries, kind, args.threshold))
+
+        cache_path = os.path.join(work, "hash_index.json")
+        if "index_cold" in stages:
+            report("index_cold", bench_index(corpus_dir, cache_path, args.workers))
+        if "index_warm" in stages:
+            if not os.path.isfile(cache_path):
+                bench_index(corpus_dir, cache_path, args.workers)
+            report("index_warm", bench_index(corpus_dir, cache_path, args.workers))
+
+        net = {"process_page", "process_feed", "collect_image_urls", "download_threads", "download_adaptive", "download_async"}
+        if stages & net:
+            pages = {}
+            with BenchServer(pages, paths, args.latency_ms, args.bandwidth_kbps, args.server_max_inflight) as server:
+                pages["/blog.html"] = blogspot_html(
+                    args.entries, server.base_url, len(paths), args.theme_kb).encode("utf-8")
+                pages["/feeds/posts/default"] = blogger_feed_json(
+                    blogspot_body(args.entries, server.base_url, len(paths)), f"{server.base_url}/blog.html").encode("utf-8")
+                pages["/jimdo.html"] = jimdo_html(args.entries, server.base_url, len(paths)).encode("utf-8")
+                bandwidth = f"{args.bandwidth_kbps} kbps" if args.bandwidth_kbps else "unlimited"
+                print(f"Server: {server.base_url} latency {args.latency_ms} ms, bandwidth {bandwidth}")
+                if "process_page" in stages:
+                    report("process_page", bench_process_page(f"{server.base_url}/blog.html", args.repeat))
+                if "process_feed" in stages:
+                    report("process_feed", bench_process_page(f"{server.base_url}/blog.html", args.repeat, feed=True))
+                if "collect_image_urls" in stages:
+                    report("collect_image_urls", bench_collect(f"{server.base_url}/jimdo.html", args.repeat))
+                urls = [f"{server.base_url}/img/{i % len(paths):05d}.jpg" for i in range(args.downloads)]
+                workers = args.workers or 8
+
+                def with_rejections(run: Callable[[], Optional[dict]]) -> Optional[dict]:
+                    server.rejected = 0
+                    result = run()
+                    if result is not None and server.rejected:
+                        result["rejected"] = server.rejected
+                    return result
+
+                if "download_threads" in stages:
+                    report("download_threads", with_rejections(
+                        lambda: bench_download_threads(urls, os.path.join(work, "dl_threads"), workers)))
+                if "download_adaptive" in stages:
+                    from rate_control import RateController
+
+                    # Starts low and has to find the sustainable level on its own
+                    controller = RateController(initial=min(4, workers), maximum=workers)
+                    report("download_adaptive", with_rejections(
+                        lambda: bench_download_threads(urls, os.path.join(work, "dl_adaptive"), workers, controller)))
+                    controller.print_stats()
+                if "download_async" in stages:
+                    report("download_async", with_rejections(
+                        lambda: bench_download_async(urls, os.path.join(work, "dl_async"), args.per_host)))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            k: getattr(args, k)
+            for k in (
+                "images", "image_size", "entries", "queries", "new_queries", "index_size", "threshold", "repeat", "downloads",
+                "latency_ms", "bandwidth_kbps", "server_max_inflight", "workers", "per_host", "seed",
+            )
+        },
+        "stages": results,
+    }
+
+
+def compare(current: dict, previous_path: str) -> None:
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} ({previous.get('created', '?')}):")
+    for name, cur in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if not old or not old.get("p50_ms") or not cur.get("p50_ms"):
+            print(f"  {name:<20} (no baseline)")
+            continue
+        ratio = old["p50_ms"] / cur["p50_ms"]
+        print(f"  {name:<20} p50 {old['p50_ms']:>9} -> {cur['p50_ms']:>9} ms  ({ratio:.2f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark hashing, matching, parsing and downloading")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--images", type=int, default=200, help="Synthetic JPEGs in the corpus")
+    parser.add_argument("--image-size", default="1200x900", help="WIDTHxHEIGHT of corpus images")
+    parser.add_argument("--corpus-dir", default=None, help="Keep/reuse the corpus here instead of a temp dir")
+    parser.add_argument("--entries", type=int, default=2000, help="Entries on the synthetic gallery pages")
+    parser.add_argument("--theme-kb", type=int, default=0, help="Theme/widget markup around the synthetic Blogspot post")
+    parser.add_argument("--queries", type=int, default=500, help="best_match queries")
+    parser.add_argument("--index-size", type=int, default=5000, help="Hashes in the best_match index")
+    parser.add_argument("--new-queries", type=float, default=0.5, help="Share of best_match queries with no match")
+    parser.add_argument("--threshold", type=int, default=10, help="best_match distance threshold, as in the merge tools")
+    parser.add_argument("--repeat", type=int, default=3, help="Page parses per parsing stage")
+    parser.add_argument("--downloads", type=int, default=200, help="Files per download stage")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Server latency per request")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0, help="Per-connection bandwidth (0 = unlimited)")
+    parser.add_argument("--workers", type=int, default=None, help="Hash processes / download threads")
+    parser.add_argument("--server-max-inflight", type=int, default=0,
+                        help="Server answers 503 + Retry-After above this many concurrent image requests (0 = never)")
+    parser.add_argument("--per-host", type=int, default=32, help="Async engine per-host concurrency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+    parser.add_argument("--out", default=DEFAULT_RESULTS, help="Results JSON")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
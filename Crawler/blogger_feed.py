@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Blogger JSON feed source for the Blogspot periods (get.py --source feed).
+
+A rendered Blogspot post page carries the theme, widgets and scripts around
+the post body. This module fetches only the post body, through Blogger's
+JSON feed:
+
+- A post URL ``/YYYY/MM/slug.html`` is looked up in
+  ``/feeds/posts/default?alt=json``, limited with published-min/-max to
+  the month in its path. A ``/p/`` page is looked up in
+  ``/feeds/pages/default``.
+- The entry is picked by post path: its ``rel="alternate"`` link has the
+  same path as the page URL. The host is ignored, so a local fixture server
+  matches too. ``rel="next"`` pages are followed until the post is found.
+- ``entry.content.$t`` is the post body HTML. get.parse_images runs on that
+  fragment, so the ●title/image association is unchanged.
+- Feed responses go through http_cache (ETag/Last-Modified revalidation).
+  Within a run they are shared, so posts of the same month cost one request.
+- A post missing from the feed returns None, and the caller falls back to the
+  full HTML page.
+
+fixtures/blogger_feed.json is a recorded feed whose entry holds the body of
+fixtures/blogspot_post.html. ``get.py --check-fixture`` checks both paths
+against the same expected result. ``serve`` serves both fixtures locally for
+end-to-end runs:
+
+  python Crawler/blogger_feed.py serve --port 8000
+  # get_urls.json: {"追加分1": "http://127.0.0.1:8000/2024/09/blog-post_11.html"}
+  cd Crawler && python get.py --source feed
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlencode, urlparse
+
+import requests
+
+from http_cache import HttpCache, cached_get
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_FEED = os.path.join(FIXTURE_DIR, "blogger_feed.json")
+FIXTURE_PAGE = os.path.join(FIXTURE_DIR, "blogspot_post.html")
+FIXTURE_PAGE_URL = "https://suzume4949.blogspot.com/2024/09/blog-post_11.html"
+
+POSTS_FEED = "/feeds/posts/default"
+PAGES_FEED = "/feeds/pages/default"
+MAX_RESULTS = 150  # Blogger's cap per feed page
+FEED_HEADERS = {"Accept": "application/json"}
+
+
+def feed_url(page_url: str) -> str:
+    """Feed URL that lists the post at ``page_url``."""
+    parsed = urlparse(page_url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    params = {"alt": "json", "max-results": MAX_RESULTS}
+    if parsed.path.startswith("/p/"):
+        return f"{origin}{PAGES_FEED}?{urlencode(params, safe=':')}"
+    m = re.match(r"^/(\d{4})/(\d{2})/", parsed.path)
+    if m:
+        # The month in the URL, widened by a day on each side for the blog's time zone
+        first = date(int(m[1]), int(m[2]), 1)
+        following = (first + timedelta(days=32)).replace(day=1)
+        params["published-min"] = f"{first - timedelta(days=1)}T00:00:00"
+        params["published-max"] = f"{following + timedelta(days=1)}T00:00:00"
+    return f"{origin}{POSTS_FEED}?{urlencode(params, safe=':')}"
+
+
+def parse_feed(body: bytes) -> Optional[dict]:
+    """The ``feed`` object of an alt=json response, or None."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    feed = data.get("feed") if isinstance(data, dict) else None
+    return feed if isinstance(feed, dict) else None
+
+
+def _link(obj: dict, rel: str) -> Optional[str]:
+    for link in obj.get("link") or []:
+        if link.get("rel") == rel:
+            return link.get("href")
+    return None
+
+
+def find_entry(feed: dict, page_url: str) -> Optional[dict]:
+    """The entry whose alternate link has the same path as ``page_url``."""
+    path = urlparse(page_url).path
+    for entry in feed.get("entry") or []:
+        href = _link(entry, "alternate")
+        if href and urlparse(href).path == path:
+            return entry
+    return None
+
+
+def next_url(feed: dict) -> Optional[str]:
+    return _link(feed, "next")
+
+
+def entry_html(entry: dict) -> str:
+    # Full feeds carry "content"; summary feeds only "summary"
+    return (entry.get("content") or entry.get("summary") or {}).get("$t", "")
+
+
+class FeedSource:
+    """Post bodies via the JSON feed; one fetch per feed URL per run, thread-safe."""
+
+    def __init__(self, session: requests.Session, cache: Optional[HttpCache] = None, timeout: float = 30) -> None:
+        self.session = session
+        self.cache = cache
+        self.timeout = timeout
+        self.requests = 0
+        self.bytes = 0
+        self._feeds: Dict[str, Optional[dict]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _feed(self, url: str) -> Optional[dict]:
+        with self._lock:
+            lock = self._locks.setdefault(url, threading.Lock())
+        with lock:
+            if url not in self._feeds:
+                self._feeds[url] = self._fetch(url)
+            return self._feeds[url]
+
+    def _fetch(self, url: str) -> Optional[dict]:
+        try:
+            resp = cached_get(self.session, url, self.cache, timeout=self.timeout, headers=FEED_HEADERS)
+        except requests.RequestException as e:
+            print(f"[WARN] feed {url}: {e}")
+            return None
+        self.requests += 1
+        if not getattr(resp, "from_cache", False):
+            self.bytes += len(resp.content)
+        if resp.status_code != 200:
+            print(f"[WARN] feed {url} -> HTTP {resp.status_code}")
+            return None
+        return parse_feed(resp.content)
+
+    def post_html(self, page_url: str) -> Optional[str]:
+        """Body HTML of the post at ``page_url``, or None if the feed doesn't list it."""
+        url: Optional[str] = feed_url(page_url)
+        while url:
+            feed = self._feed(url)
+            if feed is None:
+                return None
+            entry = find_entry(feed, page_url)
+            if entry is not None:
+                return entry_html(entry)
+            url = next_url(feed)
+        return None
+
+
+def serve_fixtures(port: int) -> None:
+    """Serve the recorded feed and page so get.py can run against them offline."""
+    with open(FIXTURE_FEED, "rb") as f:
+        feed_body = f.read()
+    with open(FIXTURE_PAGE, "rb") as f:
+        page_body = f.read()
+    page_path = urlparse(FIXTURE_PAGE_URL).path
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path in (POSTS_FEED, PAGES_FEED):
+                body, ctype = feed_body, "application/json; charset=UTF-8"
+            elif path == page_path:
+                body, ctype = page_body, "text/html; charset=UTF-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving {POSTS_FEED} and {page_path} on http://127.0.0.1:{port} (Ctrl+C to stop)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Blogger JSON feed helpers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Serve the recorded feed and page fixtures locally")
+    serve.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve_fixtures(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pick the Blogger image size variant for a target resolution (--max-size).
+
+get.py's parse_images rewrites every image URL to ``/s0/``, which is the
+original upload at whatever size it was made. Blogger's image server also
+serves scaled variants, chosen by a size token in the URL:
+
+  .../img/b/<id>/s1600/name.jpg      long edge at most 1600 px
+  .../img/b/<id>/w1600-h1200/name.jpg  fit inside 1600x1200
+  .../img/a/<id>=s1600               the same tokens as a "=" suffix
+
+For a target of ``--max-size 1600`` (long edge) or ``--max-size 1600x1200``
+(box), each image is resolved as follows:
+
+- If the original already fits, ``s0`` is kept. The original is fetched
+  unchanged, with no re-encode and no upscaling.
+- Otherwise the box token is used (``s1600`` or ``w1600-h1200``).
+- The original size comes from the ``data-original-width/height``
+  attributes Blogger writes on the <img>. When they are missing, the
+  original is probed with a ranged GET of its first bytes, and only the
+  header is parsed (Pillow). Ranges of 32 KB are requested until the header
+  is complete, up to 256 KB. Probe results are kept in
+  Crawler/size_probes.json, so later runs don't probe again.
+- If the probe fails, the box token is used. The server scales down only.
+
+The chosen token is recorded per image as ``variant``, in get.py's download
+journal and in crawl.py's manifest. A display-grade library can be fetched
+quickly, and a later run without --max-size fetches the originals only for
+the images it actually replaces: their URL differs, so the journal's resume
+check treats them as new.
+
+Usage:
+
+  box = parse_max_size("1600")
+  prober = SizeProber(session, "size_probes.json")
+  variant = apply_max_size(img, box, prober)   # rewrites img["url"]
+  prober.save()
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+
+
+DEFAULT_SIZE_PROBES = os.path.join("Crawler", "size_probes.json")
+ORIGINAL = "s0"
+PROBE_BYTES = 256 * 1024  # JPEG headers (EXIF/ICC included) sit well within this
+PROBE_STEP = 32 * 1024
+
+Size = Tuple[int, int]
+
+# "/s1600/" or "/w640-h426/" path segments, optionally with options ("-c", "-rw", ...)
+_PATH_TOKEN = re.compile(r"/(?:s\d+|w\d+-h\d+)(?:-[a-z0-9-]+)?/")
+# "=s1600" / "=w640-h426-c" suffixes of /img/a/ URLs
+_SUFFIX_TOKEN = re.compile(r"=(?:s\d+|w\d+-h\d+)(?:-[a-z0-9-]+)?$")
+
+
+def parse_max_size(value: str) -> Size:
+    """"1600" -> (1600, 1600) long edge; "1600x1200" -> a width x height box."""
+    m = re.fullmatch(r"\s*(\d+)\s*(?:[xX×]\s*(\d+))?\s*", value or "")
+    if not m or int(m[1]) <= 0 or (m[2] and int(m[2]) <= 0):
+        raise ValueError(f"Invalid size {value!r} (use 1600 or 1600x1200)")
+    width = int(m[1])
+    return (width, int(m[2]) if m[2] else width)
+
+
+def size_token(box: Size) -> str:
+    width, height = box
+    return f"s{width}" if width == height else f"w{width}-h{height}"
+
+
+def has_size_token(url: str) -> bool:
+    return bool(_PATH_TOKEN.search(url) or _SUFFIX_TOKEN.search(url))
+
+
+def with_size_token(url: str, token: str) -> str:
+    """``url`` with its size token replaced; unchanged if it has none."""
+    if _PATH_TOKEN.search(url):
+        # The last segment-shaped token is the size; earlier ones are ids
+        matches = list(_PATH_TOKEN.finditer(url))
+        m = matches[-1]
+        return f"{url[:m.start()]}/{token}/{url[m.end():]}"
+    return _SUFFIX_TOKEN.sub(f"={token}", url)
+
+
+def fits(size: Size, box: Size) -> bool:
+    """True if ``size`` fits ``box``; a square box bounds the long edge."""
+    width, height = size
+    if box[0] == box[1]:
+        return max(width, height) <= box[0]
+    return width <= box[0] and height <= box[1]
+
+
+def size_from_prefix(data: bytes) -> Optional[Size]:
+    """Image dimensions from the first bytes of a file, or None if not reached yet."""
+    from PIL import ImageFile  # Pillow is only needed when probing
+
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except Exception:
+        return None
+    return parser.image.size if parser.image is not None else None
+
+
+class SizeProber:
+    """Original image sizes via ranged GETs, remembered in a JSON file."""
+
+    def __init__(self, session: requests.Session, path: Optional[str] = DEFAULT_SIZE_PROBES, timeout: float = 30) -> None:
+        self.session = session
+        self.path = path
+        self.timeout = timeout
+        self.probed = 0
+        self.sizes: Dict[str, Size] = {}
+        self._lock = threading.Lock()
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.sizes = {url: tuple(size) for url, size in json.load(f).items()}
+            except (OSError, ValueError, TypeError):
+                self.sizes = {}
+
+    def size(self, url: str) -> Optional[Size]:
+        """Size of the image at ``url`` (cached, else probed); None on failure."""
+        with self._lock:
+            if url in self.sizes:
+                return self.sizes[url]
+        size = self._probe(url)
+        if size is not None:
+            with self._lock:
+                self.sizes[url] = size
+                self.probed += 1
+        return size
+
+    def _probe(self, url: str) -> Optional[Size]:
+        data = b""
+        try:
+            # Small ranges first: most headers fit in the first one
+            while len(data) < PROBE_BYTES:
+                headers = {"Range": f"bytes={len(data)}-{len(data) + PROBE_STEP - 1}"}
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+                    if resp.status_code == 200:
+                        # Range ignored: read the full body only until the header is parsed
+                        data = b""
+                        for chunk in resp.iter_content(PROBE_STEP):
+                            data += chunk
+                            size = size_from_prefix(data)
+                            if size is not None or len(data) >= PROBE_BYTES:
+                                return size
+                        return size_from_prefix(data)
+                    if resp.status_code != 206:
+                        return None
+                    chunk = resp.content
+                data += chunk
+                size = size_from_prefix(data)
+                if size is not None or len(chunk) < PROBE_STEP:
+                    return size
+        except requests.RequestException:
+            return None
+        return None
+
+    def save(self) -> None:
+        if not self.path or not self.probed:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with self._lock:
+            data = {url: list(size) for url, size in self.sizes.items()}
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+
+def choose_variant(url: str, box: Size, original: Optional[Size] = None, prober: Optional[SizeProber] = None) -> str:
+    """The size token to fetch ``url`` at for ``box``."""
+    if not has_size_token(url):
+        return ""  # not a Blogger-resizable URL
+    if original is None and prober is not None:
+        original = prober.size(with_size_token(url, ORIGINAL))
+    if original is not None and fits(original, box):
+        return ORIGINAL
+    return size_token(box)
+
+
+def apply_max_size(img: dict, box: Size, prober: Optional[SizeProber] = None) -> str:
+    """Rewrite ``img["url"]`` for ``box``; stores and returns the chosen variant."""
+    original = img.get("original_size")
+    variant = choose_variant(img["url"], box, tuple(original) if original else None, prober)
+    if variant:
+        img["url"] = with_size_token(img["url"], variant)
+    img["variant"] = variant
+    return variant
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Static build step for the gallery front end.
+
+1. Splits the catalog into one JSON chunk per period under data/. Each chunk
+   holds that period's titles/paths, description, its image metadata file
+   from meta/ (image_meta.py) and the matching article.srcset.json entries. Chunks are named by a
+   hash of their content (data/<hash>.json), so they can be served with
+   immutable caching. data/index.json is the small, unhashed entry point that
+   lists the periods in order with their chunk URL and image count.
+2. Writes precompressed .gz and .br siblings for every text asset (pages,
+   scripts, styles, JSON, chunks), so a static host can serve them without
+   compressing on the fly.
+
+The site is served straight from the repository, so data/ (like
+precache-manifest.json from precache.py) is committed together with
+article.json. get.py, crawl.py --update-article and
+jimdo_compare_and_merge.py rebuild the chunks and the precache manifest
+whenever they write article.json; after editing article.json, desc.json or
+meta/ by hand, run
+
+  python Crawler/build_static.py --no-compress
+  python Crawler/precache.py
+
+before committing. script.js falls back to article.json when data/ is
+missing, and the offline mode stays off without the precache manifest.
+
+Both steps are incremental. A chunk whose content did not change keeps its
+name and is not rewritten. Compressed siblings are only rebuilt when they are
+missing or older than their source. Chunks no longer referenced by the index
+are removed.
+
+Brotli output needs the optional ``brotli`` package; without it only .gz
+siblings are written.
+
+Usage examples:
+
+  # Build data/ chunks and compressed siblings in the site root
+  python Crawler/build_static.py
+
+  # Chunks only
+  python Crawler/build_static.py --no-compress
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover (optional)
+    brotli = None
+
+
+DATA_DIR = "data"
+INDEX_NAME = "index.json"
+CHUNK_HASH_LEN = 12
+# Site-root relative globs of text assets that get .gz/.br siblings
+TEXT_ASSETS = (
+    "*.html",
+    "*.css",
+    "*.js",
+    "*.json",
+    "*.svg",
+    "*.xml",
+    "*.txt",
+    "modules/*.js",
+    "modules/*.css",
+    "meta/*.json",
+    f"{DATA_DIR}/*.json",
+)
+# Compressing tiny files only adds requests for no gain
+MIN_COMPRESS_BYTES = 1024
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _dump(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def period_chunks(root: str) -> List[Tuple[str, dict]]:
+    """(period, chunk data) in article.json order."""
+    articles = _load_json(os.path.join(root, "article.json"), {})
+    descriptions = _load_json(os.path.join(root, "desc.json"), {})
+    # image_meta.py's per-period files: {period: "meta/<id>.json"}
+    meta_files = _load_json(os.path.join(root, "meta", "index.json"), {}).get("periods", {})
+    srcset = _load_json(os.path.join(root, "article.srcset.json"), {})
+
+    chunks = []
+    for period, images in articles.items():
+        chunk = {"period": period, "description": descriptions.get(period, ""), "images": images}
+        meta = _load_json(os.path.join(root, meta_files[period]), {}) if period in meta_files else {}
+        m = {p: meta[p] for p in images.values() if p in meta}
+        if m:
+            chunk["meta"] = m
+        s = {p: srcset[p] for p in images.values() if p in srcset}
+        if s:
+            chunk["srcset"] = s
+        chunks.append((period, chunk))
+    return chunks
+
+
+def build_chunks(root: str = ".") -> Dict[str, int]:
+    """Write data/<hash>.json per period and data/index.json.
+
+    Returns counts: {"written": n, "unchanged": n, "removed": n}.
+    """
+    data_dir = os.path.join(root, DATA_DIR)
+    os.makedirs(data_dir, exist_ok=True)
+    stats = {"written": 0, "unchanged": 0, "removed": 0}
+
+    periods = []
+    keep = {INDEX_NAME}
+    for period, chunk in period_chunks(root):
+        body = _dump(chunk)
+        name = f"{hashlib.sha256(body).hexdigest()[:CHUNK_HASH_LEN]}.json"
+        keep.add(name)
+        path = os.path.join(data_dir, name)
+        if os.path.isfile(path):
+            stats["unchanged"] += 1
+        else:
+            _write_atomic(path, body)
+            stats["written"] += 1
+        periods.append({"key": period, "chunk": f"{DATA_DIR}/{name}", "count": len(chunk["images"])})
+
+    index_body = _dump({"version": 1, "periods": periods})
+    index_path = os.path.join(data_dir, INDEX_NAME)
+    try:
+        with open(index_path, "rb") as f:
+            unchanged = f.read() == index_body
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        _write_atomic(index_path, index_body)
+
+    # Drop chunks (and their compressed siblings) that nothing references
+    for path in glob.glob(os.path.join(data_dir, "*.json")):
+        if os.path.basename(path) not in keep:
+            for p in (path, f"{path}.gz", f"{path}.br"):
+                if os.path.isfile(p):
+                    os.remove(p)
+            stats["removed"] += 1
+    return stats
+
+
+def _needs_update(src: str, dst: str) -> bool:
+    try:
+        return os.path.getmtime(dst) < os.path.getmtime(src)
+    except OSError:
+        return True
+
+
+def compress_file(path: str, force: bool = False) -> int:
+    """Write <path>.gz and <path>.br if stale; returns the number written."""
+    written = 0
+    data: Optional[bytes] = None
+    encoders = [(".gz", lambda b: gzip.compress(b, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        encoders.append((".br", lambda b: brotli.compress(b, quality=11)))
+    for ext, encode in encoders:
+        out = path + ext
+        if not force and not _needs_update(path, out):
+            continue
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        packed = encode(data)
+        if len(packed) >= len(data):
+            continue
+        _write_atomic(out, packed)
+        written += 1
+    return written
+
+
+def compress_assets(root: str = ".", force: bool = False) -> int:
+    paths = set()
+    for pattern in TEXT_ASSETS:
+        paths.update(glob.glob(os.path.join(root, pattern)))
+    written = 0
+    for path in sorted(paths):
+        if os.path.getsize(path) >= MIN_COMPRESS_BYTES:
+            written += compress_file(path, force)
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Split the catalog into per-period chunks and precompress text assets")
+    parser.add_argument("--root", default=".", help="Site root (folder with index.html and article.json)")
+    parser.add_argument("--no-compress", action="store_true", help="Skip .gz/.br siblings")
+    parser.add_argument("--force", action="store_true", help="Recompress even if siblings are up to date")
+    args = parser.parse_args()
+
+    stats = build_chunks(args.root)
+    print(
+        f"Chunks: {stats['written']} written, {stats['unchanged']} unchanged, "
+        f"{stats['removed']} removed -> {os.path.join(args.root, DATA_DIR)}/"
+    )
+    if not args.no_compress:
+        if brotli is None:
+            print("[WARN] 'brotli' is not installed; writing .gz siblings only")
+        print(f"Compressed siblings written: {compress_assets(args.root, args.force)}")
+
+
+if __name__ == "__main__":
+    main()
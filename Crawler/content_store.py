@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Optional content-addressed layout for the gallery images.
+
+Every image is stored once as cas/<xx>/<sha256 prefix><ext>. The human paths
+under images/ stay in place as hard links to that object (or copies where the
+filesystem cannot link), and cas/map.json records human path -> hashed path.
+With --rewrite-article, article.json points at the hashed URLs. Those URLs
+never change meaning, so they can be cached as immutable, and a re-crawled
+image that actually changed gets a new URL instead of going stale in clients.
+
+Identical bytes in several periods end up as links to one object. Hashing
+is incremental: an entry is reused while the file's size and mtime match,
+which is the same rule the hash index uses.
+
+Usage examples:
+
+  # Ingest everything in article.json, keep article.json as is
+  python Crawler/content_store.py
+
+  # Ingest and point article.json at cas/ URLs
+  python Crawler/content_store.py --rewrite-article
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Optional
+
+
+CAS_DIR = "cas"
+CAS_MAP = "map.json"
+DIGEST_LEN = 20
+CAS_MAP_VERSION = 1
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def same_content(a: str, b: str) -> bool:
+    """True if both files exist with identical bytes (cheap checks first)."""
+    try:
+        sa, sb = os.stat(a), os.stat(b)
+    except OSError:
+        return False
+    if (sa.st_dev, sa.st_ino) == (sb.st_dev, sb.st_ino):
+        return True
+    return sa.st_size == sb.st_size and file_digest(a) == file_digest(b)
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """Atomically make ``dst`` a hard link to ``src`` (a copy if linking fails)."""
+    parent = os.path.dirname(dst)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{dst}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+def human_path(path: str) -> str:
+    """article.json stores Windows-style paths; map keys use forward slashes."""
+    return path.replace("\\", "/")
+
+
+class ContentStore:
+    """cas/ objects plus the human path -> object mapping in cas/map.json."""
+
+    def __init__(self, root: str = ".", cas_dir: str = CAS_DIR) -> None:
+        self.root = root
+        self.cas_dir = cas_dir
+        self.map_path = os.path.join(root, cas_dir, CAS_MAP)
+        self.files: Dict[str, dict] = {}
+        try:
+            with open(self.map_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get("version") == CAS_MAP_VERSION:
+                self.files = data.get("files") or {}
+        except Exception:
+            self.files = {}
+        self._by_cas = {v["cas"]: k for k, v in self.files.items()}
+
+    def _abs(self, rel: str) -> str:
+        return os.path.join(self.root, rel)
+
+    def object_path(self, digest: str, ext: str) -> str:
+        return f"{self.cas_dir}/{digest[:2]}/{digest[:DIGEST_LEN]}{ext.lower()}"
+
+    def human_for(self, path: str) -> Optional[str]:
+        """Human path for an article.json value that may already be a cas/ URL."""
+        path = human_path(path)
+        return self._by_cas.get(path, path if not path.startswith(f"{self.cas_dir}/") else None)
+
+    def add(self, path: str) -> str:
+        """Store one human path; returns its cas/ path (relative to root)."""
+        path = human_path(path)
+        full = self._abs(path)
+        st = os.stat(full)
+        prev = self.files.get(path)
+        if (
+            prev
+            and prev.get("size") == st.st_size
+            and prev.get("mtime_ns") == st.st_mtime_ns
+            and os.path.isfile(self._abs(prev["cas"]))
+        ):
+            return prev["cas"]
+
+        obj = self.object_path(file_digest(full), os.path.splitext(path)[1] or ".jpg")
+        obj_full = self._abs(obj)
+        if not os.path.isfile(obj_full):
+            link_or_copy(full, obj_full)
+        elif not same_content(full, obj_full):
+            raise ValueError(f"hash collision for {path} and {obj}")
+        else:
+            # Same bytes already stored (e.g. another period): share the object
+            link_or_copy(obj_full, full)
+
+        st = os.stat(full)
+        self.files[path] = {"cas": obj, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        self._by_cas[obj] = path
+        return obj
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.map_path), exist_ok=True)
+        tmp = f"{self.map_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CAS_MAP_VERSION, "files": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.map_path)
+
+
+def ingest_article(article_json: str = "article.json", rewrite: bool = False) -> ContentStore:
+    """Add every image in ``article_json`` to the store next to it.
+
+    With ``rewrite`` the article file is rewritten to reference cas/ paths.
+    Values that already are cas/ paths are kept (their human file is
+    re-checked if the mapping knows it).
+    """
+    root = os.path.dirname(os.path.abspath(article_json))
+    store = ContentStore(root)
+    with open(article_json, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+
+    objects = set()
+    missing = 0
+    for section in articles.values():
+        for title, path in list(section.items()):
+            human = store.human_for(path)
+            if human is None or not os.path.isfile(os.path.join(root, human)):
+                missing += 1
+                continue
+            obj = store.add(human)
+            objects.add(obj)
+            if rewrite:
+                section[title] = obj
+    store.save()
+
+    if rewrite:
+        tmp = f"{article_json}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(articles, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, article_json)
+    print(
+        f"Content store: {len(store.files)} paths -> {len(objects)} objects"
+        + (f", {missing} missing" if missing else "")
+        + (", article.json rewritten" if rewrite else "")
+    )
+    return store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Store images by content hash and map human paths to them")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--rewrite-article", action="store_true", help="Point article.json at the cas/ URLs")
+    args = parser.parse_args()
+    ingest_article(args.article_json, args.rewrite_article)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sync every gallery source in one run, with one engine and one connection pool.
+
+Each source is handled by a site adapter (crawl_core/adapters.py), and all of
+them share one crawl_core.Engine:
+
+- The pages of every source are fetched concurrently, and each source's
+  downloads start as soon as its pages are parsed.
+- Requests go through one session: one connection pool, the cloudscraper
+  fallback, --adaptive rate control and --telemetry.
+- One HTTP cache and one download journal serve every source.
+- One manifest covers all sources (Crawler/crawl_manifest.json).
+
+Built-in sources:
+
+- blogspot: the periods in Crawler/get_urls.json, saved to images/<period>/
+  like get.py. --update-article writes those sections into article.json.
+  With --blogspot-source feed, the post bodies come from the Blogger JSON feed.
+  With --max-size, images come at the Blogger size variant for that target
+  rather than as originals (blogger_size.py). The manifest records each
+  image's variant.
+- jimdo: jimdo_fetch.DEFAULT_URLS, numbered into images/_temp_jimdo with
+  Crawler/jimdo_fetched.json, ready for jimdo_compare_and_merge.py.
+
+--sources reads the list from a JSON file instead:
+
+  [{"name": "blogspot", "adapter": "blogspot", "pages": {"版権・パロディ": "https://..."}},
+   {"name": "jimdo", "adapter": "jimdo", "pages": ["https://.../0001-0500/"],
+    "options": {"temp_dir": "images/_temp_jimdo"}}]
+
+Usage examples (from the repo root):
+
+  # Sync everything
+  python Crawler/crawl.py
+
+  # Only Jimdo, 5 images per page, resume after a crash
+  python Crawler/crawl.py --only jimdo --limit 5 --resume
+
+  # Blogspot too, then rebuild article.json sections and the manifests
+  python Crawler/crawl.py --update-article
+
+  # Display-grade Blogspot library (long edge 1600), originals later
+  python Crawler/crawl.py --only blogspot --max-size 1600
+"""
+
+import argparse
+import json
+import os
+from typing import List, Optional
+
+from crawl_core import DEFAULT_MANIFEST, SCRAPER, Engine, SiteAdapter, adapter_for, write_manifest
+from download_journal import DownloadJournal
+from http_cache import DEFAULT_HTTP_CACHE, HttpCache
+from rate_control import RateController
+from scraper_session import DEFAULT_SCRAPER_COOKIES
+import telemetry
+
+
+DEFAULT_URLS_JSON = os.path.join("Crawler", "get_urls.json")
+DEFAULT_CRAWL_JOURNAL = os.path.join("Crawler", "crawl_journal.jsonl")
+
+
+def default_sources(
+    urls_json: str = DEFAULT_URLS_JSON, blogspot_source: str = "html", max_size: Optional[str] = None
+) -> List[dict]:
+    from jimdo_fetch import DEFAULT_URLS
+
+    with open(urls_json, "r", encoding="utf-8") as f:
+        periods = json.load(f)
+    options = {"source": blogspot_source, "max_size": max_size}
+    return [
+        {"name": "blogspot", "adapter": "blogspot", "pages": periods, "options": options},
+        {"name": "jimdo", "adapter": "jimdo", "pages": DEFAULT_URLS},
+    ]
+
+
+def load_sources(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_adapters(sources: List[dict], only: Optional[List[str]] = None, limit: Optional[int] = None) -> List[SiteAdapter]:
+    adapters = []
+    for src in sources:
+        if only and src["name"] not in only:
+            continue
+        pages = src["pages"]
+        # {group: url}, or a plain URL list where each URL is its own group
+        pairs = list(pages.items()) if isinstance(pages, dict) else [(u, u) for u in pages]
+        cls = adapter_for(src.get("adapter", src["name"]))
+        adapters.append(cls(src["name"], pairs, limit, **src.get("options", {})))
+    return adapters
+
+
+def same_path(stored: Optional[str], path: str) -> bool:
+    """True if ``stored`` names ``path``, whichever separator it was written with."""
+    return stored is not None and stored.replace("\\", "/") == path.replace("\\", "/")
+
+
+def update_article(article_path: str, sections: dict) -> None:
+    """Replace the crawled sections of article.json, keeping every other section."""
+    data = {}
+    if os.path.isfile(article_path):
+        with open(article_path, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                data = {}
+    for name, entries in sections.items():
+        # Paths are written the way get.py writes them (os.path.join); an
+        # existing entry naming the same file keeps its stored string, since
+        # favorites and meta/*.json are keyed by it
+        old = data.get(name) or {}
+        data[name] = {
+            title: old[title] if same_path(old.get(title), path) else path
+            for title, path in entries.items()
+        }
+    tmp = f"{article_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, article_path)
+    print(f"Updated {len(sections)} sections in {article_path}")
+
+    # Keep the gallery's metadata, data/ chunks and precache manifest in step
+    from build_static import build_chunks
+    from image_meta import update_image_meta  # needs Pillow
+    from precache import build_precache_manifest
+
+    update_image_meta(article_path)
+    build_chunks(os.path.dirname(os.path.abspath(article_path)))
+    build_precache_manifest(os.path.dirname(os.path.abspath(article_path)), article_json=os.path.basename(article_path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sync all gallery sources with one shared crawl engine")
+    parser.add_argument("--sources", default=None, help="JSON list of sources (default: get_urls.json + Jimdo)")
+    parser.add_argument("--urls-json", default=DEFAULT_URLS_JSON, help="Blogspot periods for the default sources")
+    parser.add_argument("--blogspot-source", choices=["html", "feed"], default="html",
+                        help="Default sources: read Blogspot post bodies from the JSON feed instead of the pages")
+    parser.add_argument("--max-size", default=None,
+                        help="Default sources: Blogspot target size, 1600 (long edge) or 1600x1200 (default: originals)")
+    parser.add_argument("--only", nargs="*", default=None, help="Source names to sync (default: all)")
+    parser.add_argument("--limit", type=int, default=None, help="Max images per page (test runs)")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent downloads (start value with --adaptive)")
+    parser.add_argument("--page-workers", type=int, default=8, help="Concurrent page fetches")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt concurrency per host (AIMD) and back off on 429/503/403")
+    parser.add_argument("--max-workers", type=int, default=64, help="--adaptive: upper bound for concurrency")
+    parser.add_argument("--host-rate", type=float, default=0.0, help="--adaptive: max requests/s per host (0 = no cap)")
+    parser.add_argument("--timeout", type=int, default=30, help="Per-request timeout seconds")
+    parser.add_argument("--parser", choices=["html.parser", "lxml"], default="html.parser")
+    parser.add_argument("--http-cache", default=DEFAULT_HTTP_CACHE, help="ETag/Last-Modified cache file")
+    parser.add_argument("--no-http-cache", action="store_true", help="Always re-download pages and images")
+    parser.add_argument("--journal", default=DEFAULT_CRAWL_JOURNAL, help="Download journal (JSONL)")
+    parser.add_argument("--no-journal", action="store_true", help="Don't write the download journal")
+    parser.add_argument("--resume", action="store_true", help="Skip images the journal lists as complete")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Manifest of the whole run")
+    parser.add_argument("--update-article", action="store_true", help="Write the Blogspot sections into article.json")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--scraper-cookies", default=DEFAULT_SCRAPER_COOKIES, help="Saved cloudscraper clearance cookies")
+    parser.add_argument("--no-scraper-cookies", action="store_true", help="Don't load or save cloudscraper cookies")
+    parser.add_argument(
+        "--telemetry",
+        nargs="?",
+        const=telemetry.DEFAULT_TELEMETRY,
+        default=None,
+        help=f"Append per-request timings to a JSONL file (default {telemetry.DEFAULT_TELEMETRY})",
+    )
+    args = parser.parse_args()
+
+    if args.telemetry:
+        telemetry.enable(args.telemetry)
+    SCRAPER.cookie_path = None if args.no_scraper_cookies else args.scraper_cookies
+    if args.parser == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            print("[INFO] lxml not installed; using html.parser")
+            args.parser = "html.parser"
+    if args.resume and args.no_journal:
+        print("[INFO] --resume needs the journal; ignoring --no-journal")
+        args.no_journal = False
+
+    sources = load_sources(args.sources) if args.sources else default_sources(args.urls_json, args.blogspot_source, args.max_size)
+    adapters = build_adapters(sources, args.only, args.limit)
+    if not adapters:
+        print("No sources selected.")
+        return
+
+    cache = None if args.no_http_cache else HttpCache(args.http_cache)
+    journal = None if args.no_journal else DownloadJournal(args.journal)
+    controller = RateController(initial=args.workers, maximum=args.max_workers, host_rate=args.host_rate) if args.adaptive else None
+    engine = Engine(
+        workers=args.workers,
+        page_workers=args.page_workers,
+        cache=cache,
+        journal=journal,
+        resume=args.resume,
+        parser=args.parser,
+        timeout=args.timeout,
+        controller=controller,
+    )
+    print(f"Syncing {', '.join(a.name for a in adapters)} ...")
+    try:
+        manifest = engine.sync(adapters)
+    finally:
+        if journal:
+            journal.close()
+        if cache:
+            cache.save()
+        SCRAPER.save()
+    write_manifest(manifest, args.manifest)
+    print(f"Manifest written to {args.manifest}")
+    if controller:
+        controller.print_stats()
+
+    if args.update_article:
+        sections = {}
+        for adapter in adapters:
+            sections.update(adapter.article_sections(engine.items[adapter.name]))
+        if sections:
+            update_article(args.article_json, sections)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared crawler core: one session, one engine and pluggable site adapters.
+
+- session.py: the requests/cloudscraper sessions used by every script.
+- engine.py: ``Engine`` (page and download pools, HTTP cache, journal) and
+  the ``SiteAdapter`` base class.
+- adapters.py: the Blogspot and Jimdo adapters and the ``ADAPTERS`` registry.
+
+crawl.py is the command-line entry point that syncs all sources at once.
+"""
+
+from .adapters import ADAPTERS, BlogspotAdapter, JimdoAdapter, adapter_for
+from .engine import DEFAULT_MANIFEST, CrawlItem, Engine, SiteAdapter, write_manifest
+from .session import SCRAPER, fetch_with_fallback, setup_scraper_session, setup_session
+
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+"""
+Site adapters: the only per-source code a crawl needs.
+
+- ``BlogspotAdapter`` wraps get.py's ``parse_images``. Its pages come from
+  get_urls.json (``{period: url}``), and files land in ``images/<period>/``
+  exactly as get.py saves them. It also provides the article.json sections.
+  With ``source="feed"`` it reads only the post bodies from the Blogger JSON
+  feed (blogger_feed.py), falling back to the page for posts not listed.
+  With ``max_size`` ("1600" or "1600x1200") each image is fetched at the
+  Blogger size variant for that target (blogger_size.py), or as the
+  original when that already fits. Its journal entries are keyed by period,
+  as get.py keys them, so either journal rebuilds article.json.
+- ``JimdoAdapter`` wraps jimdo_fetch.py's ``parse_gallery``. Its images are
+  numbered across all gallery pages into the temp folder (at most
+  ``max_count`` of them). It writes the jimdo_fetched.json manifest that
+  jimdo_compare_and_merge.py reads.
+
+A new gallery source is a subclass of ``SiteAdapter`` with ``parse`` and
+``plan``, registered in ``ADAPTERS``:
+
+  class ExampleAdapter(SiteAdapter):
+      kind = "example"
+
+      def parse(self, soup, group, url):
+          return [{"url": urljoin(url, img["src"])} for img in soup.select(".gallery img")]
+
+      def plan(self, pages):
+          items = []
+          for group, _, entries in pages:
+              for e in entries:
+                  name = os.path.basename(urlparse(e["url"]).path)
+                  items.append(self.item(group, name, e["url"], os.path.join("images", group, name), len(items)))
+          return items
+
+  ADAPTERS["example"] = ExampleAdapter
+
+The site scripts are imported lazily, because they import crawl_core.session
+themselves.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional, Tuple, Type
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from .engine import CrawlItem, Engine, Page, SiteAdapter
+
+
+class BlogspotAdapter(SiteAdapter):
+    """Blogspot period pages (get.py): one ●-titled image per entry."""
+
+    kind = "blogspot"
+
+    def __init__(
+        self,
+        name: str,
+        pages: List[Tuple[str, str]],
+        limit: Optional[int] = None,
+        source: str = "html",
+        max_size: Optional[str] = None,
+        size_probes: Optional[str] = None,
+    ) -> None:
+        super().__init__(name, pages, limit)
+        if source not in ("html", "feed"):
+            raise ValueError(f"Unknown Blogspot source {source!r} (html or feed)")
+        from blogger_size import DEFAULT_SIZE_PROBES, parse_max_size
+
+        self.source = source
+        self.box = parse_max_size(str(max_size)) if max_size else None
+        self.size_probes = size_probes or DEFAULT_SIZE_PROBES
+        self._feed = None
+        self._prober = None
+        self._sizes: Dict[Tuple[str, str], Optional[list]] = {}  # (period, title) -> original size
+        self._lock = threading.Lock()
+
+    def fetch(self, engine: Engine, group: str, url: str) -> List[dict]:
+        if self.source == "feed":
+            from blogger_feed import FeedSource
+
+            with self._lock:
+                if self._feed is None:
+                    # Shared by all periods, so posts of one month cost one request
+                    self._feed = FeedSource(engine.session, engine.cache, engine.timeout)
+            html = self._feed.post_html(url)
+            if html is not None:
+                return self.parse(BeautifulSoup(html, engine.parser), group, url)
+            print(f"[{self.name}] {url} is not in the feed; using the HTML page")
+        return super().fetch(engine, group, url)
+
+    def parse(self, soup: BeautifulSoup, group: str, url: str) -> List[dict]:
+        from get import parse_images
+
+        return parse_images(soup, with_size=self.box is not None)
+
+    def plan(self, pages: List[Page]) -> List[CrawlItem]:
+        from get import clean_filename, image_folder
+
+        items: List[CrawlItem] = []
+        for period, _, entries in pages:
+            seen = set()
+            for seq, img in enumerate(entries):
+                # Same title twice on a page: the first one wins, as in get.py
+                if img["title"] in seen:
+                    continue
+                seen.add(img["title"])
+                path = os.path.join(image_folder(period, img), f"{clean_filename(img['title'])}.jpg")
+                items.append(self.item(period, img["title"], img["url"], path, seq))
+                self._sizes[(period, img["title"])] = img.get("original_size")
+        return items
+
+    def resolve(self, engine: Engine, item: CrawlItem) -> None:
+        if self.box is None:
+            return
+        from blogger_size import SizeProber, apply_max_size
+
+        with self._lock:
+            if self._prober is None:
+                self._prober = SizeProber(engine.session, self.size_probes, engine.timeout)
+        img = {"url": item.url, "original_size": self._sizes.get((item.group, item.title))}
+        item.variant = apply_max_size(img, self.box, self._prober)
+        item.url = img["url"]
+
+    def finish(self, items: List[CrawlItem]) -> None:
+        if self._feed is not None:
+            print(f"[{self.name}] JSON feed: {self._feed.requests} requests, {self._feed.bytes / 1024:.1f} KB")
+        if self._prober is not None:
+            counts: Dict[str, int] = {}
+            for it in items:
+                counts[it.variant or "no size token"] = counts.get(it.variant or "no size token", 0) + 1
+            summary = ", ".join(f"{k} {v}" for k, v in sorted(counts.items()))
+            print(f"[{self.name}] size variants: {summary} ({self._prober.probed} probed)")
+            self._prober.save()
+
+    def journal_key(self, item: CrawlItem) -> Tuple[str, str]:
+        # Same key as get.py: the period is the article.json section
+        return (item.group, item.title)
+
+    def article_sections(self, items: List[CrawlItem]) -> Dict[str, Dict[str, str]]:
+        sections: Dict[str, Dict[str, str]] = {}
+        for period, _ in self.pages:
+            sections[period] = {}
+        for it in items:
+            if it.done:
+                sections.setdefault(it.group, {})[it.title] = it.path
+        return sections
+
+
+class JimdoAdapter(SiteAdapter):
+    """Jimdo gallery pages (jimdo_fetch.py): numbered images in a temp folder."""
+
+    kind = "jimdo"
+
+    def __init__(
+        self,
+        name: str,
+        pages: List[Tuple[str, str]],
+        limit: Optional[int] = None,
+        temp_dir: str = os.path.join("images", "_temp_jimdo"),
+        manifest: Optional[str] = None,
+        max_count: Optional[int] = None,
+    ) -> None:
+        super().__init__(name, pages, limit)
+        self.temp_dir = temp_dir
+        self.manifest = manifest
+        self.max_count = max_count  # images per run, across all pages
+
+    @property
+    def partial(self) -> bool:
+        return self.limit is not None or bool(self.max_count)
+
+    def parse(self, soup: BeautifulSoup, group: str, url: str) -> List[dict]:
+        from jimdo_fetch import parse_gallery
+
+        return [{"url": u} for u in parse_gallery(soup, url)]
+
+    def plan(self, pages: List[Page]) -> List[CrawlItem]:
+        from jimdo_fetch import filename_for_index
+
+        items: List[CrawlItem] = []
+        seen = set()
+        for group, _, entries in pages:
+            for e in entries:
+                if e["url"] in seen:
+                    continue
+                seen.add(e["url"])
+                seq = len(items) + 1  # 1-based across all pages, like jimdo_fetch
+                ext = os.path.splitext(urlparse(e["url"]).path)[1] or ".jpg"
+                path = os.path.join(self.temp_dir, filename_for_index(seq, ext))
+                items.append(self.item(group, f"{seq:04d}", e["url"], path, seq))
+        return items[: self.max_count] if self.max_count else items
+
+    def finish(self, items: List[CrawlItem]) -> None:
+        from jimdo_fetch import FETCH_MANIFEST, write_fetch_manifest
+
+        if not items:
+            # Nothing found (pages down?): keep the last run's manifest
+            print(f"[{self.name}] no images found; manifest left unchanged")
+            return
+        saved = [(it.seq, it.url, os.path.basename(it.path)) for it in items if it.done]
+        write_fetch_manifest([u for _, u in self.pages], self.temp_dir, saved, self.manifest or FETCH_MANIFEST)
+
+
+ADAPTERS: Dict[str, Type[SiteAdapter]] = {
+    BlogspotAdapter.kind: BlogspotAdapter,
+    JimdoAdapter.kind: JimdoAdapter,
+}
+
+
+def adapter_for(kind: str) -> Type[SiteAdapter]:
+    try:
+        return ADAPTERS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown adapter {kind!r} (known: {', '.join(sorted(ADAPTERS))})") from None
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""
+One crawl engine for every gallery source.
+
+A source is described by a ``SiteAdapter``:
+
+- ``parse(soup, group, url)`` turns one fetched page into entries
+  (dicts with at least ``url``). ``fetch(engine, group, url)`` calls it on
+  ``engine.get_soup(url)``; override it to read something other than the
+  page, e.g. a feed.
+- ``plan(pages)`` turns every page's entries into ``CrawlItem``s. Each item
+  gets a destination path and a stable ``seq``.
+- ``resolve(engine, item)`` runs in the download pool just before an item
+  is fetched. It can settle the item's final URL there, e.g. a size
+  variant, and record it in ``item.variant``.
+- ``article_sections(items)`` optionally returns ``{section: {title: path}}``
+  for article.json.
+- ``journal_key(item)`` is the item's (period, title) key in the download
+  journal: ``"<source>/<group>"`` by default. Sources that feed article.json
+  key by the bare section, so download_journal.py can rebuild it from a
+  crawl journal.
+- ``finish(items)`` writes whatever the source's downstream tools expect.
+- ``partial`` is true when a run covers only part of each page (``limit``),
+  so the journal must not forget the titles it skipped.
+
+The engine owns everything that is not site-specific:
+
+- one requests session (one connection pool, cloudscraper fallback,
+  telemetry, optional rate control);
+- the HTTP cache and the download journal;
+- a page pool and a download pool shared by all adapters. With
+  ``async_options`` the downloads run on one asyncio event loop through
+  async_engine.AsyncFetcher instead (``--engine async`` in get.py and
+  jimdo_fetch.py); pages are still fetched with requests, so the
+  cloudscraper fallback keeps working.
+
+get.py, jimdo_fetch.py (except ``--pipeline``) and crawl.py all download
+through ``Engine.download``, so resume, the journal and the HTTP cache are
+handled in one place.
+
+Pages of all sources are fetched concurrently. Each source's downloads start
+as soon as its own pages are planned, so a slow source doesn't hold up the
+others. ``sync`` returns one manifest for the whole run, also written by
+``write_manifest``:
+
+  {"version": 1, "fetched_at": "...",
+   "sources": {"blogspot": {"adapter": "blogspot", "pages": [...], "count": 2,
+                            "items": [{"seq": 0, "group": "...", "title": "...",
+                                       "url": "...", "path": "...", "status": "ok",
+                                       "variant": "s1600"}]}}}
+
+Usage:
+
+  engine = Engine(workers=16, cache=HttpCache(DEFAULT_HTTP_CACHE))
+  manifest = engine.sync([BlogspotAdapter("blogspot", pages), JimdoAdapter("jimdo", urls)])
+  write_manifest(manifest, DEFAULT_MANIFEST)
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from atomic_download import stream_download
+from download_journal import DownloadJournal
+from http_cache import HttpCache, cached_get
+from rate_control import RateController, throttle
+
+from .session import PAGE_ACCEPT, SCRAPER, fetch_with_fallback, setup_session
+
+
+DEFAULT_MANIFEST = os.path.join("Crawler", "crawl_manifest.json")
+MANIFEST_VERSION = 1
+
+# Item status values
+OK = "ok"
+NOT_MODIFIED = "not_modified"
+SKIPPED = "skipped"
+FAILED = "failed"
+DONE_STATUSES = (OK, NOT_MODIFIED, SKIPPED)
+
+# (group, page url, entries parsed from that page)
+Page = Tuple[str, str, List[dict]]
+
+
+@dataclass
+class CrawlItem:
+    source: str
+    group: str
+    title: str
+    url: str
+    path: str
+    seq: int
+    status: str = "pending"
+    variant: str = ""  # size variant fetched, if the source has them
+
+    @property
+    def done(self) -> bool:
+        return self.status in DONE_STATUSES
+
+
+class SiteAdapter:
+    """Base class for a gallery source; subclasses implement ``parse`` and ``plan``."""
+
+    kind = ""
+
+    def __init__(self, name: str, pages: List[Tuple[str, str]], limit: Optional[int] = None) -> None:
+        self.name = name
+        self.pages = pages  # (group, url)
+        self.limit = limit  # max entries per page (test runs)
+
+    def fetch(self, engine: "Engine", group: str, url: str) -> List[dict]:
+        soup = engine.get_soup(url)
+        return self.parse(soup, group, url) if soup else []
+
+    def parse(self, soup: BeautifulSoup, group: str, url: str) -> List[dict]:
+        raise NotImplementedError
+
+    def plan(self, pages: List[Page]) -> List[CrawlItem]:
+        raise NotImplementedError
+
+    def resolve(self, engine: "Engine", item: CrawlItem) -> None:
+        pass
+
+    def article_sections(self, items: List[CrawlItem]) -> Dict[str, Dict[str, str]]:
+        return {}
+
+    def journal_key(self, item: CrawlItem) -> Tuple[str, str]:
+        return (f"{self.name}/{item.group}", item.title)
+
+    def finish(self, items: List[CrawlItem]) -> None:
+        pass
+
+    @property
+    def partial(self) -> bool:
+        return self.limit is not None
+
+    def item(self, group: str, title: str, url: str, path: str, seq: int) -> CrawlItem:
+        return CrawlItem(self.name, group, title, url, path, seq)
+
+
+class Engine:
+    """Shared session, cache, journal and worker pools for all adapters."""
+
+    def __init__(
+        self,
+        workers: int = 16,
+        page_workers: int = 8,
+        cache: Optional[HttpCache] = None,
+        journal: Optional[DownloadJournal] = None,
+        resume: bool = False,
+        parser: str = "html.parser",
+        timeout: float = 30,
+        controller: Optional[RateController] = None,
+        async_options: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.workers = workers
+        self.page_workers = page_workers
+        self.cache = cache
+        self.journal = journal
+        self.resume = resume
+        self.parser = parser
+        self.timeout = timeout
+        self.controller = controller
+        self.async_options = async_options  # AsyncFetcher(per_host=..., max_connections=...)
+        self.items: Dict[str, List[CrawlItem]] = {}  # per adapter, after sync
+        # With a controller the pool is sized to its upper bound and the
+        # controller decides how many threads may talk to a host at once
+        self.download_threads = max(workers, controller.maximum if controller else 1)
+        # One connection pool big enough for every page and download thread
+        self.session = setup_session(pool_size=self.download_threads + page_workers)
+        if controller:
+            self.session = throttle(self.session, controller)
+            # Protected hosts are rate-controlled through the scraper too
+            SCRAPER.controller = controller
+
+    def get_soup(self, url: str) -> Optional[BeautifulSoup]:
+        try:
+            parsed = urlparse(url)
+            headers = {"Referer": f"{parsed.scheme}://{parsed.netloc}/", "Accept": PAGE_ACCEPT}
+            resp = fetch_with_fallback(
+                self.session, url, lambda s: cached_get(s, url, self.cache, timeout=self.timeout, headers=headers)
+            )
+            if resp.status_code == 200:
+                return BeautifulSoup(resp.text, self.parser)
+            print(f"[WARN] {url} -> HTTP {resp.status_code}")
+        except Exception as e:  # pragma: no cover (network)
+            print(f"[ERROR] get {url} failed: {e}")
+        return None
+
+    def _skip(self, item: CrawlItem, journal_key: Tuple[str, str]) -> bool:
+        return bool(self.resume and self.journal and self.journal.completed(*journal_key, item.path, item.url))
+
+    def download(self, item: CrawlItem, journal_key: Optional[Tuple[str, str]] = None) -> str:
+        """Fetch one item to its path; returns its status."""
+        journal_key = journal_key or (f"{item.source}/{item.group}", item.title)
+        if self._skip(item, journal_key):
+            return SKIPPED
+        try:
+            headers = self.cache.conditional_headers(item.url, item.path) if self.cache else {}
+            resp = fetch_with_fallback(
+                self.session,
+                item.url,
+                lambda s: stream_download(s, item.url, item.path, timeout=self.timeout, headers=headers),
+            )
+        except Exception as e:
+            print(f"[WARN] {item.source} #{item.seq} {item.url}: {e}")
+            return FAILED
+        return self._settle(item, journal_key, resp)
+
+    async def download_async(self, fetcher, item: CrawlItem, journal_key: Optional[Tuple[str, str]] = None) -> str:
+        """``download`` through an async_engine.AsyncFetcher."""
+        journal_key = journal_key or (f"{item.source}/{item.group}", item.title)
+        if self._skip(item, journal_key):
+            return SKIPPED
+        try:
+            headers = self.cache.conditional_headers(item.url, item.path) if self.cache else {}
+            resp = await fetcher.download(item.url, item.path, headers=headers)
+        except Exception as e:
+            print(f"[WARN] {item.source} #{item.seq} {item.url}: {e}")
+            return FAILED
+        return self._settle(item, journal_key, resp)
+
+    def _settle(self, item: CrawlItem, journal_key: Tuple[str, str], resp) -> str:
+        """Status of a finished request; stores its validators and journals the file."""
+        if resp.status_code == 304:
+            status = NOT_MODIFIED
+        elif resp.status_code in (200, 206):
+            if self.cache:
+                self.cache.store(item.url, resp, item.path)
+            status = OK
+        else:
+            print(f"[WARN] {item.source} #{item.seq} {item.url} -> HTTP {resp.status_code}")
+            return FAILED
+        if self.journal:
+            self.journal.record(*journal_key, item.path, item.url, item.seq, item.variant, source=item.source)
+        return status
+
+    def _fetch_item(self, adapter: SiteAdapter, item: CrawlItem) -> str:
+        adapter.resolve(self, item)
+        return self.download(item, adapter.journal_key(item))
+
+    async def _fetch_item_async(self, fetcher, adapter: SiteAdapter, item: CrawlItem) -> str:
+        # resolve may probe with requests; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, adapter.resolve, self, item)
+        return await self.download_async(fetcher, item, adapter.journal_key(item))
+
+    @contextlib.contextmanager
+    def _downloads(self) -> Iterator[Callable[[SiteAdapter, CrawlItem], concurrent.futures.Future]]:
+        """Yields ``submit(adapter, item)``, which returns a future of the item's status."""
+        if self.async_options is None:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.download_threads) as pool:
+                yield lambda adapter, item: pool.submit(self._fetch_item, adapter, item)
+            return
+
+        # aiohttp is only needed for async downloads
+        from async_engine import AsyncFetcher
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        fetcher = AsyncFetcher(timeout=self.timeout, headers=dict(self.session.headers), **self.async_options)
+        asyncio.run_coroutine_threadsafe(fetcher.__aenter__(), loop).result()
+        try:
+            yield lambda adapter, item: asyncio.run_coroutine_threadsafe(
+                self._fetch_item_async(fetcher, adapter, item), loop
+            )
+        finally:
+            asyncio.run_coroutine_threadsafe(fetcher.__aexit__(None, None, None), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def _parse_page(self, adapter: SiteAdapter, group: str, url: str) -> List[dict]:
+        entries = adapter.fetch(self, group, url)
+        if adapter.limit is not None:
+            entries = entries[: adapter.limit]
+        print(f"[{adapter.name}] {group}: {len(entries)} images")
+        return entries
+
+    def complete_groups(self, adapter: SiteAdapter, pages: List[Page]) -> Dict[str, List[str]]:
+        """{journal period: titles} for the groups of ``adapter`` crawled completely."""
+        if adapter.partial:
+            return {}
+        fetched = {g for g, _, entries in pages if entries}  # an empty page may just have failed
+        groups: Dict[str, List[str]] = {}
+        failed = set()
+        for it in self.items[adapter.name]:
+            period, title = adapter.journal_key(it)
+            if it.group not in fetched or not it.done:
+                failed.add(period)
+            groups.setdefault(period, []).append(title)
+        return {p: titles for p, titles in groups.items() if p not in failed}
+
+    def sync(self, adapters: List[SiteAdapter]) -> dict:
+        """Crawl every adapter concurrently; returns the run's manifest.
+
+        When every source finished, the journal is compacted: one line per
+        image, without titles that have gone from a completely crawled page.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.page_workers) as page_pool, \
+                self._downloads() as submit, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(len(adapters), 1)) as planners:
+
+            def run(adapter: SiteAdapter) -> Tuple[List[Page], List[CrawlItem]]:
+                futures = [(g, u, page_pool.submit(self._parse_page, adapter, g, u)) for g, u in adapter.pages]
+                pages = [(g, u, f.result()) for g, u, f in futures]
+                items = adapter.plan(pages)
+                downloads = [submit(adapter, it) for it in items]
+                for it, f in zip(items, downloads):
+                    it.status = f.result()
+                adapter.finish(items)
+                return pages, items
+
+            runs = [planners.submit(run, a) for a in adapters]
+            sources = {}
+            current: Dict[str, List[str]] = {}
+            for adapter, fut in zip(adapters, runs):
+                pages, items = fut.result()
+                self.items[adapter.name] = items
+                current.update(self.complete_groups(adapter, pages))
+                ok = sum(it.done for it in items)
+                print(f"[{adapter.name}] {ok}/{len(items)} images done")
+                sources[adapter.name] = {
+                    "adapter": adapter.kind,
+                    "pages": [{"group": g, "url": u, "entries": len(e)} for g, u, e in pages],
+                    "count": len(items),
+                    "items": [{k: v for k, v in asdict(it).items() if k != "source"} for it in items],
+                }
+        if self.journal:
+            dropped = self.journal.compact(current)
+            if dropped:
+                print(f"Journal compacted: {dropped} superseded or stale lines dropped")
+        return {
+            "version": MANIFEST_VERSION,
+            "fetched_at": datetime.utcnow().isoformat() + "Z",
+            "sources": sources,
+        }
+
+
+def write_manifest(manifest: dict, path: str = DEFAULT_MANIFEST) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build responsive derivatives of the gallery images: several widths of every
+image listed in article.json in WebP and AVIF, plus one small JPEG fallback,
+written under derived/ (mirroring the images/ layout) and described in a
+srcset-ready sidecar (article.srcset.json) that script.js uses for the grid
+tiles. The originals stay untouched and are still what the lightbox opens.
+
+Each source is decoded once (JPEG draft mode down to the largest width
+needed) and all of its derivatives are produced from that decode, on a
+process pool. Runs are incremental: a derivative newer than its source is
+left alone.
+
+Usage examples:
+
+  # Build everything referenced by article.json
+  python Crawler/derivatives.py
+
+  # Only WebP at two widths, 4 workers
+  python Crawler/derivatives.py --formats webp --widths 320 640 --workers 4
+
+  # Rebuild even up-to-date derivatives
+  python Crawler/derivatives.py --force
+
+Sidecar format (keys are the article.json paths, as written there; derived
+URLs are percent-encoded so titles with spaces survive srcset parsing):
+
+  {
+    "images\\2008-2011\\居酒屋.jpg": {
+      "width": 1400, "height": 1000,
+      "srcset": {
+        "image/avif": "derived/2008-2011/%E5%B1%85...-320.avif 320w, ...",
+        "image/webp": "derived/2008-2011/%E5%B1%85...-320.webp 320w, ..."
+      },
+      "fallback": "derived/2008-2011/%E5%B1%85...-640.jpg"
+    }
+  }
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from PIL import Image, ImageOps, features
+
+
+DERIVED_DIR = "derived"
+DEFAULT_SIDECAR = "article.srcset.json"
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+FALLBACK_WIDTH = 640
+# format -> (file extension, MIME type, Pillow save options)
+FORMATS = {
+    "avif": (".avif", "image/avif", {"quality": 50, "speed": 8}),
+    "webp": (".webp", "image/webp", {"quality": 80, "method": 4}),
+}
+JPEG_OPTIONS = {"quality": 80, "optimize": True, "progressive": True}
+
+
+def source_path(article_path: str) -> str:
+    """article.json stores Windows-style paths; make them usable here."""
+    return article_path.replace("\\", "/")
+
+
+def derived_path(src: str, width: int, ext: str, out_dir: str = DERIVED_DIR) -> str:
+    """images/<period>/<name>.jpg -> derived/<period>/<name>-<width><ext>"""
+    rel = os.path.relpath(src, "images") if src.startswith("images/") else src
+    stem = os.path.splitext(rel)[0].replace(os.sep, "/")
+    return f"{out_dir}/{stem}-{width}{ext}"
+
+
+def target_widths(width: int, widths: Sequence[int]) -> List[int]:
+    """Requested widths that do not upscale; never empty."""
+    chosen = sorted(w for w in set(widths) if w < width)
+    return chosen or [width]
+
+
+def write_json_atomic(path: str, data) -> None:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def is_fresh(path: str, src_mtime: float) -> bool:
+    try:
+        return os.path.getmtime(path) >= src_mtime
+    except OSError:
+        return False
+
+
+def _save(img: Image.Image, path: str, fmt: str, options: dict) -> None:
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = path + ".tmp"
+    img.save(tmp, format=fmt, **options)
+    os.replace(tmp, path)
+
+
+def build_one(args) -> Tuple[str, Optional[dict], int]:
+    """Make all derivatives for one source.
+
+    Returns (article path, sidecar entry or None if unreadable, files written).
+    """
+    article_path, widths, formats, fallback_width, out_dir, force = args
+    src = source_path(article_path)
+    try:
+        src_mtime = os.path.getmtime(src)
+        with Image.open(src) as im:
+            raw_w, raw_h = width, height = im.size
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):  # rotated 90/270 degrees
+                width, height = height, width
+            sizes = target_widths(width, widths)
+            fallback = min(sizes, key=lambda w: abs(w - fallback_width))
+
+            jobs = []  # (width, path, Pillow format, options)
+            for w in sizes:
+                for name in formats:
+                    ext, _, options = FORMATS[name]
+                    jobs.append((w, derived_path(src, w, ext, out_dir), name.upper(), options))
+            jobs.append((fallback, derived_path(src, fallback, ".jpg", out_dir), "JPEG", JPEG_OPTIONS))
+
+            todo = [j for j in jobs if force or not is_fresh(j[1], src_mtime)]
+            if todo:
+                largest = max(j[0] for j in todo)
+                scale = largest / width
+                im.draft("RGB", (max(1, round(raw_w * scale)), max(1, round(raw_h * scale))))
+                im = ImageOps.exif_transpose(im)
+                im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+                # Largest first so each resize starts from the closest bigger copy
+                current = im
+                for w, path, fmt, options in sorted(todo, key=lambda j: -j[0]):
+                    h = max(1, round(height * w / width))
+                    if current.size != (w, h):
+                        current = current.resize((w, h), Image.LANCZOS)
+                    _save(current.convert("RGB") if fmt == "JPEG" else current, path, fmt, options)
+    except Exception as e:
+        print(f"[WARN] skip {src}: {e}")
+        return article_path, None, 0
+
+    entry = {
+        "width": width,
+        "height": height,
+        "srcset": {
+            FORMATS[name][1]: ", ".join(
+                f"{quote(derived_path(src, w, FORMATS[name][0], out_dir))} {w}w" for w in sizes
+            )
+            for name in formats
+        },
+        "fallback": quote(derived_path(src, fallback, ".jpg", out_dir)),
+    }
+    return article_path, entry, len(todo)
+
+
+def build_derivatives(
+    article_json: str = "article.json",
+    sidecar: str = DEFAULT_SIDECAR,
+    out_dir: str = DERIVED_DIR,
+    widths: Sequence[int] = DERIVATIVE_WIDTHS,
+    formats: Sequence[str] = tuple(FORMATS),
+    fallback_width: int = FALLBACK_WIDTH,
+    workers: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, dict]:
+    """Build derivatives for every image in ``article_json`` and write the sidecar."""
+    with open(article_json, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    paths = list(dict.fromkeys(p for section in articles.values() for p in section.values()))
+
+    jobs = [(p, tuple(widths), tuple(formats), fallback_width, out_dir, force) for p in paths]
+    entries: Dict[str, dict] = {}
+    written = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
+        for path, entry, count in ex.map(build_one, jobs, chunksize=8):
+            if entry is not None:
+                entries[path] = entry
+            written += count
+    write_json_atomic(sidecar, entries)
+    print(f"Derivatives: {len(entries)}/{len(paths)} images, {written} files written -> {out_dir}/, {sidecar}")
+    return entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build WebP/AVIF/JPEG derivatives and a srcset sidecar")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--sidecar", default=DEFAULT_SIDECAR)
+    parser.add_argument("--out-dir", default=DERIVED_DIR)
+    parser.add_argument("--widths", type=int, nargs="+", default=list(DERIVATIVE_WIDTHS))
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--fallback-width", type=int, default=FALLBACK_WIDTH, help="Width of the JPEG fallback")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Rebuild derivatives even if up to date")
+    args = parser.parse_args()
+
+    formats = list(args.formats)
+    if "avif" in formats and not features.check("avif"):
+        print("[WARN] This Pillow build has no AVIF encoder; skipping AVIF")
+        formats.remove("avif")
+
+    build_derivatives(
+        article_json=args.article_json,
+        sidecar=args.sidecar,
+        out_dir=args.out_dir,
+        widths=args.widths,
+        formats=formats,
+        fallback_width=args.fallback_width,
+        workers=args.workers,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
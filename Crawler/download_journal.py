@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Append-only journal of completed downloads for get.py.
+
+Every image that finishes downloading adds one line:
+
+  {"period": "版権・パロディ", "title": "...", "path": "images\\\\版権・パロディ\\\\....jpg",
+   "size": 183412, "url": "https://.../s0/...", "seq": 17, "ts": 1760000000}
+
+crawl.py writes the same lines to Crawler/crawl_journal.jsonl, with the
+crawl source in ``source``. Blogspot entries are keyed by period like
+get.py's; other sources use ``"<source>/<group>"`` and are not article.json
+sections, so a rebuild from a crawl journal leaves them out.
+
+Lines are flushed and fsynced as they are written, so a crash loses at most
+the download in progress. A later line for the same (period, title) replaces
+an earlier one. After a run that completes, ``compact`` rewrites the file
+with one line per key and drops titles that are no longer on their page, so
+the journal stays the size of the gallery instead of growing with every run.
+
+- Resume: ``get.py --resume`` skips any image whose journal entry has the
+  same path and source URL and whose file is still on disk. A restart after
+  a failure only costs the remaining work. The journaled size is advisory:
+  optimize_originals.py rewrites files in place, and downloads are atomic,
+  so a file of another size is still a finished download of that URL.
+- Rebuild: ``get.py --rebuild-article`` (or this module's CLI) recreates
+  article.json from the journal. Periods follow get_urls.json and titles
+  follow their position on the page (``seq``). The mapping of finished
+  periods survives a run that died before writing article.json. Entries
+  whose file is gone are left out and listed, never dropped silently.
+
+Usage examples (from the Crawler folder, like get.py):
+
+  python download_journal.py                 # rebuild article.json
+  python download_journal.py --out rebuilt.json
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_JOURNAL = "download_journal.jsonl"
+
+Key = Tuple[str, str]
+
+
+class DownloadJournal:
+    """Thread-safe append-only log of (period, title, path, size) downloads."""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL) -> None:
+        self.path = path
+        self.entries: Dict[Key, dict] = {}
+        self.missing: List[dict] = []  # entries left out of the last article_data() for a missing file
+        for entry in self._read():
+            self.entries[(entry["period"], entry["title"])] = entry
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _read(self) -> Iterable[dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line from a crash
+                    if isinstance(entry, dict) and "period" in entry and "title" in entry:
+                        yield entry
+        except OSError:
+            return
+
+    def completed(self, period: str, title: str, path: str, url: Optional[str] = None) -> bool:
+        """True if the journal says this image is done from ``url`` and the file is still there."""
+        entry = self.entries.get((period, title))
+        if not entry or entry.get("path") != path:
+            return False
+        if url is not None and entry.get("url") not in (None, url):
+            return False
+        return os.path.isfile(path)
+
+    def record(
+        self,
+        period: str,
+        title: str,
+        path: str,
+        url: str,
+        seq: int,
+        variant: Optional[str] = None,
+        source: Optional[str] = None,
+    ) -> None:
+        entry = {
+            "period": period,
+            "title": title,
+            "path": path,
+            "size": os.path.getsize(path),
+            "url": url,
+            "seq": seq,
+            "ts": int(time.time()),
+        }
+        if variant:
+            entry["variant"] = variant  # size token chosen by --max-size (blogger_size.py)
+        if source:
+            entry["source"] = source  # crawl.py source name
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.entries[(period, title)] = entry
+
+    def compact(self, current: Optional[Dict[str, Iterable[str]]] = None) -> int:
+        """Rewrite the journal with only the last entry per key; returns lines dropped.
+
+        ``current`` maps periods crawled completely in this run to the titles
+        they hold now; entries of those periods for any other title (images
+        removed or renamed on the page) are dropped too. The file is replaced
+        atomically, so a crash leaves either the old or the new journal.
+        """
+        keep_titles = {period: set(titles) for period, titles in (current or {}).items()}
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    lines = sum(1 for _ in f)
+            except OSError:
+                return 0
+            self.entries = {
+                key: entry
+                for key, entry in self.entries.items()
+                if key[0] not in keep_titles or key[1] in keep_titles[key[0]]
+            }
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        return lines - len(self.entries)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def article_data(self, period_order: Optional[List[str]] = None, verify: bool = True) -> dict:
+        """{period: {title: path}} from the journal, in page order.
+
+        With ``verify`` entries whose file is no longer on disk are left out;
+        they are listed in ``self.missing`` and reported.
+        """
+        by_period: Dict[str, List[dict]] = {}
+        self.missing = []
+        for (period, _), entry in self.entries.items():
+            if entry.get("source") and period.startswith(f"{entry['source']}/"):
+                continue  # a crawl.py entry of a source without article.json sections
+            if verify and not os.path.isfile(entry["path"]):
+                self.missing.append(entry)
+                continue
+            by_period.setdefault(period, []).append(entry)
+        if self.missing:
+            print(f"[WARN] {len(self.missing)} journaled files are missing and left out:")
+            for entry in self.missing[:20]:
+                print(f"  {entry['period']} / {entry['title']}: {entry['path']}")
+            if len(self.missing) > 20:
+                print(f"  ... and {len(self.missing) - 20} more")
+        order = [p for p in (period_order or []) if p in by_period]
+        order += [p for p in by_period if p not in order]
+        return {
+            period: {e["title"]: e["path"] for e in sorted(by_period[period], key=lambda e: e.get("seq", 0))}
+            for period in order
+        }
+
+
+def rebuild_article(
+    journal_path: str = DEFAULT_JOURNAL,
+    out: str = "article.json",
+    urls_json: Optional[str] = "get_urls.json",
+) -> dict:
+    """Write ``out`` from the journal; returns the data."""
+    order: List[str] = []
+    if urls_json:
+        try:
+            with open(urls_json, "r", encoding="utf-8") as f:
+                order = list(json.load(f))
+        except (OSError, ValueError):
+            order = []
+    data = DownloadJournal(journal_path).article_data(order)
+    tmp = f"{out}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, out)
+    print(f"Rebuilt {out} from {journal_path}: {len(data)} periods, {sum(len(v) for v in data.values())} images")
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild article.json from get.py's download journal")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL)
+    parser.add_argument("--out", default="article.json")
+    parser.add_argument("--urls", default="get_urls.json", help="Period order (get_urls.json)")
+    args = parser.parse_args()
+    rebuild_article(args.journal, args.out, args.urls)
+
+
+if __name__ == "__main__":
+    main()
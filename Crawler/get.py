@@ -1,20 +1,32 @@
 import json
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
 import os
 import re
 import argparse
-import concurrent.futures
 import time
 from typing import Optional
-import requests.adapters
-from requests.packages.urllib3.util.retry import Retry
 
-def get_soup(url):
+from blogger_feed import FIXTURE_FEED, FIXTURE_PAGE_URL, entry_html, find_entry, parse_feed
+from blogger_size import parse_max_size
+from build_static import build_chunks
+from crawl_core.adapters import BlogspotAdapter
+from crawl_core.engine import Engine
+from crawl_core.session import SCRAPER, setup_session
+from download_journal import DEFAULT_JOURNAL, DownloadJournal, rebuild_article
+from http_cache import HttpCache, cached_get
+from precache import build_precache_manifest
+from rate_control import RateController
+import telemetry
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def get_soup(url, session=None, cache: Optional[HttpCache] = None, parser: str = 'html.parser'):
     try:
-        response = requests.get(url)
+        # 有缓存时带上 If-None-Match/If-Modified-Since，304 时直接使用本地副本
+        response = cached_get(session or requests, url, cache)
         if response.status_code == 200:
-            return BeautifulSoup(response.text, 'html.parser')
+            return BeautifulSoup(response.text, parser)
         else:
             print(f"获取页面失败: {url}, 状态码: {response.status_code}")
     except Exception as e:
@@ -26,98 +38,84 @@ def clean_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', '', filename)
 
 def setup_requests_session() -> requests.Session:
-    """创建一个带有重试机制的requests会话"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,  # 最大重试次数
-        backoff_factor=0.5,  # 重试间隔时间
-        status_forcelist=[500, 502, 503, 504]  # 需要重试的HTTP状态码
-    )
-    adapter = requests.adapters.HTTPAdapter(
-        max_retries=retry_strategy,
-        pool_connections=100,  # 连接池大小
-        pool_maxsize=100
-    )
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
-
-def download_single_image(args) -> Optional[bool]:
-    """下载单个图片的函数"""
-    url, filename, period_folder, session = args
-    try:
-        response = session.get(url, timeout=30)
-        if response.status_code == 200:
-            # 确保文件夹存在
-            os.makedirs(period_folder, exist_ok=True)
-            
-            # 获取完整的文件路径
-            filepath = os.path.join(period_folder, f"{filename}.jpg")
-            
-            # 写入文件
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            print(f"已下载: {filename}")
-            return True
-        else:
-            print(f"下载失败 {filename}: HTTP状态码 {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"下载失败 {filename}: {str(e)}")
-        return False
+    """创建一个带有重试机制的requests会话（与 jimdo_fetch/crawl.py 共用 crawl_core.session）"""
+    # 连接池大小 100；开启 --telemetry 时记录每个请求
+    return setup_session(pool_size=100)
 
-def download_images_parallel(images: list, period_folder: str, max_workers: int = 10) -> dict:
-    """并行下载多个图片"""
-    period_images = {}
-    session = setup_requests_session()
-    
-    # 从 period_folder 中提取 period 名称
-    period = os.path.basename(period_folder)
-    
-    # 准备下载参数
-    download_args = [
-        (img['url'], clean_filename(img['title']), 
-         os.path.join('images', clean_filename(period), clean_filename(img.get('folder', ''))) if img.get('folder') else os.path.join('images', clean_filename(period)),
-         session)
-        for img in images
-    ]
-    
-    # 使用线程池并行下载
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(download_single_image, args) for args in download_args]
-        
-        # 处理下载结果
-        for img, future in zip(images, futures):
-            try:
-                if future.result():
-                    # 记录相对路径
-                    filename = clean_filename(img['title'])
-                    relative_path = os.path.join('images',
-                                               clean_filename(period),
-                                               clean_filename(img.get('folder', '')) if img.get('folder') else '',
-                                               f"{filename}.jpg")
-                    if img['title'] not in period_images:
-                        period_images[img['title']] = relative_path
-            except Exception as e:
-                print(f"处理下载结果时出错: {str(e)}")
-    
-    return period_images
+def image_folder(period: str, img: dict) -> str:
+    """图片的保存文件夹（●20… 分组时多一层子文件夹）"""
+    if img.get('folder'):
+        return os.path.join('images', clean_filename(period), clean_filename(img['folder']))
+    return os.path.join('images', clean_filename(period))
 
-def process_page(url):
-    soup = get_soup(url)
+def process_page(url, cache: Optional[HttpCache] = None, parser: str = 'html.parser', session=None, feed=None,
+                 with_size: bool = False):
+    # --source feed：只取 JSON feed 里的正文片段解析，找不到该文章时再退回整页 HTML
+    if feed is not None:
+        html = feed.post_html(url)
+        if html is not None:
+            return parse_images(BeautifulSoup(html, parser), with_size)
+        print(f"feed 中没有找到文章，改用整页 HTML: {url}")
+    soup = get_soup(url, session=session, cache=cache, parser=parser)
     if not soup:
         return []
+    return parse_images(soup, with_size)
+
+def original_size(img) -> Optional[list]:
+    """Blogger 在 <img> 上写的原图尺寸 data-original-width/height，没有时返回 None"""
+    try:
+        width = int(img.get('data-original-width') or 0)
+        height = int(img.get('data-original-height') or 0)
+    except ValueError:
+        return None
+    return [width, height] if width > 0 and height > 0 else None
+
+def parse_images(soup, with_size: bool = False):
+    """从页面中提取 (标题, 图片URL, 文件夹) 列表
+    
+    with_size 时每项再带上 original_size（原图宽高，供 --max-size 选择尺寸）。
     
+    对每个●标题，取它之前“之后非空文本兄弟节点数”最少的图片（同样少时取离标题最近的）。
+    这个距离只取决于图片元素本身，所以按文档顺序走一遍、随时记住目前最好的图片即可，
+    不必对每个标题都 find_all_previous 再逐个数兄弟节点。
+    """
     current_folder = ""
     images = []
     seen_titles = {}  # 用于记录标题出现次数
     
     # 找到所有包含●的文本元素
-    bullet_texts = soup.find_all(string=lambda text: text and '●' in text)
+    bullet_ids = {id(t) for t in soup.find_all(string=lambda text: text and '●' in text)}
+    
+    distances = {}  # id(a/img 元素) -> 其后非空文本兄弟节点数
+    closest_img = None
+    min_distance = float('inf')
     
-    for text_element in bullet_texts:
+    def count_siblings(parent):
+        # 从后往前累计，一次算出所有子元素的距离
+        count = 0
+        for child in reversed(parent.contents):
+            if isinstance(child, NavigableString):
+                if child.strip():
+                    count += 1
+            elif child.name in ('a', 'img'):
+                distances[id(child)] = count
+    
+    count_siblings(soup)
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            count_siblings(node)
+            # 链接里包含图片时取第一张图片；直接是图片时取本身
+            img = node.find('img') if node.name == 'a' else node if node.name == 'img' else None
+            if img is not None and distances[id(node)] <= min_distance:
+                min_distance = distances[id(node)]
+                closest_img = img
+            continue
+        
+        if id(node) not in bullet_ids:
+            continue
+        
         # 确保●在文本开头
-        title = text_element.strip()
+        title = node.strip()
         if not title.startswith('●'):
             continue
             
@@ -125,31 +123,6 @@ def process_page(url):
         if title.startswith('●20'):
             current_folder = title[1:]
             continue
-            
-        # 修改：查找距离最近的图片元素
-        current = text_element
-        closest_img = None
-        min_distance = float('inf')
-        
-        # 向前查找所有图片元素
-        all_previous = current.find_all_previous(['a', 'img'])
-        for element in all_previous:
-            # 如果是链接且包含图片
-            if element.name == 'a' and element.find('img'):
-                img = element.find('img')
-                # 计算到标题的文本节点数量
-                distance = len(list(filter(lambda x: isinstance(x, str) and x.strip(), 
-                                        element.find_next_siblings(string=True))))
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_img = img
-            # 如果直接是图片
-            elif element.name == 'img':
-                distance = len(list(filter(lambda x: isinstance(x, str) and x.strip(), 
-                                        element.find_next_siblings(string=True))))
-                if distance < min_distance:
-                    min_distance = distance
-                    closest_img = element
         
         if closest_img and closest_img.get('src'):
             # 处理重复标题
@@ -164,60 +137,173 @@ def process_page(url):
                 'url': re.sub(r'/s\d+/', '/s0/', closest_img['src']),
                 'folder': current_folder
             })
+            if with_size:
+                images[-1]['original_size'] = original_size(closest_img)
         else:
             print(f"警告: 未找到标题 '{title}' 对应的图片")
     
     return images
 
+def check_fixture(parser: str) -> bool:
+    """用回归样例页面（整页 HTML 和 JSON feed 两种来源）检查 parse_images 的输出是否与记录的结果一致"""
+    with open(os.path.join(FIXTURE_DIR, 'blogspot_post.expected.json'), 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+    with open(os.path.join(FIXTURE_DIR, 'blogspot_post.html'), 'r', encoding='utf-8') as f:
+        page = f.read()
+    with open(FIXTURE_FEED, 'rb') as f:
+        entry = find_entry(parse_feed(f.read()) or {}, FIXTURE_PAGE_URL)
+    if entry is None:
+        print(f"feed 样例中没有 {FIXTURE_PAGE_URL}")
+        return False
+    ok = True
+    for source, html in (('html', page), ('feed', entry_html(entry))):
+        start = time.time()
+        images = parse_images(BeautifulSoup(html, parser))
+        elapsed = time.time() - start
+        if images == expected:
+            print(f"样例解析一致（{source}, {parser}）：{len(html)} 字符，{len(images)} 张图片，用时 {elapsed:.3f}s")
+            continue
+        ok = False
+        for i, (got, want) in enumerate(zip(images, expected)):
+            if got != want:
+                print(f"第 {i + 1} 项不一致:\n  期望 {want}\n  实际 {got}")
+                break
+        print(f"样例解析不一致（{source}, {parser}）：期望 {len(expected)} 项，实际 {len(images)} 项")
+    return ok
+
 def main():
     # 添加命令行参数
     parser = argparse.ArgumentParser(description='下载博客图片')
     parser.add_argument('--test', type=int, choices=[1, 2], help='试运行模式：1=每个页面只下载5张图片，2=只处理追加分页面且每页限制5张图片')
-    parser.add_argument('--threads', type=int, default=10, help='下载线程数（默认10）')
+    parser.add_argument('--threads', type=int, default=10, help='下载线程数（默认10；--adaptive 时为初始并发数）')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='按主机自适应调整并发（AIMD），遇到 429/503/403 或 Retry-After 时退避')
+    parser.add_argument('--max-threads', type=int, default=64, help='--adaptive 时的并发上限（默认64）')
+    parser.add_argument('--host-rate', type=float, default=0.0, help='--adaptive 时每个主机每秒最多请求数（0=不限）')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help='下载引擎：threads=线程池（默认），async=asyncio/aiohttp')
+    parser.add_argument('--per-host', type=int, default=32, help='异步引擎下每个主机的最大并发请求数')
+    parser.add_argument('--max-connections', type=int, default=256, help='异步引擎的连接池上限')
+    parser.add_argument('--source', choices=['html', 'feed'], default='html',
+                        help='页面来源：html=整页 HTML（默认），feed=只取 Blogger JSON feed 中的文章正文')
+    parser.add_argument('--max-size', default=None,
+                        help='目标尺寸：1600=长边不超过 1600，1600x1200=限定在该范围内；原图更小时仍取原图（默认总是取原图 s0）')
+    parser.add_argument('--size-probes', default='size_probes.json', help='--max-size 时探测到的原图尺寸缓存文件')
+    parser.add_argument('--parser', choices=['html.parser', 'lxml'], default='html.parser',
+                        help='HTML 解析器：html.parser（默认）或更快的 lxml（需安装 lxml）')
+    parser.add_argument('--check-fixture', action='store_true', help='只用 fixtures/ 中的样例页面检查解析结果后退出')
+    parser.add_argument('--cas', action='store_true', help='按内容哈希存入 cas/ 并把 article.json 改写为哈希地址')
+    parser.add_argument('--no-meta', action='store_true', help='不更新 meta/（按时期的图片尺寸/主色/占位图清单）')
+    parser.add_argument('--http-cache', default='http_cache.json', help='条件请求缓存文件（ETag/Last-Modified）')
+    parser.add_argument('--no-http-cache', action='store_true', help='不使用条件请求缓存，全部重新下载')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL, help='下载日志文件（每完成一张图片追加一行）')
+    parser.add_argument('--no-journal', action='store_true', help='不写下载日志')
+    parser.add_argument('--resume', action='store_true', help='跳过日志里已完成且磁盘上文件一致的图片，只做剩下的部分')
+    parser.add_argument('--rebuild-article', action='store_true', help='只根据下载日志重建 article.json 后退出')
+    parser.add_argument('--telemetry', nargs='?', const='requests.jsonl', default=None,
+                        help='把每个请求的耗时/状态追加到 JSONL 文件（默认 requests.jsonl），用 telemetry.py summary 汇总')
     args = parser.parse_args()
+    if args.max_size:
+        try:
+            parse_max_size(args.max_size)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.parser == 'lxml':
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            print("未安装 lxml，改用 html.parser")
+            args.parser = 'html.parser'
+    
+    if args.check_fixture:
+        raise SystemExit(0 if check_fixture(args.parser) else 1)
     
-    # 创建主图片文件夹
-    base_folder = 'images'
-    os.makedirs(base_folder, exist_ok=True)
+    if args.rebuild_article:
+        rebuild_article(args.journal, 'article.json', 'get_urls.json')
+        return
+    
+    if args.telemetry:
+        telemetry.enable(args.telemetry)
+    
+    if args.resume and args.no_journal:
+        print("--resume 需要下载日志，忽略 --no-journal")
+        args.no_journal = False
+    journal = None if args.no_journal else DownloadJournal(args.journal)
+    if args.resume:
+        print(f"续传模式：下载日志中已有 {len(journal.entries)} 条记录")
+    
+    cache = None if args.no_http_cache else HttpCache(args.http_cache)
+    # 遇到 403/反爬验证时改用 cloudscraper 会话，验证 cookie 与 jimdo_fetch/crawl.py 共用
+    SCRAPER.cookie_path = 'scraper_cookies.json'
     
     # 读取URL配置
     with open('get_urls.json', 'r', encoding='utf-8') as f:
         urls = json.load(f)
     
-    # 用于存储图片路径的字典
-    article_data = {}
+    # 在测试模式2下，跳过非blog-post页面
+    pages = [(period, url) for period, url in urls.items()
+             if not (args.test == 2 and 'blog-post_' not in url)]
     
-    # 遍历每个页面
-    for period, url in urls.items():
-        # 在测试模式2下，跳过非blog-post页面
-        if args.test == 2 and 'blog-post_' not in url:
-            continue
-            
-        print(f"\n处理页面: {period}")
-        
-        # 创建页面文件夹
-        period_folder = os.path.join(base_folder, clean_filename(period))
-        os.makedirs(period_folder, exist_ok=True)
-        
-        # 获取该页面的所有图片
-        images = process_page(url)
-        
-        # 在测试模式下限制图片数量
-        if args.test and len(images) > 5:
-            print(f"试运行模式{args.test}：限制下载前5张图片（共找到 {len(images)} 张）")
-            images = images[:5]
-        
-        # 并行下载图片并获取结果
-        period_images = download_images_parallel(images, period_folder, args.threads)
-        
-        # 将该时期的图片信息添加到总数据中
-        if period_images:  # 只有当有图片时才添加
-            article_data[period] = period_images
+    if args.test:
+        print("试运行模式：每个页面只下载前5张图片")
+    
+    # 页面解析、--resume、下载日志、条件请求缓存都由 crawl_core 的 Engine 处理（与 crawl.py 相同）
+    # --adaptive 时线程池按上限开，实际并发由控制器按主机的延迟和错误情况调节
+    controller = RateController(initial=args.threads, maximum=args.max_threads,
+                                host_rate=args.host_rate) if args.adaptive else None
+    engine = Engine(
+        workers=args.threads,
+        page_workers=max(1, min(len(pages), 8)),
+        cache=cache,
+        journal=journal,
+        resume=args.resume,
+        parser=args.parser,
+        timeout=30,
+        controller=controller,
+        # --engine async：图片改由 asyncio/aiohttp 下载（页面仍用 requests）
+        async_options={'per_host': args.per_host, 'max_connections': args.max_connections}
+        if args.engine == 'async' else None,
+    )
+    adapter = BlogspotAdapter('blogspot', pages, 5 if args.test else None,
+                              source=args.source, max_size=args.max_size, size_probes=args.size_probes)
+    try:
+        engine.sync([adapter])
+    finally:
+        if journal:
+            journal.close()
+        SCRAPER.save()
+    if controller:
+        print("自适应并发：")
+        controller.print_stats()
+    
+    # {时期: {标题: 相对路径}}，按 get_urls.json 的顺序；只有当有图片时才添加
+    sections = adapter.article_sections(engine.items[adapter.name])
+    article_data = {period: images for period, images in sections.items() if images}
     
-    # 将图片路径信息写入JSON文件
-    with open('article.json', 'w', encoding='utf-8') as f:
+    # 将图片路径信息写入JSON文件（先写临时文件再替换，中途崩溃不会留下半个文件）
+    with open('article.json.tmp', 'w', encoding='utf-8') as f:
         json.dump(article_data, f, ensure_ascii=False, indent=2)
+    os.replace('article.json.tmp', 'article.json')
     print("\n图片路径信息已保存到 article.json")
+    
+    # 可选：按内容哈希存储图片，并让 article.json 指向 cas/ 下的不可变地址
+    if args.cas:
+        from content_store import ingest_article
+        ingest_article('article.json', rewrite=True)
+    
+    # 更新图片元数据清单（尺寸、字节数、主色、占位图），前端据此直接布局
+    if not args.no_meta:
+        from image_meta import update_image_meta  # 需要 Pillow
+        update_image_meta('article.json')
+    
+    # 重新生成按时期的分块和 ServiceWorker 的预缓存清单（只重新计算有变化的文件）；
+    # 网站直接由仓库提供，这两者和 article.json 一起提交
+    build_chunks('.')
+    build_precache_manifest('.')
+    
+    if cache:
+        cache.save()
 
 if __name__ == "__main__":
     main()
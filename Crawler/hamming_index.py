@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Hamming-distance indexes over 64-bit perceptual hashes.
+
+Used by jimdo_compare_and_merge.py (and friends) instead of scanning every
+existing hash for each fetched image. Results are identical to a brute-force
+scan over the same items in insertion order: among equally distant candidates
+the one inserted first wins, just like the `<` comparison in best_match.
+
+- ``MultiIndex`` (multi-index hashing) is what the merge tools use. The hash
+  is split into ``bands`` bit bands, each with its own exact-value table. Two
+  hashes within distance r agree to within r // bands bits on at least one
+  band (pigeonhole), so a radius query only probes each band's table with
+  its few neighbouring values and checks the handful of candidates found.
+  For the default 4 x 16-bit bands and --threshold 10 that is 4 x 137 dict
+  lookups, whether or not the image has a match. Without a radius it falls
+  back to a linear scan.
+- ``BKTree`` is a metric tree. It only prunes well for small radii: at
+  radius 10 on 64-bit hashes it visits most of the tree and is slower than a
+  scan, especially for hashes with no match.
+
+Example:
+
+  index = MultiIndex.from_dict({"a.jpg": 0x0F, "b.jpg": 0xFF})
+  index.nearest(0x1F, max_dist=4) # -> ("a.jpg", 1)
+  index.nearest(0x1F, max_dist=0) # -> (None, None)
+  index.within(0x1F, 4)           # -> [("a.jpg", 1), ("b.jpg", 3)]
+"""
+
+from itertools import combinations
+from typing import Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+
+K = TypeVar("K", bound=Hashable)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _Node:
+    __slots__ = ("value", "keys", "children")
+
+    def __init__(self, value: int, order: int, key) -> None:
+        self.value = value
+        # (insertion order, key) for every item sharing this exact hash
+        self.keys: List[Tuple[int, object]] = [(order, key)]
+        self.children: Dict[int, "_Node"] = {}
+
+
+class BKTree(Generic[K]):
+    """Metric tree keyed on Hamming distance between integer hashes."""
+
+    def __init__(self, items: Optional[Iterable[Tuple[K, int]]] = None) -> None:
+        self._root: Optional[_Node] = None
+        self._size = 0
+        if items is not None:
+            for key, value in items:
+                self.add(key, value)
+
+    @classmethod
+    def from_dict(cls, index: Dict[K, int]) -> "BKTree[K]":
+        return cls(index.items())
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, key: K, value: int) -> None:
+        order = self._size
+        self._size += 1
+        if self._root is None:
+            self._root = _Node(value, order, key)
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node.value)
+            if d == 0:
+                node.keys.append((order, key))
+                return
+            child = node.children.get(d)
+            if child is None:
+                node.children[d] = _Node(value, order, key)
+                return
+            node = child
+
+    def nearest(
+        self, value: int, max_dist: Optional[int] = None
+    ) -> Tuple[Optional[K], Optional[int]]:
+        """Return (key, distance) of the closest item, or (None, None).
+
+        With ``max_dist`` only items at distance <= max_dist are considered,
+        which lets the search prune far more of the tree.
+        """
+        if self._root is None:
+            return None, None
+        best: Optional[Tuple[int, int, object]] = None  # (dist, order, key)
+        bound = max_dist
+        # (lower bound on any distance in the subtree, node)
+        stack: List[Tuple[int, _Node]] = [(0, self._root)]
+        while stack:
+            lower, node = stack.pop()
+            if bound is not None and lower > bound:
+                continue  # the bound tightened since this subtree was queued
+            d = hamming(value, node.value)
+            if bound is None or d <= bound:
+                cand = (d, node.keys[0][0], node.keys[0][1])
+                if best is None or cand[:2] < best[:2]:
+                    best = cand
+                    bound = d
+            # Children at edge distance k can only hold items within `bound`
+            # if |d - k| <= bound (triangle inequality). Equality is kept so
+            # ties can still be resolved by insertion order. The most promising
+            # child (k closest to d) is pushed last so it is searched first and
+            # tightens the bound early.
+            children = [
+                (abs(d - k), child)
+                for k, child in node.children.items()
+                if bound is None or abs(d - k) <= bound
+            ]
+            children.sort(key=lambda x: -x[0])
+            stack.extend(children)
+        if best is None:
+            return None, None
+        return best[2], best[0]  # type: ignore[return-value]
+
+    def within(self, value: int, radius: int) -> List[Tuple[K, int]]:
+        """Return all (key, distance) with distance <= radius, closest first."""
+        if self._root is None:
+            return []
+        found: List[Tuple[int, int, object]] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node.value)
+            if d <= radius:
+                found.extend((d, order, key) for order, key in node.keys)
+            for k, child in node.children.items():
+                if d - radius <= k <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda x: (x[0], x[1]))
+        return [(key, d) for d, _, key in found]  # type: ignore[misc]
+
+
+class MultiIndex(Generic[K]):
+    """Multi-index hashing: exact-match tables on bit bands of the hash."""
+
+    def __init__(self, items: Optional[Iterable[Tuple[K, int]]] = None, bits: int = 64, bands: int = 4) -> None:
+        self.bits = bits
+        self.bands = bands
+        # Band b covers bits [start, start + width); widths differ by at most one
+        self._spans: List[Tuple[int, int]] = []
+        start = 0
+        for b in range(bands):
+            width = bits // bands + (1 if b < bits % bands else 0)
+            self._spans.append((start, width))
+            start += width
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._keys: List[K] = []
+        self._values: List[int] = []
+        self._masks: Dict[Tuple[int, int], List[int]] = {}
+        if items is not None:
+            for key, value in items:
+                self.add(key, value)
+
+    @classmethod
+    def from_dict(cls, index: Dict[K, int], **kwargs) -> "MultiIndex[K]":
+        return cls(index.items(), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: K, value: int) -> None:
+        order = len(self._keys)
+        self._keys.append(key)
+        self._values.append(value)
+        for table, (start, width) in zip(self._tables, self._spans):
+            table.setdefault((value >> start) & ((1 << width) - 1), []).append(order)
+
+    def _flips(self, width: int, radius: int) -> List[int]:
+        """XOR masks of every value within ``radius`` bits of a ``width``-bit band."""
+        masks = self._masks.get((width, radius))
+        if masks is None:
+            masks = [0]
+            for r in range(1, radius + 1):
+                for bits in combinations(range(width), r):
+                    masks.append(sum(1 << i for i in bits))
+            self._masks[(width, radius)] = masks
+        return masks
+
+    def _probes(self, radius: int) -> int:
+        sub = radius // self.bands
+        return sum(len(self._flips(width, sub)) for _, width in self._spans)
+
+    def within(self, value: int, radius: int) -> List[Tuple[K, int]]:
+        """Return all (key, distance) with distance <= radius, closest first."""
+        if radius < 0 or not self._keys:
+            return []
+        if self._probes(radius) >= len(self._keys):
+            orders: Iterable[int] = range(len(self._keys))  # probing would cost more than a scan
+        else:
+            sub = radius // self.bands
+            found = set()
+            for table, (start, width) in zip(self._tables, self._spans):
+                band = (value >> start) & ((1 << width) - 1)
+                for mask in self._flips(width, sub):
+                    hits = table.get(band ^ mask)
+                    if hits:
+                        found.update(hits)
+            orders = found
+        matches = []
+        for order in orders:
+            d = hamming(value, self._values[order])
+            if d <= radius:
+                matches.append((d, order))
+        matches.sort()
+        return [(self._keys[order], d) for d, order in matches]
+
+    def nearest(
+        self, value: int, max_dist: Optional[int] = None
+    ) -> Tuple[Optional[K], Optional[int]]:
+        """Return (key, distance) of the closest item, or (None, None).
+
+        Only a ``max_dist`` query uses the band tables; without one every item
+        is compared.
+        """
+        if max_dist is not None:
+            found = self.within(value, max_dist)
+            return found[0] if found else (None, None)
+        if not self._values:
+            return None, None
+        # (distance, insertion order): ties go to the first item, as in a dict scan
+        dist, order = min(((value ^ h).bit_count(), i) for i, h in enumerate(self._values))
+        return self._keys[order], dist
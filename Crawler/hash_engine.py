@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Perceptual hashing engine shared by jimdo_compare_and_merge.py and
+library_audit.py.
+
+Images are decoded with Pillow's JPEG draft mode, so a 4000-px photo is
+decoded at 1/8 scale in grayscale instead of at full resolution, and hashing
+runs on a process pool so the Python-level work is spread over all cores.
+Results are kept in a persistent index (see build_existing_hash_index) so
+unchanged files are never decoded twice.
+"""
+
+import concurrent.futures
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+# On-disk hash index (see build_existing_hash_index). Bump the version when the
+# hash functions change so stale entries are recomputed instead of reused.
+HASH_INDEX_VERSION = 4
+DEFAULT_INDEX_CACHE = os.path.join("Crawler", "image_hash_index.json")
+HASH_METHODS = ("dhash", "ahash", "phash")
+
+# JPEGs are decoded at the smallest DCT scale (1/2 .. 1/8) that still keeps
+# both sides >= HASH_DRAFT_SIZE; plenty for the one LANCZOS downsample.
+HASH_DRAFT_SIZE = 128
+# Side of the single LANCZOS downsample every hash is derived from (the pHash
+# DCT input); the 9x8 dHash and 8x8 aHash grids are area averages of it.
+HASH_GRID = 32
+# Rough resident size of one hashing worker (interpreter, Pillow and one
+# draft-decoded image). Used to turn a memory budget into a worker count.
+WORKER_MEMORY_MB = 64
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+
+def is_image_file(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMG_EXTS
+
+
+def list_images(root: str, exclude_dirs: List[str]) -> List[str]:
+    out: List[str] = []
+    excl_norm = [os.path.abspath(d) for d in exclude_dirs]
+    root_abs = os.path.abspath(root)
+    for base, dirs, files in os.walk(root_abs):
+        # Skip excluded dirs
+        ab = os.path.abspath(base)
+        if any(ab.startswith(ed) for ed in excl_norm):
+            continue
+        for fn in files:
+            p = os.path.join(base, fn)
+            if is_image_file(p):
+                out.append(p)
+    return out
+
+
+def img_to_gray(img: Image.Image) -> Image.Image:
+    if img.mode != "L":
+        return img.convert("L")
+    return img
+
+
+def _pack_bits(bits: np.ndarray) -> List[int]:
+    """Pack (..., rows, cols) boolean arrays into ints, first bit most significant."""
+    flat = bits.reshape(-1, bits.shape[-2] * bits.shape[-1])
+    pad = -flat.shape[1] % 8
+    packed = np.packbits(flat, axis=1)
+    return [int.from_bytes(row.tobytes(), "big") >> pad for row in packed]
+
+
+def _dhash_bits(px: np.ndarray) -> np.ndarray:
+    # Row-wise differences: bit set when a pixel is brighter than its right neighbour
+    return px[..., :-1] > px[..., 1:]
+
+
+def _ahash_bits(px: np.ndarray) -> np.ndarray:
+    px = px.astype(np.float64)
+    return px > px.mean(axis=(-2, -1), keepdims=True)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    # Unnormalized DCT-II basis (same convention as scipy.fftpack.dct)
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return 2.0 * np.cos(np.pi * k * (2 * i + 1) / (2 * n))
+
+
+def _phash_bits(px: np.ndarray, hash_size: int) -> np.ndarray:
+    basis = _dct_matrix(px.shape[-1])
+    coeffs = basis @ px.astype(np.float64) @ basis.T
+    low = coeffs[..., :hash_size, :hash_size]
+    med = np.median(low.reshape(*low.shape[:-2], -1), axis=-1)
+    return low > med[..., None, None]
+
+
+def _resized(gray: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    return np.asarray(gray.resize(size, Image.Resampling.LANCZOS), dtype=np.float64)
+
+
+def _area_matrix(n_in: int, n_out: int) -> np.ndarray:
+    """(n_out, n_in) weights that average ``n_in`` samples into ``n_out`` equal bins."""
+    edges = np.linspace(0, n_in, n_out + 1)
+    lo, hi = edges[:-1, None], edges[1:, None]
+    i = np.arange(n_in)[None, :]
+    overlap = np.clip(np.minimum(hi, i + 1) - np.maximum(lo, i), 0, None)
+    return overlap / overlap.sum(axis=1, keepdims=True)
+
+
+def _shrink(px: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Area-average (..., rows, cols) grids down to ``size`` (width, height)."""
+    width, height = size
+    rows = _area_matrix(px.shape[-2], height)
+    cols = _area_matrix(px.shape[-1], width)
+    return rows @ px @ cols.T
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """Compute 64-bit dHash (horizontal)."""
+    px = _resized(img_to_gray(image), (HASH_GRID, HASH_GRID))
+    return _pack_bits(_dhash_bits(_shrink(px, (hash_size + 1, hash_size))))[0]
+
+
+def ahash(image: Image.Image, hash_size: int = 8) -> int:
+    """Compute average hash 64-bit."""
+    px = _resized(img_to_gray(image), (HASH_GRID, HASH_GRID))
+    return _pack_bits(_ahash_bits(_shrink(px, (hash_size, hash_size))))[0]
+
+
+def phash(image: Image.Image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """Compute 64-bit DCT perceptual hash."""
+    size = hash_size * highfreq_factor
+    px = _resized(img_to_gray(image), (size, size))
+    return _pack_bits(_phash_bits(px, hash_size))[0]
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def safe_open_image(path, draft_size: Optional[int] = None) -> Optional[Image.Image]:
+    """Open and fully load an image, or return None if it is unreadable.
+
+    With ``draft_size`` JPEGs are decoded as grayscale at a reduced scale
+    (never smaller than draft_size on either side) instead of at full size.
+    ``path`` may also be a binary file object.
+    """
+    try:
+        with Image.open(path) as im:
+            if draft_size and im.format == "JPEG":
+                im.draft("L", (draft_size, draft_size))
+            im.load()
+            return im.copy()
+    except Exception:
+        return None
+
+
+def hash_batch(sources: List) -> List[Optional[Dict[str, int]]]:
+    """Compute dhash, ahash and pHash for a batch of files in one pass.
+
+    Each image is decoded once (draft mode), converted to grayscale once and
+    downsampled once to HASH_GRID x HASH_GRID; the three hashes are then
+    computed from those grids for the whole batch with vectorized NumPy ops.
+    Unreadable sources yield None.
+    """
+    out: List[Optional[Dict[str, int]]] = [None] * len(sources)
+    ok: List[int] = []
+    grids = []
+    for i, src in enumerate(sources):
+        img = safe_open_image(src, HASH_DRAFT_SIZE)
+        if img is None:
+            continue
+        try:
+            grids.append(_resized(img_to_gray(img), (HASH_GRID, HASH_GRID)))
+            ok.append(i)
+        except Exception:
+            continue
+        finally:
+            img.close()
+    if not ok:
+        return out
+    px = np.stack(grids)
+    packed = {
+        "dhash": _pack_bits(_dhash_bits(_shrink(px, (9, 8)))),
+        "ahash": _pack_bits(_ahash_bits(_shrink(px, (8, 8)))),
+        "phash": _pack_bits(_phash_bits(px, 8)),
+    }
+    for n, i in enumerate(ok):
+        out[i] = {m: packed[m][n] for m in HASH_METHODS}
+    return out
+
+
+def compute_hashes(path) -> Optional[Dict[str, int]]:
+    """Compute every supported hash from a single decode of ``path``."""
+    return hash_batch([path])[0]
+
+
+def check_method(method: str) -> None:
+    if method not in HASH_METHODS:
+        raise ValueError(f"Unknown hash method {method!r} (known: {', '.join(HASH_METHODS)})")
+
+
+def compute_hash(path, method: str = "dhash") -> Optional[int]:
+    check_method(method)
+    hashes = compute_hashes(path)
+    if hashes is None:
+        return None
+    return hashes[method]
+
+
+def index_key(path: str) -> str:
+    """Stable key for the hash index: path relative to cwd, '/' separated."""
+    return os.path.relpath(path).replace("\\", "/")
+
+
+def load_hash_cache(path: str) -> Dict[str, dict]:
+    """Load the persistent hash index, returning {} if missing or outdated."""
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {}
+    if not isinstance(data, dict) or data.get("version") != HASH_INDEX_VERSION:
+        return {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_hash_cache(path: str, entries: Dict[str, dict]) -> None:
+    """Write the hash index atomically so an interrupted run never corrupts it."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"version": HASH_INDEX_VERSION, "entries": entries},
+            f,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+    os.replace(tmp_path, path)
+
+
+def pool_size(workers: Optional[int], memory_budget_mb: Optional[int]) -> int:
+    """Number of hashing processes: all cores by default, capped by budget."""
+    n = workers or os.cpu_count() or 1
+    if memory_budget_mb:
+        n = min(n, max(1, memory_budget_mb // WORKER_MEMORY_MB))
+    return max(1, n)
+
+
+def hash_paths(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    memory_budget_mb: Optional[int] = DEFAULT_MEMORY_BUDGET_MB,
+) -> Dict[str, Optional[Dict[str, int]]]:
+    """Hash many files on a process pool; returns {path: hashes or None}."""
+    paths = list(paths)
+    if not paths:
+        return {}
+    n = min(pool_size(workers, memory_budget_mb), len(paths))
+    # Batches feed the vectorized kernel and amortize IPC; keep several per
+    # worker so stragglers even out.
+    size = max(1, min(64, len(paths) // (n * 4)))
+    batches = [paths[i : i + size] for i in range(0, len(paths), size)]
+    if n == 1:
+        results = map(hash_batch, batches)
+        return dict(zip(paths, (h for batch in results for h in batch)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n) as ex:
+        results = ex.map(hash_batch, batches)
+        return dict(zip(paths, (h for batch in results for h in batch)))
+
+
+def build_hash_index(
+    roots: List[str],
+    exclude_dirs: List[str],
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = None,
+    memory_budget_mb: Optional[int] = DEFAULT_MEMORY_BUDGET_MB,
+) -> Dict[str, Dict[str, int]]:
+    """Hash every image under ``roots``; returns {absolute path: {method: hash}}.
+
+    When ``cache_path`` is given, hashes are persisted there keyed by path with
+    the file's size and mtime. Files whose size and mtime are unchanged reuse
+    the stored hashes, new or modified files are re-hashed (all of
+    HASH_METHODS at once, so switching ``--method`` costs nothing), and
+    entries for files that no longer exist are dropped.
+    """
+    paths: List[str] = []
+    for r in roots:
+        if not os.path.isdir(r):
+            continue
+        paths.extend(list_images(r, exclude_dirs))
+
+    cache = load_hash_cache(cache_path) if cache_path else {}
+    entries: Dict[str, dict] = {}
+    todo: List[Tuple[str, str, os.stat_result]] = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        key = index_key(p)
+        ent = cache.get(key)
+        if (
+            isinstance(ent, dict)
+            and ent.get("size") == st.st_size
+            and ent.get("mtime_ns") == st.st_mtime_ns
+        ):
+            entries[key] = ent
+        else:
+            todo.append((p, key, st))
+
+    if todo:
+        results = hash_paths([p for p, _, _ in todo], workers, memory_budget_mb)
+        for p, key, st in todo:
+            hashes = results[p]
+            ent = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            if hashes is not None:
+                # Unreadable files are recorded without hashes so they are
+                # not re-decoded on every run until they change on disk.
+                ent.update({m: f"{hashes[m]:016x}" for m in HASH_METHODS})
+            entries[key] = ent
+
+    if cache_path:
+        dropped = len(set(cache) - set(entries))
+        print(
+            f"Hash index: {len(entries) - len(todo)} cached, {len(todo)} hashed, {dropped} dropped."
+        )
+        if todo or dropped:
+            save_hash_cache(cache_path, entries)
+
+    index: Dict[str, Dict[str, int]] = {}
+    for key, ent in entries.items():
+        if all(m in ent for m in HASH_METHODS):
+            index[os.path.abspath(key)] = {m: int(ent[m], 16) for m in HASH_METHODS}
+    return index
+
+
+def build_existing_hash_index(
+    roots: List[str],
+    exclude_dirs: List[str],
+    method: str,
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = None,
+    memory_budget_mb: Optional[int] = DEFAULT_MEMORY_BUDGET_MB,
+) -> Dict[str, int]:
+    """Like build_hash_index, but returns {absolute path: hash} for ``method``."""
+    check_method(method)
+    index = build_hash_index(roots, exclude_dirs, workers, cache_path, memory_budget_mb)
+    return {p: hashes[method] for p, hashes in index.items()}
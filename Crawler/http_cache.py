@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Conditional-request cache shared by get.py and jimdo_fetch.py.
+
+For every URL we remember the validators the server sent (ETag and
+Last-Modified) together with the local file holding the body. The next run
+sends If-None-Match / If-Modified-Since; a 304 means the file already on
+disk is still current, so nothing but headers crosses the wire.
+
+Page bodies are kept next to the metadata file (<cache>_pages/); image
+entries simply point at the downloaded file in images/ or the temp folder.
+A file belongs to one URL at a time: storing a URL for a path drops any
+other URL cached for that path (e.g. the s1600 variant of an image once the
+s0 original is written there), so its validators can't vouch for a body
+that came from somewhere else. ``exclusive=False`` turns that off for maps
+of decisions rather than bodies, where several URLs may point at one file
+(jimdo_fetch --pipeline: Jimdo URL -> the library image it matched).
+
+Example:
+
+  cache = HttpCache("Crawler/http_cache.json")
+  resp = cached_get(session, url, cache, timeout=30)
+  ...
+  cache.save()
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+
+
+DEFAULT_HTTP_CACHE = os.path.join("Crawler", "http_cache.json")
+
+
+class HttpCache:
+    """URL -> {etag, last_modified, path} store, safe to share across threads."""
+
+    def __init__(self, path: str, exclusive: bool = True) -> None:
+        self.path = path
+        self.exclusive = exclusive
+        self.pages_dir = os.path.splitext(path)[0] + "_pages"
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self._entries = data
+            except Exception:
+                self._entries = {}
+        # file -> URL whose body it holds
+        self._owners: Dict[str, str] = {}
+        for url, ent in self._entries.items():
+            if ent.get("path"):
+                self._owners[os.path.abspath(ent["path"])] = url
+
+    def _claim(self, url: str, path: str) -> None:
+        """Make ``url`` the only entry for ``path``; caller holds the lock."""
+        if not self.exclusive:
+            return
+        key = os.path.abspath(path)
+        owner = self._owners.get(key)
+        if owner is not None and owner != url:
+            ent = self._entries.get(owner)
+            if ent and ent.get("path") and os.path.abspath(ent["path"]) == key:
+                del self._entries[owner]
+                self._dirty = True
+        self._owners[key] = url
+
+    def entry(self, url: str) -> Optional[dict]:
+        with self._lock:
+            ent = self._entries.get(url)
+            return dict(ent) if ent else None
+
+    def conditional_headers(self, url: str, path: Optional[str] = None) -> Dict[str, str]:
+        """Validator headers for ``url``, or {} if the cached body is gone.
+
+        ``path`` overrides the file the cached body is expected in (it must
+        match the stored path, otherwise a 304 would not tell us anything).
+        """
+        ent = self.entry(url)
+        if not ent:
+            return {}
+        cached = ent.get("path")
+        if not cached or (path and os.path.abspath(path) != os.path.abspath(cached)):
+            return {}
+        if not os.path.isfile(cached):
+            return {}
+        headers: Dict[str, str] = {}
+        if ent.get("etag"):
+            headers["If-None-Match"] = ent["etag"]
+        if ent.get("last_modified"):
+            headers["If-Modified-Since"] = ent["last_modified"]
+        return headers
+
+    def store(self, url: str, response: requests.Response, path: str, **extra) -> None:
+        """Remember the validators of a 200 response whose body is at ``path``."""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        with self._lock:
+            # The file now holds this URL's body, whatever was cached for it before
+            self._claim(url, path)
+            if not etag and not last_modified:
+                # Nothing to revalidate with; forget any stale entry.
+                if self._entries.pop(url, None) is not None:
+                    self._dirty = True
+                return
+            ent = {"etag": etag, "last_modified": last_modified, "path": path}
+            ent.update(extra)
+            self._entries[url] = ent
+            self._dirty = True
+
+    def page_path(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.pages_dir, f"{name}.html")
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+
+def cached_get(
+    session: requests.Session,
+    url: str,
+    cache: Optional[HttpCache] = None,
+    **kwargs,
+) -> requests.Response:
+    """GET a page, revalidating against the cache.
+
+    Returns the response; on a 304 its status is rewritten to 200 and its
+    body replaced by the cached copy, so callers only need to handle 200.
+    Extra keyword arguments (timeout, headers, ...) go to session.get.
+    """
+    headers = dict(kwargs.pop("headers", None) or {})
+    page_path = cache.page_path(url) if cache else None
+    if cache:
+        headers.update(cache.conditional_headers(url, page_path))
+    resp = session.get(url, headers=headers, **kwargs)
+    if cache and page_path:
+        if resp.status_code == 304:
+            ent = cache.entry(url) or {}
+            with open(page_path, "rb") as f:
+                resp._content = f.read()
+            resp.status_code = 200
+            resp.encoding = ent.get("encoding") or resp.encoding
+            resp.from_cache = True  # type: ignore[attr-defined]
+        elif resp.status_code == 200:
+            os.makedirs(cache.pages_dir, exist_ok=True)
+            with open(page_path, "wb") as f:
+                f.write(resp.content)
+            cache.store(url, resp, page_path, encoding=resp.encoding)
+    return resp
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Precomputed per-image metadata for the gallery, so script.js can lay out the
+grid before any image bytes arrive and then stream the images in lazily.
+
+For every path in article.json this records:
+
+  width, height  display size (EXIF rotation applied), read from the header
+  color          dominant colour as #rrggbb (tile background while loading)
+  lqip           ~16px WebP data URI, a blurred low-quality placeholder
+  bytes          file size, so the page can budget downloads (e.g. offline saves)
+
+The metadata is written per period, so a page only fetches the periods it
+shows (build_static.py puts the same entries into its per-period chunks):
+
+  meta/index.json      {"version": 2, "periods": {period: "meta/<id>.json"}}
+  meta/<id>.json       {path: {width, height, color, lqip, bytes}}, one image per line
+
+<id> is a hash of the period name, so a file keeps its name while its period
+changes. Change detection (file size + mtime, the same rule as the hash index)
+uses a local cache, Crawler/image_meta_cache.json. Only the mtimes stay out of
+the site, because they differ between machines; the size does not.
+
+Dimensions come from Image.open, which only parses the header. Colour and
+placeholder use JPEG draft mode, so libjpeg decodes at 1/8 scale from the DCT
+coefficients instead of reconstructing the full-size image.
+
+get.py and jimdo_compare_and_merge.update_article_json refresh the metadata
+after they write article.json; it can also be run on its own.
+
+Usage examples:
+
+  # Refresh meta/ next to article.json
+  python Crawler/image_meta.py
+
+  # Another article file / output folder, ignoring the local cache
+  python Crawler/image_meta.py --article-json article.json --meta-dir meta --no-cache
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import glob
+import hashlib
+import io
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+
+LQIP_SIZE = 16
+LQIP_QUALITY = 40
+# Entries are recomputed when this changes
+META_VERSION = 2
+META_DIR = "meta"
+META_INDEX = "index.json"
+# What the page gets; the cache also keeps mtime_ns
+SITE_FIELDS = ("width", "height", "color", "lqip", "bytes")
+
+
+def default_meta_cache(root: str) -> str:
+    """<root>/Crawler/image_meta_cache.json (or <root>/image_meta_cache.json)."""
+    crawler = os.path.join(root, "Crawler")
+    return os.path.join(crawler if os.path.isdir(crawler) else root, "image_meta_cache.json")
+
+
+def period_file(period: str) -> str:
+    """File name of a period's metadata, stable for the period name."""
+    return f"{hashlib.sha256(period.encode('utf-8')).hexdigest()[:12]}.json"
+
+
+def source_path(article_path: str) -> str:
+    """article.json stores Windows-style paths; make them usable here."""
+    return article_path.replace("\\", "/")
+
+
+def dominant_color(img: Image.Image) -> str:
+    """Most common colour of a small RGB image after quantizing to 4 colours."""
+    q = img.quantize(colors=4)
+    counts = sorted(q.getcolors(), reverse=True)
+    palette = q.getpalette() or []
+    idx = counts[0][1]
+    r, g, b = palette[idx * 3: idx * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def image_meta(path: str) -> Optional[dict]:
+    """Metadata for one file (see module docstring), or None if unreadable."""
+    try:
+        st = os.stat(path)
+        with Image.open(path) as im:
+            # Header only: size and EXIF orientation
+            width, height = im.size
+            if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+            im.draft("RGB", (LQIP_SIZE * 2, LQIP_SIZE * 2))
+            small = ImageOps.exif_transpose(im).convert("RGB")
+        small.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.BILINEAR)
+        buf = io.BytesIO()
+        small.save(buf, format="WEBP", quality=LQIP_QUALITY)
+    except Exception as e:
+        print(f"[WARN] metadata for {path} failed: {e}")
+        return None
+    return {
+        "width": width,
+        "height": height,
+        "bytes": st.st_size,
+        "color": dominant_color(small),
+        "lqip": "data:image/webp;base64," + base64.b64encode(buf.getvalue()).decode("ascii"),
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def _meta_job(item: Tuple[str, str]) -> Tuple[str, Optional[dict]]:
+    key, path = item
+    return key, image_meta(path)
+
+
+def load_cache(cache_path: Optional[str]) -> Dict[str, dict]:
+    if not cache_path:
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return {}
+    if not isinstance(data, dict) or data.get("version") != META_VERSION:
+        return {}
+    entries = data.get("images")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_cache(cache_path: str, entries: Dict[str, dict]) -> None:
+    parent = os.path.dirname(cache_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    tmp = f"{cache_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": META_VERSION, "images": entries}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, cache_path)
+
+
+def _write_if_changed(path: str, body: str) -> None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == body:
+                return
+    except OSError:
+        pass
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def write_period_meta(meta_dir: str, periods: Dict[str, Dict[str, dict]]) -> None:
+    """Write meta/<id>.json per period and meta/index.json; drop stale period files.
+
+    Files are compact (they are fetched by the page) but hold one image per
+    line, so a changed image is a one-line diff.
+    """
+    os.makedirs(meta_dir, exist_ok=True)
+    index = {}
+    keep = {META_INDEX}
+    for period, entries in periods.items():
+        name = period_file(period)
+        keep.add(name)
+        index[period] = f"{os.path.basename(os.path.normpath(meta_dir))}/{name}"
+        lines = [
+            f"{json.dumps(k, ensure_ascii=False)}:{json.dumps(v, ensure_ascii=False, separators=(',', ':'))}"
+            for k, v in entries.items()
+        ]
+        _write_if_changed(os.path.join(meta_dir, name), "{\n" + ",\n".join(lines) + "\n}\n")
+    body = json.dumps({"version": META_VERSION, "periods": index}, ensure_ascii=False, indent=2) + "\n"
+    _write_if_changed(os.path.join(meta_dir, META_INDEX), body)
+    for path in glob.glob(os.path.join(meta_dir, "*.json")):
+        if os.path.basename(path) not in keep:
+            os.remove(path)
+
+
+def load_period_meta(meta_dir: str) -> Dict[str, Dict[str, dict]]:
+    """{period: {path: meta}} as written by write_period_meta ({} if missing)."""
+    try:
+        with open(os.path.join(meta_dir, META_INDEX), "r", encoding="utf-8") as f:
+            index = json.load(f).get("periods", {})
+    except Exception:
+        return {}
+    periods = {}
+    for period in index:
+        try:
+            with open(os.path.join(meta_dir, period_file(period)), "r", encoding="utf-8") as f:
+                periods[period] = json.load(f)
+        except Exception:
+            periods[period] = {}
+    return periods
+
+
+def update_image_meta(
+    article_json: str = "article.json",
+    meta_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = "",
+) -> Dict[str, Dict[str, dict]]:
+    """Refresh the per-period metadata for every image in ``article_json``.
+
+    Paths are resolved relative to the article file's folder, and ``meta_dir``
+    defaults to meta/ there. Unchanged files (same size and mtime in the
+    local cache) keep their entry; removed ones are dropped. ``cache_path``
+    "" means the default location, None disables the cache.
+    """
+    base = os.path.dirname(os.path.abspath(article_json))
+    meta_dir = meta_dir or os.path.join(base, META_DIR)
+    if cache_path == "":
+        cache_path = default_meta_cache(base)
+    with open(article_json, "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    keys = list(dict.fromkeys(p for section in articles.values() for p in section.values()))
+
+    old = load_cache(cache_path)
+    entries: Dict[str, dict] = {}
+    todo = []
+    for key in keys:
+        path = os.path.join(base, source_path(key))
+        prev = old.get(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if prev and prev.get("bytes") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+            entries[key] = prev
+        else:
+            todo.append((key, path))
+
+    cached = len(entries)
+    # A process pool only pays off for bigger batches (e.g. the first run)
+    if len(todo) >= 32:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(_meta_job, todo, chunksize=16))
+    else:
+        results = [_meta_job(item) for item in todo]
+    for key, meta in results:
+        if meta is not None:
+            entries[key] = meta
+
+    # Keep article.json order so the files diff cleanly
+    entries = {k: entries[k] for k in keys if k in entries}
+    if cache_path:
+        save_cache(cache_path, entries)
+    periods = {
+        period: {p: {f: entries[p][f] for f in SITE_FIELDS} for p in images.values() if p in entries}
+        for period, images in articles.items()
+    }
+    write_period_meta(meta_dir, periods)
+    print(f"Image metadata: {cached} cached, {len(todo)} read -> {meta_dir}")
+    return periods
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write width/height/colour/LQIP for every image in article.json, per period")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--meta-dir", default=None, help=f"Output folder (default: {META_DIR}/ next to --article-json)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--cache", default="", help="Local change-detection cache (default: Crawler/image_meta_cache.json)")
+    parser.add_argument("--no-cache", action="store_true", help="Read every image again")
+    args = parser.parse_args()
+    update_image_meta(args.article_json, args.meta_dir, args.workers, None if args.no_cache else args.cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,14 @@ Usage examples:
   # Dry-run to inspect matches without copying
   python Crawler/jimdo_compare_and_merge.py --dry-run
 
-  # Adjust threshold and workers
-  python Crawler/jimdo_compare_and_merge.py --threshold 8 --workers 8
+  # Require a majority of dhash/ahash/phash to agree before calling a match
+  python Crawler/jimdo_compare_and_merge.py --method vote
+
+  # Adjust threshold, hashing processes and their memory budget
+  python Crawler/jimdo_compare_and_merge.py --threshold 8 --workers 8 --memory-budget-mb 512
+
+  # Force a full re-hash of images/ (ignore the persistent hash index)
+  python Crawler/jimdo_compare_and_merge.py --no-index-cache
 
 Optional: update article.json with placeholder titles
 
@@ -27,80 +33,27 @@ Optional: update article.json with placeholder titles
 """
 
 import argparse
-import concurrent.futures
 import json
 import os
 import re
 import shutil
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
-
-from PIL import Image
-
-
-IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
-
-
-def is_image_file(path: str) -> bool:
-    return os.path.splitext(path)[1].lower() in IMG_EXTS
-
-
-def list_images(root: str, exclude_dirs: List[str]) -> List[str]:
-    out: List[str] = []
-    excl_norm = [os.path.abspath(d) for d in exclude_dirs]
-    root_abs = os.path.abspath(root)
-    for base, dirs, files in os.walk(root_abs):
-        # Skip excluded dirs
-        ab = os.path.abspath(base)
-        if any(ab.startswith(ed) for ed in excl_norm):
-            continue
-        for fn in files:
-            p = os.path.join(base, fn)
-            if is_image_file(p):
-                out.append(p)
-    return out
-
-
-def img_to_gray(img: Image.Image) -> Image.Image:
-    if img.mode != "L":
-        return img.convert("L")
-    return img
-
-
-def dhash(image: Image.Image, hash_size: int = 8) -> int:
-    """Compute 64-bit dHash (horizontal)."""
-    # Resize to (hash_size + 1, hash_size) so we can compute differences
-    img = img_to_gray(image).resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
-    pixels = list(img.getdata())
-    # Compute row-wise differences
-    diff_bits = []
-    for row in range(hash_size):
-        row_start = row * (hash_size + 1)
-        for col in range(hash_size):
-            left = pixels[row_start + col]
-            right = pixels[row_start + col + 1]
-            diff_bits.append(1 if left > right else 0)
-    # Pack bits into integer
-    val = 0
-    for b in diff_bits:
-        val = (val << 1) | b
-    return val
-
-
-def ahash(image: Image.Image, hash_size: int = 8) -> int:
-    """Compute average hash 64-bit."""
-    img = img_to_gray(image).resize((hash_size, hash_size), Image.Resampling.LANCZOS)
-    pixels = list(img.getdata())
-    avg = sum(pixels) / len(pixels)
-    bits = [1 if p > avg else 0 for p in pixels]
-    val = 0
-    for b in bits:
-        val = (val << 1) | b
-    return val
-
-
-def hamming(a: int, b: int) -> int:
-    return (a ^ b).bit_count()
+from typing import Dict, List, Optional, Tuple, Union
+
+from content_store import CAS_DIR, same_content
+from hamming_index import BKTree, MultiIndex
+from hash_engine import (
+    DEFAULT_INDEX_CACHE,
+    DEFAULT_MEMORY_BUDGET_MB,
+    HASH_METHODS,
+    IMG_EXTS,
+    build_hash_index,
+    hamming,
+    hash_paths,
+)
+from build_static import build_chunks
+from image_meta import update_image_meta
+from precache import build_precache_manifest
 
 
 @dataclass
@@ -110,50 +63,25 @@ class MatchResult:
     is_new: bool
 
 
-def safe_open_image(path: str) -> Optional[Image.Image]:
-    try:
-        with Image.open(path) as im:
-            return im.copy()
-    except Exception:
-        return None
-
-
-def compute_hash(path: str, method: str = "dhash") -> Optional[int]:
-    img = safe_open_image(path)
-    if img is None:
-        return None
-    try:
-        if method == "ahash":
-            return ahash(img)
-        else:
-            return dhash(img)
-    finally:
-        img.close()
-
-
-def build_existing_hash_index(
-    roots: List[str], exclude_dirs: List[str], method: str, workers: int
-) -> Dict[str, int]:
-    paths: List[str] = []
-    for r in roots:
-        if not os.path.isdir(r):
-            continue
-        paths.extend(list_images(r, exclude_dirs))
-
-    index: Dict[str, int] = {}
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
-        futs = {ex.submit(compute_hash, p, method): p for p in paths}
-        for fut in concurrent.futures.as_completed(futs):
-            p = futs[fut]
-            val = fut.result()
-            if val is not None:
-                index[p] = val
-    return index
-
-
 def best_match(
-    new_hash: int, existing_index: Dict[str, int]
+    new_hash: int,
+    existing_index: Union[Dict[str, int], BKTree, MultiIndex],
+    max_dist: Optional[int] = None,
 ) -> Tuple[Optional[str], Optional[int]]:
+    """Return the closest existing image and its Hamming distance.
+
+    The result is always the nearest image, the same as scanning the dict;
+    callers decide "new" from the distance. ``max_dist`` is the threshold the
+    caller will apply: with a MultiIndex a match within it is found by
+    probing a few buckets, and only hashes with no match that close pay for
+    the full scan that reports their nearest image.
+    """
+    if isinstance(existing_index, (BKTree, MultiIndex)):
+        if max_dist is not None:
+            path, dist = existing_index.nearest(new_hash, max_dist)
+            if path is not None:
+                return path, dist
+        return existing_index.nearest(new_hash)
     best_path: Optional[str] = None
     best_dist: Optional[int] = None
     for p, h in existing_index.items():
@@ -164,6 +92,26 @@ def best_match(
     return best_path, best_dist
 
 
+def vote_match(
+    hashes: Dict[str, int], trees: Dict[str, MultiIndex], threshold: int
+) -> Tuple[Optional[str], Dict[str, int]]:
+    """Match by majority vote across hash methods.
+
+    Each method votes for every existing image within ``threshold``. Returns
+    the image with a majority of votes (ties broken by the smaller summed
+    distance) and its per-method distances, or (None, {}) if none qualifies.
+    """
+    distances: Dict[str, Dict[str, int]] = {}
+    for m, tree in trees.items():
+        for path, d in tree.within(hashes[m], threshold):
+            distances.setdefault(path, {})[m] = d
+    majority = len(trees) // 2 + 1
+    voted = [(p, ds) for p, ds in distances.items() if len(ds) >= majority]
+    if not voted:
+        return None, {}
+    return min(voted, key=lambda x: (-len(x[1]), sum(x[1].values())))
+
+
 def next_seq_index(dest_dir: str) -> int:
     if not os.path.isdir(dest_dir):
         return 1
@@ -184,7 +132,13 @@ def copy_preserve_ext(src: str, dest_dir: str, seq: int) -> str:
         ext = ".jpg"
     out_name = f"{seq:04d}{ext}"
     out_path = os.path.join(dest_dir, out_name)
-    shutil.copy2(src, out_path)
+    if same_content(src, out_path):
+        return out_name
+    # Replace rather than overwrite in place: out_path may be a hard link
+    # into the content store (see content_store.py)
+    tmp_path = f"{out_path}.tmp"
+    shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, out_path)
     return out_name
 
 
@@ -214,10 +168,11 @@ def update_article_json(
                 data = {}
     sect = data.get(article_key, {})
     # Normalize existing entries to ensure they start with images/
+    # (content-addressed cas/ URLs are left alone)
     to_fix = []
     for k, v in list(sect.items()):
         norm = str(v).replace("\\", "/")
-        if not norm.startswith("images/"):
+        if not norm.startswith(("images/", f"{CAS_DIR}/")):
             norm = f"images/{norm}"
         if sect[k] != norm:
             to_fix.append((k, norm))
@@ -232,6 +187,10 @@ def update_article_json(
     data[article_key] = sect
     with open(article_path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    # Keep the gallery's metadata, data/ chunks and precache manifest in step
+    update_image_meta(article_path)
+    build_chunks(os.path.dirname(os.path.abspath(article_path)))
+    build_precache_manifest(os.path.dirname(os.path.abspath(article_path)), article_json=os.path.basename(article_path))
 
 
 def main():
@@ -240,8 +199,25 @@ def main():
     parser.add_argument("--temp-dir", default=os.path.join("images", "_temp_jimdo"))
     parser.add_argument("--dest-dir", default=os.path.join("images", "追加分3"))
     parser.add_argument("--threshold", type=int, default=10, help="Hamming distance threshold (<= is considered same)")
-    parser.add_argument("--method", choices=["dhash", "ahash"], default="dhash")
-    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument(
+        "--method",
+        choices=list(HASH_METHODS) + ["vote"],
+        default="dhash",
+        help="Hash used for matching; 'vote' needs a majority of dhash/ahash/phash to agree",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: all cores)")
+    parser.add_argument(
+        "--memory-budget-mb",
+        type=int,
+        default=DEFAULT_MEMORY_BUDGET_MB,
+        help="Upper bound for hashing memory; caps the number of worker processes",
+    )
+    parser.add_argument(
+        "--index-cache",
+        default=DEFAULT_INDEX_CACHE,
+        help="Persistent hash index for existing images (reused across runs)",
+    )
+    parser.add_argument("--no-index-cache", action="store_true", help="Re-hash all existing images")
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--exclude-dirs", nargs="*", default=[os.path.join("images", "_temp_jimdo")])
     parser.add_argument("--update-article", action="store_true")
@@ -262,8 +238,17 @@ def main():
     # Important: do NOT exclude dest_dir, so reruns remain idempotent.
     exclude_dirs = list(set([os.path.abspath(d) for d in (args.exclude_dirs)]))
     print("Indexing existing images (this may take a moment)...")
-    existing_index = build_existing_hash_index(["images"], exclude_dirs, args.method, args.workers)
+    cache_path = None if args.no_index_cache else args.index_cache
+    existing_index = build_hash_index(
+        ["images"],
+        exclude_dirs,
+        args.workers,
+        cache_path=cache_path,
+        memory_budget_mb=args.memory_budget_mb,
+    )
     print(f"Indexed {len(existing_index)} existing images.")
+    methods = HASH_METHODS if args.method == "vote" else (args.method,)
+    trees = {m: MultiIndex((p, hs[m]) for p, hs in existing_index.items()) for m in methods}
 
     # Compute next sequence for destination
     if not args.dry_run:
@@ -276,6 +261,10 @@ def main():
 
     # Process in Jimdo order
     items_sorted = sorted(items, key=lambda x: x.get("seq", 0))
+    temp_paths = [os.path.join(temp_dir, it.get("filename")) for it in items_sorted]
+    temp_hashes = hash_paths(
+        [p for p in temp_paths if os.path.isfile(p)], args.workers, args.memory_budget_mb
+    )
     for it in items_sorted:
         seq_id = it.get("seq")
         url = it.get("url")
@@ -292,8 +281,8 @@ def main():
             )
             continue
 
-        h = compute_hash(src_path, args.method)
-        if h is None:
+        hashes = temp_hashes.get(src_path)
+        if hashes is None:
             report_items.append(
                 {
                     "seq": seq_id,
@@ -304,8 +293,14 @@ def main():
             )
             continue
 
-        best_path, best_dist = best_match(h, existing_index)
-        is_new = best_dist is None or best_dist > args.threshold
+        distances = None
+        if args.method == "vote":
+            best_path, distances = vote_match(hashes, trees, args.threshold)
+            best_dist = max(distances.values()) if distances else None
+            is_new = best_path is None
+        else:
+            best_path, best_dist = best_match(hashes[args.method], trees[args.method], args.threshold)
+            is_new = best_dist is None or best_dist > args.threshold
 
         out_name = None
         rel_save_path = None
@@ -325,6 +320,7 @@ def main():
                 "temp_filename": filename,
                 "best_match": best_path,
                 "distance": best_dist,
+                "distances": distances,
                 "is_new": is_new,
                 "saved_as": out_name,
             }
@@ -14,15 +14,48 @@ Usage examples:
   # Custom temp directory and worker count
   python Crawler/jimdo_fetch.py --temp-dir images/_temp_jimdo --workers 12
 
+  # Pipelined: hash each download in memory, save only new images directly
+  # into the destination (no temp folder, no separate merge step)
+  python Crawler/jimdo_fetch.py --pipeline --dest-dir "images/追加分3"
+
+  # asyncio/aiohttp downloads, up to 32 in flight per host
+  python Crawler/jimdo_fetch.py --engine async --per-host 32
+
+  # Record every request to Crawler/requests.jsonl, then summarize it
+  python Crawler/jimdo_fetch.py --telemetry
+  python Crawler/telemetry.py summary
+
+  # Let concurrency adapt per host (start at 8, up to 64 threads)
+  python Crawler/jimdo_fetch.py --adaptive --workers 8 --max-workers 64
+
 Notes:
-- This script only downloads into a temp folder and creates a manifest
-  (Crawler/jimdo_fetched.json). No changes to the main images/ content.
+- By default this script only downloads into a temp folder and creates a
+  manifest (Crawler/jimdo_fetched.json). No changes to the main images/ content.
 - The follow-up script (jimdo_compare_and_merge.py) will validate and copy
   only-new images into the final destination in Jimdo order.
+- --pipeline fuses both steps: every response body is hashed as soon as it
+  arrives and checked against the library hash index; only new images are
+  written, in Jimdo order, and the merge report is written directly.
+- Plain fetch mode runs on crawl_core's Engine with its JimdoAdapter, the
+  same code crawl.py uses, so downloads, resume and the HTTP cache behave
+  the same in both. --pipeline has its own loop, because it keeps bodies in
+  memory instead of writing them to the temp folder.
+- --engine async swaps the download thread pool for one event loop
+  (async_engine.py). Gallery pages are still fetched with requests so the
+  cloudscraper fallback keeps working; --pipeline always uses threads.
+- Pages and images that answer 403, or 503 with an anti-bot challenge, are
+  retried through one shared cloudscraper session (scraper_session.py), and
+  that host keeps using it. With --adaptive that session is rate-controlled
+  too. Its clearance cookies are saved to Crawler/scraper_cookies.json and
+  reused on later runs until they expire.
+- --adaptive treats --workers as the starting concurrency and lets
+  rate_control.py raise it towards --max-workers while the host stays healthy,
+  backing off on 429/503/403 and Retry-After.
 """
 
 import argparse
 import concurrent.futures
+import io
 import json
 import os
 import re
@@ -32,18 +65,29 @@ from datetime import datetime
 from typing import List, Optional, Tuple
 
 import requests
-import cloudscraper  # type: ignore
 from bs4 import BeautifulSoup
 
-try:
-    # Keep compatibility with requests vendored urllib3 (as seen in existing crawler)
-    from requests.packages.urllib3.util.retry import Retry  # type: ignore
-except Exception:  # pragma: no cover
-    from urllib3.util.retry import Retry  # type: ignore
-
-import requests.adapters
 from urllib.parse import urljoin, urlparse
 
+from http_cache import DEFAULT_HTTP_CACHE, HttpCache, cached_get
+from rate_control import RateController, throttle
+from scraper_session import DEFAULT_SCRAPER_COOKIES
+from crawl_core.adapters import JimdoAdapter
+from crawl_core.engine import Engine
+from crawl_core.session import PAGE_ACCEPT, SCRAPER, fetch_with_fallback, setup_session
+import telemetry
+
+FETCH_MANIFEST = os.path.join("Crawler", "jimdo_fetched.json")
+# --pipeline: Jimdo URL -> library image it matched, with that response's
+# validators. Kept apart from the HTTP cache: the file's bytes came from
+# another URL, so it must not stand in for this URL's body.
+DEFAULT_MATCH_CACHE = os.path.join("Crawler", "jimdo_matches.json")
+
+# --pipeline options; same values as hash_engine's HASH_METHODS and
+# DEFAULT_INDEX_CACHE, which are not imported here so that plain fetch mode
+# doesn't load NumPy and Pillow
+PIPELINE_METHODS = ("dhash", "ahash", "phash", "vote")
+DEFAULT_INDEX_CACHE = os.path.join("Crawler", "image_hash_index.json")
 
 DEFAULT_URLS = [
     # 0001-0500
@@ -54,52 +98,7 @@ DEFAULT_URLS = [
 
 
 def setup_requests_session() -> requests.Session:
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=0.5,
-        status_forcelist=[500, 502, 503, 504],
-    )
-    adapter = requests.adapters.HTTPAdapter(
-        max_retries=retry_strategy, pool_connections=50, pool_maxsize=50
-    )
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    # Friendly UA
-    session.headers.update(
-        {
-            # Use a common desktop UA
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/124.0.0.0 Safari/537.36"
-            ),
-            "Accept-Language": "ja,en;q=0.9,zh;q=0.8",
-        }
-    )
-    return session
-
-
-def setup_scraper_session() -> requests.Session:
-    """Create a cloudscraper session to bypass some anti-bot protections."""
-    scraper = cloudscraper.create_scraper(
-        browser={
-            'browser': 'chrome',
-            'platform': 'windows',
-            'desktop': True
-        }
-    )
-    scraper.headers.update(
-        {
-            "User-Agent": (
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                "Chrome/124.0.0.0 Safari/537.36"
-            ),
-            "Accept-Language": "ja,en;q=0.9,zh;q=0.8",
-        }
-    )
-    return scraper
+    return setup_session(pool_size=50)
 
 
 def is_image_url(url: str) -> bool:
@@ -167,38 +166,21 @@ def best_img_url(img, base_url: str) -> Optional[str]:
     return None
 
 
-def get_soup(session: requests.Session, url: str) -> Optional[BeautifulSoup]:
+def get_soup(
+    session: requests.Session, url: str, cache: Optional[HttpCache] = None
+) -> Optional[BeautifulSoup]:
     try:
         parsed = urlparse(url)
         origin = f"{parsed.scheme}://{parsed.netloc}/"
-        resp = session.get(
-            url,
-            timeout=30,
-            headers={
-                "Referer": origin,
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-            },
-        )
+        headers = {
+            "Referer": origin,
+            "Accept": PAGE_ACCEPT,
+        }
+        # Falls back to the shared cloudscraper session if forbidden
+        resp = fetch_with_fallback(session, url, lambda s: cached_get(s, url, cache, timeout=30, headers=headers))
         if resp.status_code == 200:
             return BeautifulSoup(resp.text, "html.parser")
         print(f"[WARN] {url} -> HTTP {resp.status_code}")
-        # Retry once with cloudscraper if forbidden
-        if resp.status_code in (403, 503):
-            try:
-                scraper = setup_scraper_session()
-                resp2 = scraper.get(
-                    url,
-                    timeout=30,
-                    headers={
-                        "Referer": origin,
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-                    },
-                )
-                if resp2.status_code == 200:
-                    return BeautifulSoup(resp2.text, "html.parser")
-                print(f"[WARN] cloudscraper {url} -> HTTP {resp2.status_code}")
-            except Exception as e:
-                print(f"[WARN] cloudscraper failed: {e}")
     except Exception as e:  # pragma: no cover (network)
         print(f"[ERROR] get {url} failed: {e}")
     return None
@@ -215,11 +197,17 @@ def filename_for_index(idx: int, ext: str) -> str:
     return f"{idx:04d}{ext}"
 
 
-def collect_image_urls(session: requests.Session, url: str) -> List[str]:
-    soup = get_soup(session, url)
+def collect_image_urls(
+    session: requests.Session, url: str, cache: Optional[HttpCache] = None
+) -> List[str]:
+    soup = get_soup(session, url, cache)
     if not soup:
         return []
+    return parse_gallery(soup, url)
+
 
+def parse_gallery(soup: BeautifulSoup, url: str) -> List[str]:
+    """Full-size image URLs of a gallery page, in page order, without duplicates."""
     # Jimdo pages usually have the content under a main/article container,
     # but we keep it simple and allow all <img> in content area.
     # Try common content containers first, then fall back to all img.
@@ -260,26 +248,187 @@ def collect_image_urls(session: requests.Session, url: str) -> List[str]:
     return urls
 
 
-def download_one(args) -> Optional[Tuple[int, str, str]]:
-    idx, url, temp_dir, session, timeout = args
+def write_fetch_manifest(
+    source_pages: List[str], temp_dir: str, saved: List[Tuple[int, str, str]], path: str = FETCH_MANIFEST
+) -> None:
+    """Write the (seq, url, filename) list that jimdo_compare_and_merge.py reads."""
+    manifest = {
+        "source_pages": source_pages,
+        "fetched_at": datetime.utcnow().isoformat() + "Z",
+        "temp_dir": temp_dir,
+        "count": len(saved),
+        "items": [
+            {"seq": idx, "url": url, "filename": fn} for idx, url, fn in saved
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"Manifest written to {path}")
+
+
+def collect_all_urls(
+    session: requests.Session, pages: List[str], cache: Optional[HttpCache] = None
+) -> List[str]:
+    """Image URLs of all gallery pages in order, each URL once."""
+    all_urls: List[str] = []
+    seen = set()
+    for page in pages:
+        print(f"Collecting from: {page}")
+        urls = collect_image_urls(session, page, cache)
+        print(f"  found {len(urls)} candidates")
+        for u in urls:
+            if u not in seen:
+                seen.add(u)
+                all_urls.append(u)
+    return all_urls
+
+
+def fetch_and_match(args) -> Optional[dict]:
+    """Download one image into memory, hash it and match it against the library.
+
+    The body is only kept in the result when the image is new, so memory
+    stays bounded by the (few) new images waiting for their turn in order.
+    """
+    from hash_engine import compute_hashes
+    from jimdo_compare_and_merge import best_match, vote_match
+
+    idx, url, session, timeout, trees, method, threshold, cache, matches = args
     try:
-        r = session.get(url, timeout=timeout)
+        # A URL saved as new last time has its body in the HTTP cache; one that
+        # matched a library image has that decision in the match map. Either
+        # way a 304 means last time's outcome still holds.
+        known = None
+        headers: dict = {}
+        for store in (cache, matches):
+            headers = store.conditional_headers(url) if store else {}
+            if headers:
+                known = store
+                break
+        r = fetch_with_fallback(session, url, lambda s: s.get(url, timeout=timeout, headers=headers))
+        if r.status_code == 304 and known is not None:
+            ent = known.entry(url) or {}
+            return {
+                "seq": idx,
+                "url": url,
+                "status": "not_modified",
+                "best_match": ent.get("path"),
+                "is_new": False,
+            }
         if r.status_code != 200:
             print(f"[WARN] {idx:04d} HTTP {r.status_code}: {url}")
             return None
-        # Derive extension from URL path
-        path = urlparse(url).path
-        ext = os.path.splitext(path)[1] or ".jpg"
-        filename = filename_for_index(idx, ext)
-        out_path = os.path.join(temp_dir, filename)
-        with open(out_path, "wb") as f:
-            f.write(r.content)
-        return (idx, url, filename)
+        hashes = compute_hashes(io.BytesIO(r.content))
+        if hashes is None:
+            return {"seq": idx, "url": url, "status": "unreadable"}
+        distances = None
+        if method == "vote":
+            best_path, distances = vote_match(hashes, trees, threshold)
+            best_dist = max(distances.values()) if distances else None
+            is_new = best_path is None
+        else:
+            best_path, best_dist = best_match(hashes[method], trees[method], threshold)
+            is_new = best_dist is None or best_dist > threshold
+        if matches and not is_new:
+            matches.store(url, r, best_path)
+        return {
+            "seq": idx,
+            "url": url,
+            "best_match": best_path,
+            "distance": best_dist,
+            "distances": distances,
+            "is_new": is_new,
+            "content": r.content if is_new else None,
+            "response": r if is_new else None,
+        }
     except Exception as e:  # pragma: no cover (network)
         print(f"[ERROR] download {idx:04d} failed: {e} :: {url}")
         return None
 
 
+def pool_size(args) -> int:
+    """Thread pool size: the adaptive controller gates the extra threads."""
+    return args.max_workers if args.adaptive else args.workers
+
+
+def run_pipeline(
+    args,
+    session: requests.Session,
+    all_urls: List[str],
+    http_cache: Optional[HttpCache] = None,
+    matches: Optional[HttpCache] = None,
+) -> None:
+    """Fetch, hash and dedupe in one pass; write only new images, in order."""
+    from hamming_index import MultiIndex
+    from hash_engine import HASH_METHODS, build_hash_index
+    from jimdo_compare_and_merge import next_seq_index, save_json, update_article_json
+
+    exclude_dirs = [os.path.abspath(d) for d in args.exclude_dirs]
+    cache_path = None if args.no_index_cache else args.index_cache
+    print("Indexing existing images...")
+    index = build_hash_index(["images"], exclude_dirs, cache_path=cache_path)
+    print(f"Indexed {len(index)} existing images.")
+    methods = HASH_METHODS if args.method == "vote" else (args.method,)
+    trees = {m: MultiIndex((p, hs[m]) for p, hs in index.items()) for m in methods}
+
+    if not args.dry_run:
+        ensure_dir(args.dest_dir)
+    seq = next_seq_index(args.dest_dir)
+
+    jobs = [
+        (i + 1, url, session, args.timeout, trees, args.method, args.threshold, http_cache, matches)
+        for i, url in enumerate(all_urls)
+    ]
+    # Results arrive out of order; hold them until every earlier item is done
+    # so new images are numbered and written in Jimdo order.
+    pending: dict = {}
+    next_idx = 1
+    report_items: List[dict] = []
+    new_items: List[Tuple[str, str]] = []  # (title, relative_path)
+    print(f"Fetching and matching {len(all_urls)} images ...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size(args)) as ex:
+        futs = {ex.submit(fetch_and_match, j): j[0] for j in jobs}
+        for fut in concurrent.futures.as_completed(futs):
+            idx = futs[fut]
+            pending[idx] = fut.result() or {"seq": idx, "url": all_urls[idx - 1], "status": "failed"}
+            while next_idx in pending:
+                item = pending.pop(next_idx)
+                next_idx += 1
+                content = item.pop("content", None)
+                response = item.pop("response", None)
+                item["saved_as"] = None
+                if content is not None and not args.dry_run:
+                    ext = os.path.splitext(urlparse(item["url"]).path)[1] or ".jpg"
+                    out_name = filename_for_index(seq, ext)
+                    out_path = os.path.join(args.dest_dir, out_name)
+                    with open(out_path, "wb") as f:
+                        f.write(content)
+                    if http_cache and response is not None:
+                        http_cache.store(item["url"], response, out_path)
+                    rel = os.path.join(os.path.basename(args.dest_dir), out_name).replace("\\", "/")
+                    new_items.append((f"{args.title_prefix} {seq:04d}", rel))
+                    item["saved_as"] = out_name
+                    print(f"  new {item['seq']:04d}: {out_name}")
+                    seq += 1
+                report_items.append(item)
+
+    new_count = sum(1 for it in report_items if it.get("is_new"))
+    print(f"Done. New-only images: {new_count}/{len(all_urls)}")
+    report = {
+        "threshold": args.threshold,
+        "method": args.method,
+        "dest_dir": args.dest_dir,
+        "new_only_count": new_count,
+        "items": report_items,
+    }
+    report_path = os.path.join("Crawler", "jimdo_new_report.json")
+    save_json(report_path, report)
+    print(f"Report written to {report_path}")
+
+    if args.update_article and not args.dry_run and new_items:
+        update_article_json(args.article_json, args.article_key, args.title_prefix, new_items)
+        print(f"Updated {args.article_json} section '{args.article_key}' with {len(new_items)} items.")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch images from Jimdo galleries into a temp folder")
     parser.add_argument(
@@ -293,69 +442,105 @@ def main():
         default=os.path.join("images", "_temp_jimdo"),
         help="Temporary output directory for fetched images",
     )
-    parser.add_argument("--workers", type=int, default=8, help="Max concurrent downloads")
+    parser.add_argument("--workers", type=int, default=8, help="Max concurrent downloads (start value with --adaptive)")
+    parser.add_argument("--adaptive", action="store_true", help="Adapt concurrency per host (AIMD) and back off on 429/503/403")
+    parser.add_argument("--max-workers", type=int, default=64, help="--adaptive: upper bound for concurrency")
+    parser.add_argument("--host-rate", type=float, default=0.0, help="--adaptive: max requests/s per host (0 = no cap)")
     parser.add_argument("--timeout", type=int, default=30, help="Per-request timeout seconds")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads", help="Download engine")
+    parser.add_argument("--per-host", type=int, default=32, help="--engine async: max requests in flight per host")
+    parser.add_argument("--max-connections", type=int, default=256, help="--engine async: connection pool size")
     parser.add_argument("--max-count", type=int, default=0, help="Limit number of images per run (0=no limit)")
+    parser.add_argument("--http-cache", default=DEFAULT_HTTP_CACHE, help="ETag/Last-Modified cache file")
+    parser.add_argument("--no-http-cache", action="store_true", help="Always re-download pages and images")
+    parser.add_argument("--match-cache", default=DEFAULT_MATCH_CACHE,
+                        help="--pipeline: remembered matches of Jimdo URLs to library images")
+    parser.add_argument("--pipeline", action="store_true", help="Hash in memory and save only new images to --dest-dir")
+    parser.add_argument("--dest-dir", default=os.path.join("images", "追加分3"))
+    parser.add_argument("--threshold", type=int, default=10, help="Hamming distance threshold (<= is considered same)")
+    parser.add_argument("--method", choices=PIPELINE_METHODS, default="dhash")
+    parser.add_argument("--index-cache", default=DEFAULT_INDEX_CACHE)
+    parser.add_argument("--no-index-cache", action="store_true")
+    parser.add_argument("--exclude-dirs", nargs="*", default=[os.path.join("images", "_temp_jimdo")])
+    parser.add_argument("--dry-run", action="store_true", help="With --pipeline: report only, write nothing")
+    parser.add_argument("--update-article", action="store_true")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--article-key", default="追加分3")
+    parser.add_argument("--title-prefix", default="Jimdo")
+    parser.add_argument("--scraper-cookies", default=DEFAULT_SCRAPER_COOKIES, help="Saved cloudscraper clearance cookies")
+    parser.add_argument("--no-scraper-cookies", action="store_true", help="Don't load or save cloudscraper cookies")
+    parser.add_argument(
+        "--telemetry",
+        nargs="?",
+        const=telemetry.DEFAULT_TELEMETRY,
+        default=None,
+        help=f"Append per-request timings to a JSONL file (default {telemetry.DEFAULT_TELEMETRY})",
+    )
     args = parser.parse_args()
 
-    session = setup_requests_session()
-
-    # 1) Collect URLs in order across pages
-    all_urls: List[str] = []
-    seen = set()
-    for page in args.urls:
-        print(f"Collecting from: {page}")
-        urls = collect_image_urls(session, page)
-        print(f"  found {len(urls)} candidates")
-        for u in urls:
-            if u not in seen:
-                seen.add(u)
-                all_urls.append(u)
-
-    if args.max_count and args.max_count > 0:
-        all_urls = all_urls[: args.max_count]
-
-    if not all_urls:
+    if args.telemetry:
+        telemetry.enable(args.telemetry)
+    SCRAPER.cookie_path = None if args.no_scraper_cookies else args.scraper_cookies
+    controller = None
+    if args.adaptive:
+        controller = RateController(initial=args.workers, maximum=args.max_workers, host_rate=args.host_rate)
+    http_cache = None if args.no_http_cache else HttpCache(args.http_cache)
+
+    if args.pipeline:
+        if args.engine == "async":
+            print("[INFO] --pipeline uses the thread engine; ignoring --engine async")
+        session = setup_requests_session()
+        if controller:
+            throttle(session, controller)
+            SCRAPER.controller = controller
+        all_urls = collect_all_urls(session, args.urls, http_cache)
+        if args.max_count and args.max_count > 0:
+            all_urls = all_urls[: args.max_count]
+        if not all_urls:
+            print("No images found. Exiting.")
+            sys.exit(1)
+        matches = None if args.no_http_cache else HttpCache(args.match_cache, exclusive=False)
+        run_pipeline(args, session, all_urls, http_cache, matches)
+        if http_cache:
+            http_cache.save()
+        if matches:
+            matches.save()
+        SCRAPER.save()
+        if controller:
+            controller.print_stats()
+        return
+
+    # Collect the gallery pages, number the images across them in page order
+    # and download them into the temp folder; the adapter writes the manifest
+    engine = Engine(
+        workers=args.workers,
+        page_workers=max(1, min(len(args.urls), 8)),
+        cache=http_cache,
+        timeout=args.timeout,
+        controller=controller,
+        async_options={"per_host": args.per_host, "max_connections": args.max_connections}
+        if args.engine == "async"
+        else None,
+    )
+    adapter = JimdoAdapter(
+        "jimdo",
+        [(u, u) for u in args.urls],
+        temp_dir=args.temp_dir,
+        manifest=FETCH_MANIFEST,
+        max_count=args.max_count or None,
+    )
+    try:
+        engine.sync([adapter])
+    finally:
+        if http_cache:
+            http_cache.save()
+        SCRAPER.save()
+    if controller:
+        controller.print_stats()
+    if not engine.items[adapter.name]:
         print("No images found. Exiting.")
         sys.exit(1)
 
-    # 2) Ensure temp dir and download
-    ensure_dir(args.temp_dir)
-    print(f"Downloading {len(all_urls)} images to {args.temp_dir} ...")
-
-    jobs = [
-        (i + 1, url, args.temp_dir, session, args.timeout) for i, url in enumerate(all_urls)
-    ]
-
-    results: List[Tuple[int, str, str]] = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futs = [ex.submit(download_one, j) for j in jobs]
-        for fut in concurrent.futures.as_completed(futs):
-            res = fut.result()
-            if res:
-                results.append(res)
-                idx, url, fn = res
-                print(f"  saved {idx:04d}: {fn}")
-
-    results.sort(key=lambda x: x[0])
-    saved = [r for r in results if r]
-    print(f"Done. Saved {len(saved)}/{len(all_urls)} images.")
-
-    # 3) Write manifest for later comparison
-    manifest = {
-        "source_pages": args.urls,
-        "fetched_at": datetime.utcnow().isoformat() + "Z",
-        "temp_dir": args.temp_dir,
-        "count": len(saved),
-        "items": [
-            {"seq": idx, "url": url, "filename": fn} for idx, url, fn in results
-        ],
-    }
-    manifest_path = os.path.join("Crawler", "jimdo_fetched.json")
-    with open(manifest_path, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, ensure_ascii=False, indent=2)
-    print(f"Manifest written to {manifest_path}")
-
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Audit the whole ./images library for near-duplicates across (and within)
+period folders, e.g. 追加分1 vs 2019-2022 or スズメのねぐら vs the old blog
+folders. Hashes come from the same persistent index as
+jimdo_compare_and_merge.py, so an unchanged library is not decoded again.
+
+All pairs within the threshold are found with vectorized XOR/popcount over
+blocks of a packed uint64 array, grouped into clusters (connected
+components), and written to a JSON report that maps each member back to its
+article.json period/title.
+
+Usage examples:
+
+  # Default: dhash, threshold=10, report at Crawler/library_duplicates_report.json
+  python Crawler/library_audit.py
+
+  # Stricter threshold, only report clusters spanning several periods
+  python Crawler/library_audit.py --threshold 6 --cross-period-only
+"""
+
+import argparse
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from hash_engine import (
+    DEFAULT_INDEX_CACHE,
+    DEFAULT_MEMORY_BUDGET_MB,
+    HASH_METHODS,
+    build_existing_hash_index,
+    index_key,
+)
+from jimdo_compare_and_merge import load_manifest, save_json
+
+
+def popcount64(x: np.ndarray) -> np.ndarray:
+    """Per-element popcount of a uint64 array."""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(x)
+    table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    return table[x.view(np.uint8)].reshape(*x.shape, 8).sum(axis=-1)
+
+
+def find_pairs(
+    hashes: np.ndarray, threshold: int, block: int = 1024
+) -> List[Tuple[int, int, int]]:
+    """Return (i, j, distance) for every i < j with distance <= threshold.
+
+    Rows are processed in blocks so memory stays at block x N distances.
+    """
+    n = len(hashes)
+    pairs: List[Tuple[int, int, int]] = []
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        # Only compare against later items (upper triangle)
+        dist = popcount64(hashes[start:stop, None] ^ hashes[None, start:])
+        rows, cols = np.nonzero(dist <= threshold)
+        keep = cols > rows  # offsets are relative to `start` on both axes
+        for r, c in zip(rows[keep], cols[keep]):
+            pairs.append((start + int(r), start + int(c), int(dist[r, c])))
+    return pairs
+
+
+def cluster_pairs(n: int, pairs: List[Tuple[int, int, int]]) -> List[List[int]]:
+    """Union-find over pairs; returns clusters with at least two members."""
+    parent = list(range(n))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j, _ in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def article_lookup(article_path: str) -> Dict[str, Tuple[str, str]]:
+    """Map normalized image paths to (period, title) from article.json."""
+    if not os.path.isfile(article_path):
+        return {}
+    data = load_manifest(article_path)
+    out: Dict[str, Tuple[str, str]] = {}
+    for period, entries in data.items():
+        for title, rel in entries.items():
+            out[str(rel).replace("\\", "/")] = (period, title)
+    return out
+
+
+def period_of(key: str, lookup: Dict[str, Tuple[str, str]]) -> Optional[str]:
+    if key in lookup:
+        return lookup[key][0]
+    parts = key.split("/")
+    return parts[1] if len(parts) > 2 and parts[0] == "images" else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate images across the whole library")
+    parser.add_argument("--root", default="images")
+    parser.add_argument("--threshold", type=int, default=10, help="Hamming distance threshold (<= is considered same)")
+    parser.add_argument("--method", choices=list(HASH_METHODS), default="dhash")
+    parser.add_argument("--workers", type=int, default=None, help="Hashing processes (default: all cores)")
+    parser.add_argument("--memory-budget-mb", type=int, default=DEFAULT_MEMORY_BUDGET_MB)
+    parser.add_argument("--exclude-dirs", nargs="*", default=[os.path.join("images", "_temp_jimdo")])
+    parser.add_argument("--index-cache", default=DEFAULT_INDEX_CACHE)
+    parser.add_argument("--no-index-cache", action="store_true")
+    parser.add_argument("--article-json", default="article.json")
+    parser.add_argument("--cross-period-only", action="store_true", help="Only report clusters spanning 2+ periods")
+    parser.add_argument("--report", default=os.path.join("Crawler", "library_duplicates_report.json"))
+    args = parser.parse_args()
+
+    exclude_dirs = [os.path.abspath(d) for d in args.exclude_dirs]
+    cache_path = None if args.no_index_cache else args.index_cache
+    print("Indexing library images...")
+    index = build_existing_hash_index(
+        [args.root],
+        exclude_dirs,
+        args.method,
+        args.workers,
+        cache_path=cache_path,
+        memory_budget_mb=args.memory_budget_mb,
+    )
+
+    keys = sorted(index_key(p) for p in index)
+    hashes = np.array([index[os.path.abspath(k)] for k in keys], dtype=np.uint64)
+    print(f"Comparing {len(keys)} images (threshold={args.threshold})...")
+    t0 = time.perf_counter()
+    pairs = find_pairs(hashes, args.threshold)
+    clusters = cluster_pairs(len(keys), pairs)
+    print(f"Found {len(pairs)} pairs in {len(clusters)} clusters in {time.perf_counter() - t0:.2f}s.")
+
+    lookup = article_lookup(args.article_json)
+    pair_dist = {(i, j): d for i, j, d in pairs}
+    report_clusters = []
+    for members in clusters:
+        periods = sorted({p for p in (period_of(keys[i], lookup) for i in members) if p})
+        if args.cross_period_only and len(periods) < 2:
+            continue
+        report_clusters.append(
+            {
+                "periods": periods,
+                "cross_period": len(periods) > 1,
+                "members": [
+                    {
+                        "path": keys[i],
+                        "period": lookup.get(keys[i], (None, None))[0],
+                        "title": lookup.get(keys[i], (None, None))[1],
+                    }
+                    for i in members
+                ],
+                "pairs": [
+                    {"a": keys[i], "b": keys[j], "distance": pair_dist[(i, j)]}
+                    for i in members
+                    for j in members
+                    if (i, j) in pair_dist
+                ],
+            }
+        )
+    report_clusters.sort(key=lambda c: (not c["cross_period"], c["members"][0]["path"]))
+
+    report = {
+        "threshold": args.threshold,
+        "method": args.method,
+        "image_count": len(keys),
+        "pair_count": len(pairs),
+        "cluster_count": len(report_clusters),
+        "clusters": report_clusters,
+    }
+    save_json(args.report, report)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Re-encode the original JPEGs under images/ as optimized progressive JPEGs.
+
+get.py and jimdo_fetch.py store originals byte-for-byte as served, and many
+are baseline JPEGs with default Huffman tables. This pass rewrites each one
+as a progressive JPEG with optimized Huffman tables. Metadata is stripped
+where that is safe: the ICC profile is always kept, and EXIF is kept only when
+it carries a rotation. A rewrite is kept only if the file gets smaller and
+the result passes a visual check:
+
+- With ``jpegtran`` (libjpeg-turbo) on PATH the transcode is lossless, and the
+  decoded pixels are identical.
+- Otherwise Pillow re-encodes with the source's own quantization tables and
+  chroma subsampling (``quality="keep"``). This is near-lossless. The result
+  must reach --min-psnr dB against the original pixels and stay within
+  --max-phash bits of its perceptual hash, or the original is left untouched.
+
+Files are replaced atomically (tmp + os.replace). Files stored as hard links
+into cas/ get a new inode, so the content-addressed object keeps its bytes.
+The next content_store.py run picks up the smaller file. A ledger
+(Crawler/optimize_ledger.json) records every file already processed with its
+size and mtime, so later runs only look at new or changed files. The report
+lists bytes before and after per period folder.
+
+Usage examples:
+
+  # Optimize everything (all cores)
+  python Crawler/optimize_originals.py
+
+  # See what would be saved without writing anything
+  python Crawler/optimize_originals.py --dry-run
+
+  # Stricter check, one period only
+  python Crawler/optimize_originals.py --root images/2019-2022 --min-psnr 45
+"""
+
+import argparse
+import concurrent.futures
+import io
+import json
+import os
+import shutil
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from hash_engine import hamming, list_images, phash, pool_size
+
+
+DEFAULT_LEDGER = os.path.join("Crawler", "optimize_ledger.json")
+LEDGER_VERSION = 1
+DEFAULT_MIN_PSNR = 40.0
+DEFAULT_MAX_PHASH = 2
+EXIF_ORIENTATION = 0x0112
+JPEG_EXTS = (".jpg", ".jpeg")
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    """Peak signal-to-noise ratio in dB (inf for identical pixels)."""
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255.0 ** 2 / mse))
+
+
+def _jpegtran(path: str, keep_exif: bool) -> Optional[bytes]:
+    exe = shutil.which("jpegtran")
+    if not exe:
+        return None
+    # "-copy icc" keeps the color profile; "-copy all" also keeps EXIF
+    copy = "all" if keep_exif else "icc"
+    try:
+        out = subprocess.run(
+            [exe, "-copy", copy, "-optimize", "-progressive", path],
+            check=True, capture_output=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out or None
+
+
+def _pillow(img: Image.Image, keep_exif: bool) -> bytes:
+    buf = io.BytesIO()
+    options = {
+        "quality": "keep",
+        "subsampling": "keep",
+        "optimize": True,
+        "progressive": True,
+    }
+    if img.info.get("icc_profile"):
+        options["icc_profile"] = img.info["icc_profile"]
+    if keep_exif and img.info.get("exif"):
+        options["exif"] = img.info["exif"]
+    img.save(buf, "JPEG", **options)
+    return buf.getvalue()
+
+
+def optimize_one(job: Tuple[str, float, int, bool]) -> dict:
+    """Re-encode one file; returns a ledger entry (written unless dry_run)."""
+    path, min_psnr, max_phash, dry_run = job
+    before = os.path.getsize(path)
+    entry = {"before": before, "after": before, "result": "kept"}
+    try:
+        with Image.open(path) as img:
+            if img.format != "JPEG":
+                return {**entry, "result": "not_jpeg"}
+            keep_exif = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+            img.load()
+            original = img
+            data = _jpegtran(path, keep_exif)
+            lossless = data is not None
+            if data is None:
+                data = _pillow(img, keep_exif)
+            if len(data) >= before:
+                return {**entry, "result": "no_gain"}
+            with Image.open(io.BytesIO(data)) as new:
+                new.load()
+                a = np.asarray(original.convert("RGB"))
+                b = np.asarray(new.convert("RGB"))
+                score = psnr(a, b) if a.shape == b.shape else 0.0
+                distance = hamming(phash(original), phash(new))
+        if not lossless and (score < min_psnr or distance > max_phash):
+            return {**entry, "result": "rejected", "psnr": round(score, 2), "phash": distance}
+    except Exception as e:
+        return {**entry, "result": "error", "error": str(e)}
+
+    if not dry_run:
+        tmp = f"{path}.opt.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    result = {"before": before, "after": len(data), "result": "optimized", "lossless": lossless}
+    if score != float("inf"):
+        result["psnr"] = round(score, 2)
+    return result
+
+
+def load_ledger(path: str) -> Dict[str, dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and data.get("version") == LEDGER_VERSION:
+            return data.get("files") or {}
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_ledger(path: str, files: Dict[str, dict]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": LEDGER_VERSION, "files": files}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def period_of(rel: str) -> str:
+    """First folder below images/ (the period), or "." for loose files."""
+    parts = rel.replace("\\", "/").split("/")
+    return parts[1] if len(parts) > 2 and parts[0] == "images" else parts[0] if len(parts) > 1 else "."
+
+
+def optimize_library(
+    root: str = "images",
+    exclude_dirs: Optional[List[str]] = None,
+    ledger_path: Optional[str] = DEFAULT_LEDGER,
+    workers: Optional[int] = None,
+    min_psnr: float = DEFAULT_MIN_PSNR,
+    max_phash: int = DEFAULT_MAX_PHASH,
+    dry_run: bool = False,
+) -> Dict[str, dict]:
+    """Optimize every new or changed JPEG under ``root``; returns the per-period report."""
+    exclude_dirs = exclude_dirs if exclude_dirs is not None else [os.path.join("images", "_temp_jimdo")]
+    ledger = load_ledger(ledger_path) if ledger_path else {}
+    todo: List[str] = []
+    skipped = 0
+    for path in list_images(root, exclude_dirs):
+        if not path.lower().endswith(JPEG_EXTS):
+            continue
+        rel = os.path.relpath(path).replace(os.sep, "/")
+        st = os.stat(path)
+        prev = ledger.get(rel)
+        if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+            skipped += 1
+            continue
+        todo.append(path)
+
+    print(f"Optimizing {len(todo)} JPEGs ({skipped} unchanged since the last run)...")
+    jobs = [(p, min_psnr, max_phash, dry_run) for p in todo]
+    n = min(pool_size(workers, None), max(1, len(jobs)))
+    if n > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n) as ex:
+            results = list(ex.map(optimize_one, jobs, chunksize=4))
+    else:
+        results = [optimize_one(j) for j in jobs]
+
+    report: Dict[str, dict] = defaultdict(lambda: {"files": 0, "optimized": 0, "rejected": 0, "before": 0, "after": 0})
+    for path, res in zip(todo, results):
+        rel = os.path.relpath(path).replace(os.sep, "/")
+        row = report[period_of(rel)]
+        row["files"] += 1
+        row["before"] += res["before"]
+        row["after"] += res["after"]
+        row["optimized"] += res["result"] == "optimized"
+        row["rejected"] += res["result"] == "rejected"
+        if res["result"] == "error":
+            print(f"[WARN] {rel}: {res['error']}")
+        if not dry_run and res["result"] != "error":
+            st = os.stat(path)
+            ledger[rel] = {**res, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if ledger_path and not dry_run:
+        save_ledger(ledger_path, ledger)
+    return dict(report)
+
+
+def print_report(report: Dict[str, dict], dry_run: bool = False) -> None:
+    if not report:
+        print("Nothing to do.")
+        return
+    width = max(len(k) for k in report) + 2
+    print(f"\n{'Period':<{width}} {'files':>6} {'optimized':>9} {'rejected':>8} {'before MB':>10} {'after MB':>9} {'saved':>7}")
+    total = {"files": 0, "optimized": 0, "rejected": 0, "before": 0, "after": 0}
+    for period in sorted(report):
+        row = report[period]
+        for k in total:
+            total[k] += row[k]
+        _print_row(period, row, width)
+    _print_row("TOTAL", total, width)
+    if dry_run:
+        print("(dry run: nothing written)")
+
+
+def _print_row(name: str, row: dict, width: int) -> None:
+    saved = 1 - row["after"] / row["before"] if row["before"] else 0.0
+    print(
+        f"{name:<{width}} {row['files']:>6} {row['optimized']:>9} {row['rejected']:>8} "
+        f"{row['before'] / 1e6:>10.2f} {row['after'] / 1e6:>9.2f} {saved:>6.1%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rewrite original JPEGs as optimized progressive JPEGs")
+    parser.add_argument("--root", default="images", help="Folder to optimize")
+    parser.add_argument("--exclude-dirs", nargs="*", default=[os.path.join("images", "_temp_jimdo")])
+    parser.add_argument("--ledger", default=DEFAULT_LEDGER, help="Processed-file ledger")
+    parser.add_argument("--no-ledger", action="store_true", help="Re-check every file")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: all cores)")
+    parser.add_argument("--min-psnr", type=float, default=DEFAULT_MIN_PSNR, help="Lowest accepted PSNR (dB) for lossy re-encodes")
+    parser.add_argument("--max-phash", type=int, default=DEFAULT_MAX_PHASH, help="Largest accepted phash distance")
+    parser.add_argument("--dry-run", action="store_true", help="Report savings without writing files or the ledger")
+    args = parser.parse_args()
+
+    if not shutil.which("jpegtran"):
+        print("[INFO] jpegtran not found; using Pillow (quality='keep') with the PSNR/phash check")
+    report = optimize_library(
+        args.root,
+        args.exclude_dirs,
+        None if args.no_ledger else args.ledger,
+        args.workers,
+        args.min_psnr,
+        args.max_phash,
+        args.dry_run,
+    )
+    print_report(report, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
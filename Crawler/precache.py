@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Generate precache-manifest.json for service-worker.js: every static asset and
+every image in article.json with a content revision and byte size.
+
+The service worker compares revisions with what it cached before and
+re-fetches only changed entries. It drops entries that disappeared, and it
+can pull a whole period into the cache on request. Static assets are
+precached on install. Images are listed per period so they can be prefetched
+in bulk.
+
+Revisions are sha256 prefixes. Files under cas/ already carry their hash in
+the name, so they are never read. Other files are hashed once and then reused
+while size and mtime match, which is the same rule the hash index uses. The
+cache of known digests lives in Crawler/precache_index.json. That keeps
+regeneration fast enough to run after every update_article_json call.
+
+The manifest is committed next to article.json because the site is served
+straight from the repository; without it script.js keeps the offline mode
+switched off and service-worker.js only precaches the fixed static files.
+
+Usage examples:
+
+  python Crawler/precache.py
+  python Crawler/precache.py --root . --out precache-manifest.json
+
+  # Ignore the digest cache and hash everything again
+  python Crawler/precache.py --no-digest-cache
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from content_store import CAS_DIR, DIGEST_LEN, file_digest
+
+
+DEFAULT_MANIFEST = "precache-manifest.json"
+REVISION_LEN = 12
+# Site-root relative globs precached on install
+STATIC_ASSETS = (
+    "index.html",
+    "style.css",
+    "script.js",
+    "i18n.js",
+    "manifest.json",
+    "style.svg",
+    "desc.json",
+    "article.json",
+    "meta/*.json",
+    "article.srcset.json",
+    "modules/*",
+    "icons/*",
+    "data/*.json",
+)
+
+
+def default_digest_cache(root: str) -> str:
+    """<root>/Crawler/precache_index.json (or <root>/precache_index.json)."""
+    crawler = os.path.join(root, "Crawler")
+    return os.path.join(crawler if os.path.isdir(crawler) else root, "precache_index.json")
+
+
+class DigestCache:
+    """sha256 per site-relative path, reused while size and mtime match."""
+
+    def __init__(self, root: str, path: Optional[str]) -> None:
+        self.root = root
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self.hashed = 0
+        if path:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.entries = data if isinstance(data, dict) else {}
+            except Exception:
+                self.entries = {}
+        self._seen = set()
+
+    def entry(self, rel: str) -> Optional[dict]:
+        """{"revision", "size"} for a site-relative path, or None if missing."""
+        full = os.path.join(self.root, rel)
+        try:
+            st = os.stat(full)
+        except OSError:
+            return None
+        self._seen.add(rel)
+        name = os.path.basename(rel)
+        if rel.startswith(f"{CAS_DIR}/") and len(os.path.splitext(name)[0]) == DIGEST_LEN:
+            return {"revision": name[:REVISION_LEN], "size": st.st_size}
+        prev = self.entries.get(rel)
+        if not (prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns):
+            prev = {"sha256": file_digest(full), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            self.entries[rel] = prev
+            self.hashed += 1
+        return {"revision": prev["sha256"][:REVISION_LEN], "size": st.st_size}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        # Forget files that are no longer part of the site
+        entries = {k: v for k, v in self.entries.items() if k in self._seen}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+def _item(rel: str, info: dict) -> dict:
+    return {"url": rel, "revision": info["revision"], "size": info["size"]}
+
+
+def build_precache_manifest(
+    root: str = ".",
+    out: Optional[str] = None,
+    article_json: str = "article.json",
+    digest_cache: Optional[str] = "",
+) -> dict:
+    """Write the manifest (default <root>/precache-manifest.json) and return it.
+
+    ``digest_cache`` "" means the default location, None disables it.
+    """
+    out = out or os.path.join(root, DEFAULT_MANIFEST)
+    if digest_cache == "":
+        digest_cache = default_digest_cache(root)
+    cache = DigestCache(root, digest_cache)
+
+    assets: List[dict] = []
+    for pattern in STATIC_ASSETS:
+        for full in sorted(glob.glob(os.path.join(root, pattern))):
+            if not os.path.isfile(full):
+                continue
+            rel = os.path.relpath(full, root).replace(os.sep, "/")
+            info = cache.entry(rel)
+            if info:
+                assets.append(_item(rel, info))
+
+    periods: Dict[str, List[dict]] = {}
+    try:
+        with open(os.path.join(root, article_json), "r", encoding="utf-8") as f:
+            articles = json.load(f)
+    except (OSError, ValueError):
+        articles = {}
+    for period, images in articles.items():
+        items = []
+        for path in images.values():
+            rel = str(path).replace("\\", "/")
+            info = cache.entry(rel)
+            if info:
+                items.append(_item(rel, info))
+        periods[period] = items
+    cache.save()
+
+    manifest = {"version": 1, "assets": assets, "periods": periods}
+    # One revision for the whole manifest lets clients skip a sync entirely
+    body = json.dumps(manifest, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    manifest["revision"] = hashlib.sha256(body.encode("utf-8")).hexdigest()[:REVISION_LEN]
+
+    tmp = f"{out}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, out)
+    total = len(assets) + sum(len(v) for v in periods.values())
+    print(f"Precache manifest: {total} entries, {cache.hashed} hashed -> {out}")
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write the service worker precache manifest")
+    parser.add_argument("--root", default=".", help="Site root")
+    parser.add_argument("--out", default=None, help=f"Output (default: <root>/{DEFAULT_MANIFEST})")
+    parser.add_argument("--digest-cache", default="", help="Digest cache (default: Crawler/precache_index.json)")
+    parser.add_argument("--no-digest-cache", action="store_true", help="Hash every file again")
+    args = parser.parse_args()
+    build_precache_manifest(args.root, args.out, digest_cache=None if args.no_digest_cache else args.digest_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Adaptive per-host concurrency and rate control for the thread download pools.
+
+With ``--adaptive``, get.py and jimdo_fetch.py route their session through a
+RateController. The thread pool is then sized to the upper bound, and the
+controller decides how many of those threads may talk to a host at once.
+
+- Concurrency per host follows AIMD, additive increase and multiplicative
+  decrease. Roughly one slot is added per window of healthy responses. The
+  limit is halved on 429/503/403 responses, a Retry-After header, or a
+  connection error or timeout. It is trimmed by 10% when latency climbs well
+  above its recent baseline (a latency gradient), which means the server or
+  link is queueing.
+- A token bucket per host caps the request rate (``host_rate`` per second, 0 =
+  no cap).
+- 429 and 503 are retried after Retry-After seconds, or after an
+  exponential delay when the header is missing. The wait happens without
+  holding a slot. A 429, or a third overload in a row (the cut alone is not
+  helping), also pauses the host's bucket, so every thread waits instead of
+  hammering the host. 403, and a 503 carrying an anti-bot challenge, only
+  back off, so callers such as jimdo_fetch.get_soup can still fall back to
+  cloudscraper (and the scraper session can solve the challenge).
+- On throttled sessions, urllib3's own retries for 429/503 and Retry-After
+  are turned off, so the controller sees every one of them.
+
+Usage:
+
+  controller = RateController(initial=8, maximum=64, host_rate=20)
+  session = throttle(setup_requests_session(), controller)
+  ... use the session from up to ``maximum`` threads ...
+  controller.print_stats()
+
+benchmark.py has a ``download_adaptive`` stage and ``--server-max-inflight``
+that makes its local server answer 503 + Retry-After under overload, which is
+the stub to tune against.
+"""
+
+import email.utils
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from scraper_session import is_challenge
+
+
+BACKOFF_STATUSES = (403, 429, 503)
+RETRY_STATUSES = (429, 503)
+MAX_RETRY_AFTER = 300.0
+# Backoff without Retry-After: BASE_BACKOFF * 2**(n-1) seconds, capped
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+# Consecutive overloads after which the whole host is paused
+PAUSE_AFTER = 3
+
+_local = threading.local()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """Blocking token bucket; ``rate`` 0 means unlimited (pauses still apply)."""
+
+    def __init__(self, rate: float = 0.0, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AimdLimiter:
+    """Concurrency limit adjusted by AIMD with a latency-gradient brake."""
+
+    def __init__(
+        self,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.baseline: Optional[float] = None  # lowest recent latency
+        self.smoothed: Optional[float] = None  # EWMA of latency
+        self.last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _cut(self, factor: float) -> None:
+        # One cut per round trip: the requests already in flight were sent
+        # under the old limit and would otherwise halve it again and again
+        now = time.monotonic()
+        if now - self.last_decrease >= (self.smoothed or 1.0):
+            self.limit = max(float(self.minimum), self.limit * factor)
+            self.last_decrease = now
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self._cut(self.decrease)
+            elif latency is not None:
+                # The baseline creeps up slowly so it follows a genuinely slower path
+                self.baseline = latency if self.baseline is None else min(self.baseline * 1.01, latency)
+                self.smoothed = latency if self.smoothed is None else 0.8 * self.smoothed + 0.2 * latency
+                if self.smoothed > self.baseline * self.latency_tolerance:
+                    self._cut(0.9)
+                else:
+                    self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class HostState:
+    def __init__(self, limiter: AimdLimiter, bucket: TokenBucket) -> None:
+        self.limiter = limiter
+        self.bucket = bucket
+        self.consecutive_backoffs = 0
+        self.requests = 0
+        self.backoffs = 0
+        self.peak = limiter.limit
+
+
+class RateController:
+    """Per-host AIMD limiters and token buckets shared by all worker threads."""
+
+    def __init__(
+        self,
+        initial: int = 8,
+        maximum: int = 64,
+        minimum: int = 1,
+        host_rate: float = 0.0,
+        retries: int = 3,
+    ) -> None:
+        self.initial = initial
+        self.maximum = maximum
+        self.minimum = minimum
+        self.host_rate = host_rate
+        self.retries = retries
+        self._hosts: Dict[str, HostState] = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostState:
+        key = urlparse(url).netloc
+        with self._lock:
+            state = self._hosts.get(key)
+            if state is None:
+                state = self._hosts[key] = HostState(
+                    AimdLimiter(self.initial, self.minimum, self.maximum), TokenBucket(self.host_rate)
+                )
+            return state
+
+    def acquire(self, url: str) -> HostState:
+        state = self.host(url)
+        state.bucket.acquire()
+        state.limiter.acquire()
+        state.requests += 1
+        return state
+
+    def release(self, state: HostState, latency: Optional[float]) -> None:
+        state.consecutive_backoffs = 0
+        state.limiter.release(latency)
+        state.peak = max(state.peak, state.limiter.limit)
+
+    def backoff(self, state: HostState, retry_after: Optional[float] = None, status: Optional[int] = None) -> float:
+        """Release an overloaded slot and cut the limit.
+
+        Returns how long the failed request should wait before a retry.
+        """
+        state.backoffs += 1
+        state.consecutive_backoffs += 1
+        state.limiter.release(overloaded=True)
+        delay = retry_after
+        if delay is None:
+            delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (state.consecutive_backoffs - 1))
+        if status == 429 or state.consecutive_backoffs >= PAUSE_AFTER:
+            state.bucket.pause(delay)
+        return delay
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                host: {
+                    "limit": round(s.limiter.limit, 1),
+                    "peak": round(s.peak, 1),
+                    "requests": s.requests,
+                    "backoffs": s.backoffs,
+                }
+                for host, s in self._hosts.items()
+            }
+
+    def print_stats(self) -> None:
+        for host, s in self.stats().items():
+            print(
+                f"  {host}: concurrency {s['limit']} (peak {s['peak']}), "
+                f"{s['requests']} requests, {s['backoffs']} backoffs"
+            )
+
+
+def throttle(session: requests.Session, controller: RateController) -> requests.Session:
+    """Route every request made through ``session`` via ``controller``."""
+    # The controller handles 429/503 and Retry-After itself. urllib3 would
+    # otherwise retry them (it does so for any Retry-After, listed or not)
+    for adapter in session.adapters.values():
+        retries = getattr(adapter, "max_retries", None)
+        if retries is not None:
+            adapter.max_retries = retries.new(
+                status_forcelist=[s for s in retries.status_forcelist or () if s not in RETRY_STATUSES],
+                respect_retry_after_header=False,
+            )
+    send = session.send
+
+    def throttled_send(request, **kwargs):
+        # Redirect hops reuse the slot of the request that started them
+        if getattr(_local, "inside", False):
+            return send(request, **kwargs)
+        attempt = 0
+        while True:
+            state = controller.acquire(request.url)
+            _local.inside = True
+            try:
+                resp = send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                controller.backoff(state)
+                raise
+            except Exception:
+                controller.release(state, None)
+                raise
+            finally:
+                _local.inside = False
+
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if resp.status_code in BACKOFF_STATUSES or retry_after is not None:
+                delay = controller.backoff(state, retry_after, resp.status_code)
+                if resp.status_code in RETRY_STATUSES and attempt < controller.retries and not is_challenge(resp):
+                    resp.close()
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                return resp
+
+            latency = resp.elapsed.total_seconds()
+            if not kwargs.get("stream"):
+                controller.release(state, latency)
+                return resp
+            # Streamed bodies hold the slot until the caller closes the response
+            close = resp.close
+            done = []
+
+            def close_and_release() -> None:
+                close()
+                if not done:
+                    done.append(True)
+                    controller.release(state, latency)
+
+            resp.close = close_and_release  # type: ignore[method-assign]
+            return resp
+
+    session.send = throttled_send  # type: ignore[method-assign]
+    return session
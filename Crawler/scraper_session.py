@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+One shared anti-bot (cloudscraper) session for a whole crawl.
+
+- The session is created lazily by the first request that needs it, then
+  shared by every page and image fetch, across threads.
+- The first request to each host runs alone, so a challenge is solved once,
+  not once per worker.
+- Hosts that answered 403, or 503 with an anti-bot challenge (Cloudflare's
+  ``cf-mitigated`` header or challenge page), are remembered for the rest of
+  the run. Their later pages and images go straight to the scraper. A plain
+  503 is overload, not a block: it is left to the rate controller.
+- With ``--adaptive`` the scraper session goes through the same
+  RateController as the plain session, so protected hosts keep their AIMD
+  limit, token bucket and Retry-After handling.
+- Clearance cookies (cf_clearance and friends) are saved next to the other
+  crawler state, together with the User-Agent they were issued for. They are
+  reused on the next run until they expire, so protected runs pay the
+  challenge cost once.
+
+Usage:
+
+  scraper = SharedScraper(setup_scraper_session, "Crawler/scraper_cookies.json")
+  scraper.controller = controller  # optional, with --adaptive
+  resp = scraper.call(url, lambda s: s.get(url, timeout=30))
+  ...
+  scraper.save()
+"""
+
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional, Set, TypeVar
+from urllib.parse import urlparse
+
+import requests
+
+if TYPE_CHECKING:
+    from rate_control import RateController
+
+
+DEFAULT_SCRAPER_COOKIES = os.path.join("Crawler", "scraper_cookies.json")
+# Markers of a Cloudflare challenge page (IUAM / managed challenge)
+CHALLENGE_MARKERS = ("/cdn-cgi/challenge-platform/", "challenge-form", "jschl", "cf-browser-verification", "_cf_chl_opt")
+
+T = TypeVar("T")
+
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc
+
+
+def is_challenge(resp: requests.Response) -> bool:
+    """True if a 503 is an anti-bot challenge rather than plain overload.
+
+    Streamed responses must have their body read first; stream_download keeps
+    the start of error bodies for this.
+    """
+    if getattr(resp, "status_code", None) != 503:
+        return False
+    if resp.headers.get("cf-mitigated", "").lower() == "challenge":
+        return True
+    if not resp.headers.get("Server", "").lower().startswith("cloudflare"):
+        return False
+    try:
+        body = resp.text
+    except Exception:
+        return False
+    return any(marker in body for marker in CHALLENGE_MARKERS)
+
+
+def is_blocked(resp: requests.Response) -> bool:
+    """True if ``resp`` calls for the scraper: a 403 or a challenge 503."""
+    return getattr(resp, "status_code", None) == 403 or is_challenge(resp)
+
+
+class SharedScraper:
+    """Lazily created, thread-safe cloudscraper session with persisted cookies."""
+
+    def __init__(
+        self,
+        factory: Callable[[], requests.Session],
+        cookie_path: Optional[str] = DEFAULT_SCRAPER_COOKIES,
+    ) -> None:
+        self.factory = factory
+        self.cookie_path = cookie_path
+        self.controller: Optional["RateController"] = None
+        self.protected: Set[str] = set()
+        self._session: Optional[requests.Session] = None
+        self._lock = threading.Lock()
+        self._host_locks: dict = {}
+        self._cleared: Set[str] = set()
+
+    @property
+    def created(self) -> bool:
+        return self._session is not None
+
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = self.factory()
+                    self._load_cookies(session)
+                    if self.controller is not None:
+                        from rate_control import throttle
+
+                        session = throttle(session, self.controller)
+                    self._session = session
+        return self._session
+
+    def is_protected(self, url: str) -> bool:
+        return _host(url) in self.protected
+
+    def mark_protected(self, url: str) -> None:
+        self.protected.add(_host(url))
+
+    def call(self, url: str, fn: Callable[[requests.Session], T]) -> T:
+        """Run ``fn(session)`` for a request to ``url``.
+
+        Until a host has answered once without a block, its requests run one
+        at a time, so concurrent workers don't all solve the same challenge.
+        """
+        session = self.session()
+        host = _host(url)
+        if host in self._cleared:
+            return fn(session)
+        with self._lock:
+            lock = self._host_locks.setdefault(host, threading.Lock())
+        with lock:
+            result = fn(session)
+            if not is_blocked(result):
+                self._cleared.add(host)
+                # Keep fresh clearance even if the run dies later
+                self.save()
+        return result
+
+    def _load_cookies(self, session: requests.Session) -> None:
+        if not self.cookie_path:
+            return
+        try:
+            with open(self.cookie_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Clearance cookies are only valid for the User-Agent that earned them
+        if data.get("user_agent"):
+            session.headers["User-Agent"] = data["user_agent"]
+        now = time.time()
+        loaded = 0
+        for c in data.get("cookies", []):
+            if c.get("expires") and c["expires"] <= now:
+                continue
+            session.cookies.set(
+                c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"),
+                expires=c.get("expires"), secure=c.get("secure", False),
+            )
+            loaded += 1
+        if loaded:
+            print(f"Reusing {loaded} saved anti-bot cookies from {self.cookie_path}")
+
+    def save(self) -> None:
+        """Write the unexpired cookies (no-op if the scraper was never used)."""
+        if self._session is None or not self.cookie_path:
+            return
+        now = time.time()
+        cookies = [
+            {
+                "name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+                "expires": c.expires, "secure": c.secure,
+            }
+            for c in self._session.cookies
+            if not (c.expires and c.expires <= now)
+        ]
+        data = {"user_agent": self._session.headers.get("User-Agent"), "saved_at": int(now), "cookies": cookies}
+        os.makedirs(os.path.dirname(self.cookie_path) or ".", exist_ok=True)
+        tmp = f"{self.cookie_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.cookie_path)
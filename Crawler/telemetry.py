@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in per-request network telemetry for the crawlers.
+
+get.py and jimdo_fetch.py run with ``--telemetry [PATH]``. In that mode every
+HTTP request made through their sessions is appended to a JSONL file (default
+Crawler/requests.jsonl) as one record:
+
+  {"ts": 1760000000.12, "url": "...", "host": "...", "phase": "image",
+   "method": "GET", "status": 200, "bytes": 183412, "dns_ms": 3.1,
+   "connect_ms": 41.0, "ttfb_ms": 120.4, "total_ms": 388.9, "retries": 0,
+   "redirects": 0, "reused": false, "scraper": false, "engine": "requests"}
+
+- ``phase`` is "image" for image responses (by Content-Type, else by URL
+  extension) and "page" for everything else.
+- ``dns_ms``/``connect_ms`` are only non-zero when the request opened a new
+  connection (``reused`` is false). ``connect_ms`` includes the TLS handshake.
+- ``ttfb_ms`` runs from the start of the request to the response headers.
+- ``total_ms`` ends when the body has been read.
+- ``retries`` counts urllib3 retries for the requests engine and extra
+  attempts for the async engine.
+- ``scraper`` marks requests made by the cloudscraper fallback session.
+- Failed requests have ``status`` null and an ``error`` field.
+
+The summary command reports throughput, error rates and the slowest hosts,
+which is what --workers/--threads, --per-host and pool sizes should be tuned
+against.
+
+Usage examples:
+
+  # Record a crawl, then summarize it
+  python Crawler/get.py --telemetry
+  python Crawler/telemetry.py summary
+
+  # Another file, ten slowest hosts
+  python Crawler/telemetry.py summary --path run2.jsonl --top 10
+
+  # Regression check: an instrumented HTTPS request to a local server
+  python Crawler/telemetry.py check-tls
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import create_connection
+
+
+DEFAULT_TELEMETRY = os.path.join("Crawler", "requests.jsonl")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".avif", ".bmp")
+
+_active: Optional["Telemetry"] = None
+_local = threading.local()
+
+
+class Telemetry:
+    """Thread-safe JSONL appender (one record per request)."""
+
+    def __init__(self, path: str = DEFAULT_TELEMETRY) -> None:
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, **fields) -> None:
+        line = json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def enable(path: str = DEFAULT_TELEMETRY) -> Telemetry:
+    """Turn telemetry on for sessions created from now on."""
+    global _active
+    _active = Telemetry(path)
+    print(f"Telemetry: recording requests to {path}")
+    return _active
+
+
+def active() -> Optional[Telemetry]:
+    return _active
+
+
+def phase_for(url: str, content_type: Optional[str] = None) -> str:
+    if content_type:
+        return "image" if content_type.lower().startswith("image/") else "page"
+    return "image" if urlparse(url).path.lower().endswith(IMAGE_EXTS) else "page"
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 2)
+
+
+# ---------------------------------------------------------------------------
+# requests / urllib3 instrumentation
+# ---------------------------------------------------------------------------
+
+
+class _TimedConnectionMixin:
+    """Times DNS and connect (incl. TLS) of new connections for the current request.
+
+    The host is resolved in ``_new_conn`` so the lookup can be timed on its
+    own, and the socket is opened to the resolved address. The connection
+    keeps its host name, so SNI, certificate checks and the Host header are
+    unchanged.
+    """
+
+    def _new_conn(self) -> socket.socket:
+        timing = getattr(_local, "timing", None)
+        if timing is None:
+            return super()._new_conn()  # type: ignore[misc]
+        t0 = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)  # type: ignore[attr-defined]
+        except OSError:
+            infos = []
+        timing["dns_s"] += time.perf_counter() - t0
+        if not infos:
+            return super()._new_conn()  # type: ignore[misc]  # urllib3 raises its own resolution error
+        error: Optional[OSError] = None
+        for *_, address in infos:
+            try:
+                return create_connection(
+                    (address[0], self.port),  # type: ignore[attr-defined]
+                    self.timeout,  # type: ignore[attr-defined]
+                    source_address=self.source_address,  # type: ignore[attr-defined]
+                    socket_options=self.socket_options,  # type: ignore[attr-defined]
+                )
+            except socket.timeout as e:
+                raise ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"  # type: ignore[attr-defined]
+                ) from e
+            except OSError as e:
+                error = e
+        raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+
+    def connect(self) -> None:
+        timing = getattr(_local, "timing", None)
+        if timing is None:
+            return super().connect()  # type: ignore[misc]
+        dns = timing["dns_s"]
+        t0 = time.perf_counter()
+        try:
+            super().connect()  # type: ignore[misc]
+        finally:
+            # The lookup in _new_conn is reported as dns_ms, not as connect time
+            timing["connect_s"] += time.perf_counter() - t0 - (timing["dns_s"] - dns)
+            timing["connections"] += 1
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+TIMED_POOL_CLASSES = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+def _retries(resp: requests.Response) -> int:
+    retries = getattr(resp.raw, "retries", None)
+    return len(getattr(retries, "history", ()) or ())
+
+
+def _wire_bytes(resp: requests.Response) -> int:
+    try:
+        return int(resp.raw.tell())
+    except Exception:
+        return len(resp._content or b"") if resp._content else 0
+
+
+def instrument(session: requests.Session, scraper: bool = False) -> requests.Session:
+    """Record every request made through ``session`` (no-op unless enabled).
+
+    Works for plain requests sessions and cloudscraper sessions alike. Their
+    adapters keep their own retry, pool and TLS settings; only the connection
+    classes are swapped for timed ones.
+    """
+    tel = _active
+    if tel is None or getattr(session, "_telemetry", None) is tel:
+        return session
+    session._telemetry = tel  # type: ignore[attr-defined]
+    for adapter in session.adapters.values():
+        manager = getattr(adapter, "poolmanager", None)
+        if manager is not None:
+            manager.clear()
+            manager.pool_classes_by_scheme = TIMED_POOL_CLASSES
+    send = session.send
+
+    def timed_send(request, **kwargs):
+        # Redirect hops come through here again; they belong to the outer record
+        if getattr(_local, "depth", 0):
+            return send(request, **kwargs)
+        _local.depth = 1
+        _local.timing = timing = {"dns_s": 0.0, "connect_s": 0.0, "connections": 0}
+        start_ts, t0 = time.time(), time.perf_counter()
+        base = {"ts": round(start_ts, 3), "url": request.url, "host": urlparse(request.url).netloc,
+                "method": request.method, "scraper": scraper, "engine": "requests"}
+        try:
+            resp = send(request, **kwargs)
+        except Exception as e:
+            tel.record(**base, phase=phase_for(request.url), status=None, bytes=0,
+                       dns_ms=_ms(timing["dns_s"]), connect_ms=_ms(timing["connect_s"]), ttfb_ms=None,
+                       total_ms=_ms(time.perf_counter() - t0), retries=0, redirects=0,
+                       reused=timing["connections"] == 0, error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _local.depth = 0
+            _local.timing = None
+
+        def emit() -> None:
+            tel.record(**base, phase=phase_for(request.url, resp.headers.get("Content-Type")),
+                       status=resp.status_code, bytes=_wire_bytes(resp), dns_ms=_ms(timing["dns_s"]),
+                       connect_ms=_ms(timing["connect_s"]), ttfb_ms=_ms(resp.elapsed.total_seconds()),
+                       total_ms=_ms(time.perf_counter() - t0), retries=_retries(resp),
+                       redirects=len(resp.history), reused=timing["connections"] == 0)
+
+        if kwargs.get("stream"):
+            # The body is read by the caller; finish the record when it closes the response
+            close = resp.close
+            done = []
+
+            def close_and_record() -> None:
+                close()
+                if not done:
+                    done.append(True)
+                    emit()
+
+            resp.close = close_and_record  # type: ignore[method-assign]
+        else:
+            emit()
+        return resp
+
+    session.send = timed_send  # type: ignore[method-assign]
+    return session
+
+
+# ---------------------------------------------------------------------------
+# aiohttp instrumentation (async_engine.AsyncFetcher)
+# ---------------------------------------------------------------------------
+
+
+def aiohttp_trace_config():
+    """TraceConfig filling the ``trace_request_ctx`` dict from start_request()."""
+    import aiohttp
+
+    async def dns_start(session, ctx, params):
+        ctx.trace_request_ctx["_dns0"] = time.perf_counter()
+
+    async def dns_end(session, ctx, params):
+        rec = ctx.trace_request_ctx
+        rec["dns_s"] = rec.get("dns_s", 0.0) + time.perf_counter() - rec.pop("_dns0", time.perf_counter())
+
+    async def conn_start(session, ctx, params):
+        ctx.trace_request_ctx["_conn0"] = time.perf_counter()
+
+    async def conn_end(session, ctx, params):
+        rec = ctx.trace_request_ctx
+        rec["conn_s"] = rec.get("conn_s", 0.0) + time.perf_counter() - rec.pop("_conn0", time.perf_counter())
+        rec["connections"] = rec.get("connections", 0) + 1
+
+    async def request_end(session, ctx, params):
+        rec = ctx.trace_request_ctx
+        rec["ttfb_s"] = time.perf_counter() - rec["_t0"]
+
+    trace = aiohttp.TraceConfig(trace_config_ctx_factory=_trace_ctx_factory)
+    trace.on_dns_resolvehost_start.append(dns_start)
+    trace.on_dns_resolvehost_end.append(dns_end)
+    trace.on_connection_create_start.append(conn_start)
+    trace.on_connection_create_end.append(conn_end)
+    trace.on_request_end.append(request_end)
+    trace.freeze()
+    return trace
+
+
+def _trace_ctx_factory(trace_request_ctx=None):
+    from types import SimpleNamespace
+
+    # Requests started without a record still get a scratch dict
+    return SimpleNamespace(trace_request_ctx=trace_request_ctx if trace_request_ctx is not None else {})
+
+
+def start_request(url: str) -> Optional[dict]:
+    """Per-attempt record for the async engine (None when telemetry is off)."""
+    if _active is None:
+        return None
+    return {"_t0": time.perf_counter(), "_ts": time.time(), "url": url}
+
+
+def finish_request(
+    rec: Optional[dict],
+    status: Optional[int],
+    nbytes: int = 0,
+    content_type: Optional[str] = None,
+    retries: int = 0,
+    error: Optional[BaseException] = None,
+) -> None:
+    if rec is None or _active is None:
+        return
+    url = rec["url"]
+    # aiohttp reports the connection time including DNS
+    dns = rec.get("dns_s", 0.0)
+    fields = dict(
+        ts=round(rec["_ts"], 3), url=url, host=urlparse(url).netloc, method="GET", scraper=False,
+        engine="async", phase=phase_for(url, content_type), status=status, bytes=nbytes,
+        dns_ms=_ms(dns), connect_ms=_ms(max(rec.get("conn_s", 0.0) - dns, 0.0)),
+        ttfb_ms=_ms(rec["ttfb_s"]) if "ttfb_s" in rec else None,
+        total_ms=_ms(time.perf_counter() - rec["_t0"]), retries=retries, redirects=0,
+        reused=not rec.get("connections"),
+    )
+    if error is not None:
+        fields["error"] = f"{type(error).__name__}: {error}"
+    _active.record(**fields)
+
+
+# ---------------------------------------------------------------------------
+# Summary
+# ---------------------------------------------------------------------------
+
+
+def load_records(path: str) -> Iterable[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q / 100.0 * len(values)))], 1)
+
+
+def is_error(rec: dict) -> bool:
+    return rec.get("status") is None or rec["status"] >= 400
+
+
+def summarize(records: List[dict], top: int = 5) -> dict:
+    """Throughput, error rates and per-phase/per-host latency of a run."""
+    if not records:
+        return {"requests": 0}
+    start = min(r["ts"] for r in records)
+    end = max(r["ts"] + (r.get("total_ms") or 0) / 1000.0 for r in records)
+    span = max(end - start, 1e-9)
+    total_bytes = sum(r.get("bytes") or 0 for r in records)
+
+    def group_stats(group: List[dict]) -> dict:
+        totals = [r["total_ms"] for r in group if r.get("total_ms") is not None]
+        ttfbs = [r["ttfb_ms"] for r in group if r.get("ttfb_ms") is not None]
+        return {
+            "requests": len(group),
+            "errors": sum(1 for r in group if is_error(r)),
+            "error_rate": round(sum(1 for r in group if is_error(r)) / len(group), 4),
+            "mb": round(sum(r.get("bytes") or 0 for r in group) / 1e6, 3),
+            "ttfb_p50_ms": _pct(ttfbs, 50),
+            "total_p50_ms": _pct(totals, 50),
+            "total_p99_ms": _pct(totals, 99),
+        }
+
+    by_phase: Dict[str, List[dict]] = defaultdict(list)
+    by_host: Dict[str, List[dict]] = defaultdict(list)
+    statuses: Dict[str, int] = defaultdict(int)
+    for r in records:
+        by_phase[r.get("phase", "page")].append(r)
+        by_host[r.get("host", "")].append(r)
+        statuses[str(r.get("status"))] += 1
+
+    hosts = {h: group_stats(g) for h, g in by_host.items()}
+    slowest = sorted(hosts.items(), key=lambda kv: kv[1]["total_p99_ms"] or 0, reverse=True)[:top]
+    new_conns = [r for r in records if not r.get("reused")]
+    return {
+        "requests": len(records),
+        "span_s": round(span, 2),
+        "requests_per_s": round(len(records) / span, 2),
+        "mb_per_s": round(total_bytes / span / 1e6, 3),
+        "errors": sum(1 for r in records if is_error(r)),
+        "error_rate": round(sum(1 for r in records if is_error(r)) / len(records), 4),
+        "retries": sum(r.get("retries") or 0 for r in records),
+        "scraper_requests": sum(1 for r in records if r.get("scraper")),
+        "connection_reuse": round(1 - len(new_conns) / len(records), 4),
+        "dns_p50_ms": _pct([r["dns_ms"] for r in new_conns if r.get("dns_ms")], 50),
+        "connect_p50_ms": _pct([r["connect_ms"] for r in new_conns if r.get("connect_ms")], 50),
+        "statuses": dict(sorted(statuses.items())),
+        "phases": {p: group_stats(g) for p, g in sorted(by_phase.items())},
+        "slowest_hosts": [{"host": h, **s} for h, s in slowest],
+    }
+
+
+def print_summary(summary: dict) -> None:
+    if not summary.get("requests"):
+        print("No requests recorded.")
+        return
+    print(
+        f"{summary['requests']} requests in {summary['span_s']}s: "
+        f"{summary['requests_per_s']} req/s, {summary['mb_per_s']} MB/s"
+    )
+    print(
+        f"Errors: {summary['errors']} ({summary['error_rate']:.1%}), retries: {summary['retries']}, "
+        f"cloudscraper: {summary['scraper_requests']}"
+    )
+    print(
+        f"Connections: {summary['connection_reuse']:.1%} reused, "
+        f"new ones DNS p50 {summary['dns_p50_ms']} ms, connect p50 {summary['connect_p50_ms']} ms"
+    )
+    print("Statuses: " + ", ".join(f"{k}={v}" for k, v in summary["statuses"].items()))
+    print("\nBy phase:")
+    for phase, s in summary["phases"].items():
+        print(
+            f"  {phase:<6} {s['requests']:>6} req  {s['mb']:>9} MB  err {s['error_rate']:.1%}  "
+            f"ttfb p50 {s['ttfb_p50_ms']} ms  total p50 {s['total_p50_ms']} / p99 {s['total_p99_ms']} ms"
+        )
+    print("\nSlowest hosts (by p99 total):")
+    for s in summary["slowest_hosts"]:
+        print(
+            f"  {s['host']:<40} {s['requests']:>6} req  err {s['error_rate']:.1%}  "
+            f"p50 {s['total_p50_ms']} / p99 {s['total_p99_ms']} ms"
+        )
+
+
+def _throwaway_cert(directory: str) -> Optional[str]:
+    """A self-signed cert + key for "localhost" in ``directory`` (PEM path), or None.
+
+    Uses the cryptography package when installed, else the openssl CLI.
+    """
+    path = os.path.join(directory, "localhost.pem")
+    try:
+        import datetime
+
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+    except ImportError:
+        import shutil
+        import subprocess
+
+        exe = shutil.which("openssl")
+        if not exe:
+            return None
+        key_path = os.path.join(directory, "localhost.key")
+        try:
+            subprocess.run(
+                [exe, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                 "-addext", "subjectAltName=DNS:localhost", "-keyout", key_path, "-out", path],
+                check=True, capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        with open(key_path, "rb") as src, open(path, "ab") as dst:
+            dst.write(src.read())
+        return path
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    with open(path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+    return path
+
+
+def check_tls() -> bool:
+    """HTTPS through an instrumented session to a local server, verifying its certificate.
+
+    The timed connections dial the resolved address; this checks that SNI
+    and hostname verification still use the host name, and that the new
+    connection is recorded with its DNS and connect times. The server's
+    certificate is generated for the run and deleted afterwards.
+    """
+    import ssl
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            body = b"ok"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    global _active
+    previous = _active
+    with tempfile.TemporaryDirectory() as tmp:
+        cert = _throwaway_cert(tmp)
+        if cert is None:
+            print("check-tls needs the cryptography package or the openssl CLI to make a test certificate")
+            return False
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert)
+        server = ThreadingHTTPServer(("localhost", 0), Handler)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        path = os.path.join(tmp, "requests.jsonl")
+        _active = tel = Telemetry(path)
+        try:
+            session = instrument(requests.Session())
+            resp = session.get(f"https://localhost:{server.server_port}/", verify=cert, timeout=10)
+            error = None
+        except requests.RequestException as e:
+            resp, error = None, e
+        finally:
+            tel.close()
+            _active = previous
+            server.shutdown()
+            server.server_close()
+        records = list(load_records(path))
+    if error is not None or resp is None or resp.status_code != 200:
+        print(f"HTTPS request failed: {error or resp.status_code}")
+        return False
+    if len(records) != 1 or records[0].get("reused") or records[0].get("dns_ms") is None:
+        print(f"Unexpected telemetry: {records}")
+        return False
+    rec = records[0]
+    print(f"HTTPS with telemetry OK: dns {rec['dns_ms']} ms, connect {rec['connect_ms']} ms, total {rec['total_ms']} ms")
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize crawler request telemetry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("summary", help="Throughput, error rates and slowest hosts")
+    p.add_argument("--path", default=DEFAULT_TELEMETRY, help="Telemetry JSONL file")
+    p.add_argument("--top", type=int, default=5, help="Number of slowest hosts to list")
+    p.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    sub.add_parser("check-tls", help="Check an instrumented HTTPS request against a local server")
+    args = parser.parse_args()
+
+    if args.command == "check-tls":
+        raise SystemExit(0 if check_tls() else 1)
+
+    summary = summarize(list(load_records(args.path)), args.top)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,10 @@ const i18n = {
     },
     random: "ランダム40選。",
     noFavorite: "未収録。",
+    offline: {
+      save: "オフラインで見られるように保存",
+      saved: "オフライン保存済み（タップで解除）"
+    },
     loading: {
       initializing: "ギャラリーを初期化中...",
       fromCache: "(キャッシュから読み込み)",
@@ -51,6 +55,10 @@ const i18n = {
     },
     random: "随机40选。",
     noFavorite: "暂未收录。",
+    offline: {
+      save: "保存此时期以便离线查看",
+      saved: "已离线保存（点击取消）"
+    },
     loading: {
       initializing: "正在初始化图库...",
       fromCache: "(从缓存加载)",
@@ -81,6 +89,10 @@ const i18n = {
     },
     random: "Random 40 Selection.",
     noFavorite: "Not Collected.",
+    offline: {
+      save: "Make available offline",
+      saved: "Available offline (tap to remove)"
+    },
     loading: {
       initializing: "Initializing gallery...",
       fromCache: "(Loading from cache)",
@@ -1,6 +1,13 @@
 let articles = null;
 let descriptions = null;
+let srcsets = {};
+let metas = {};
+// Crawler/image_meta.py 生成的按时期元数据索引（时期 -> meta/<id>.json），非分块模式下使用
+let metaIndex = null;
+const metaRequests = {};
 let favorites = JSON.parse(localStorage.getItem('favorites') || '[]');
+// 用户选择离线保存的时期：ServiceWorker 只为这些时期整批缓存原图
+let offlinePeriods = JSON.parse(localStorage.getItem('offlinePeriods') || '[]');
 
 // 在文件开头添加标记初次加载的变量
 let isFirstLoad = !localStorage.getItem('hasLoaded');
@@ -20,8 +27,16 @@ if (window.location.hostname === 'localhost' || window.location.hostname === '12
   // 生产环境下正常注册 ServiceWorker
   if ('serviceWorker' in navigator) {
     window.addEventListener('load', () => {
-      navigator.serviceWorker.register('/sw.js').then(registration => {
+      navigator.serviceWorker.register('/service-worker.js').then(registration => {
         console.log('ServiceWorker 注册成功:', registration.scope);
+        fetch('precache-manifest.json', { method: 'HEAD', cache: 'no-store' })
+          .then(response => { offlineReady = response.ok; })
+          .catch(() => { offlineReady = false; })
+          .then(() => {
+            if (!offlineReady) console.info('没有 precache-manifest.json（由 Crawler/precache.py 生成），不提供离线保存');
+          });
+        // 按预缓存清单更新有变化的文件，并补齐离线保存的时期
+        navigator.serviceWorker.ready.then(ready => ready.active.postMessage({ type: 'sync', periods: offlinePeriods }));
       }).catch(error => {
         console.log('ServiceWorker 注册失败:', error);
       });
@@ -41,7 +56,33 @@ const currentLang = (() => {
   return 'ja'; // 默认日语
 })();
 
+// Crawler/build_static.py 生成的分块索引；存在时按时期分块加载，否则一次加载完整的 article.json
+let chunkIndex = null;
+// 有 precache-manifest.json（Crawler/precache.py 生成）时 ServiceWorker 才能整批离线保存某个时期
+let offlineReady = false;
+const loadedChunks = {};
+
 async function loadData() {
+  try {
+    const indexResponse = await fetch('data/index.json');
+    if (indexResponse.ok) {
+      chunkIndex = await indexResponse.json();
+    }
+  } catch (error) {
+    chunkIndex = null;
+  }
+  if (!chunkIndex) {
+    console.info('没有 data/index.json（由 Crawler/build_static.py 生成），改为一次加载完整的 article.json');
+  }
+
+  if (chunkIndex) {
+    // 各时期的图片、说明、元数据和派生图清单都在分块里，显示时再按需加载；
+    // 初始视图由页面按 URL 参数显示，这里不先渲染全部，免得多加载分块
+    articles = {};
+    descriptions = {};
+    return;
+  }
+
   const [articlesResponse, descriptionsResponse] = await Promise.all([
     fetch('article.json'),
     fetch('desc.json')
@@ -50,10 +91,223 @@ async function loadData() {
   articles = await articlesResponse.json();
   descriptions = await descriptionsResponse.json();
 
-  displayImages('all');
+  await migrateFavorites();
+
+  // 可选的派生小图清单（由 Crawler/derivatives.py 生成），没有时网格直接用原图
+  try {
+    const srcsetResponse = await fetch('article.srcset.json');
+    if (srcsetResponse.ok) {
+      srcsets = await srcsetResponse.json();
+    }
+  } catch (error) {
+    console.warn('加载派生图片清单失败:', error);
+  }
+
+  // 可选的图片元数据（由 Crawler/image_meta.py 生成）：有尺寸就不必先下载整张图再布局；
+  // 这里只取索引，各时期的那一份在显示时再加载
+  try {
+    const metaResponse = await fetch('meta/index.json');
+    if (metaResponse.ok) {
+      metaIndex = (await metaResponse.json()).periods || {};
+    }
+  } catch (error) {
+    console.warn('加载图片元数据索引失败:', error);
+  }
+  // 初始视图由页面按 URL 参数显示，只加载该视图需要的元数据
+}
+
+// 分块模式下加载某个视图需要的时期：单个时期只加载它自己；全部先只加载第一个时期，
+// 其余在滚动到底部附近时再加载（见 loadMoreIfNeeded）；缘/集需要所有时期
+async function ensurePeriods(period) {
+  if (period === 'about') return;
+  if (!chunkIndex) {
+    await ensureMeta(period);
+    return;
+  }
+  const single = chunkIndex.periods.filter(p => p.key === period);
+  let targets = chunkIndex.periods;
+  if (single.length) {
+    targets = single;
+  } else if (period === 'all') {
+    targets = chunkIndex.periods.slice(0, 1);
+  }
+  await loadChunks(targets);
+  if (targets === chunkIndex.periods) {
+    await migrateFavorites();
+  }
+}
+
+// 每个分块只请求一次（并发的视图切换共用同一个请求）
+const chunkRequests = {};
+
+async function loadChunks(targets) {
+  const missing = targets.filter(p => !loadedChunks[p.key]);
+  if (missing.length === 0) return;
+
+  await Promise.all(missing.map(p => {
+    if (!chunkRequests[p.key]) {
+      chunkRequests[p.key] = fetch(p.chunk)
+        .then(response => response.json())
+        .then(chunk => {
+          loadedChunks[p.key] = chunk;
+          descriptions[p.key] = chunk.description;
+          Object.assign(metas, chunk.meta || {});
+          Object.assign(srcsets, chunk.srcset || {});
+        })
+        .catch(error => {
+          delete chunkRequests[p.key];
+          throw error;
+        });
+    }
+    return chunkRequests[p.key];
+  }));
+
+  // 保持索引中的时期顺序
+  articles = {};
+  chunkIndex.periods.forEach(p => {
+    if (loadedChunks[p.key]) {
+      articles[p.key] = loadedChunks[p.key].images;
+    }
+  });
 }
 
-function displayImages(period) {
+// 全部视图显示的时期：分块模式下只显示按索引顺序连续加载好的前几个时期，后面的加载后接在末尾
+function allViewPeriods() {
+  if (!chunkIndex) return Object.keys(articles);
+  const keys = [];
+  for (const p of chunkIndex.periods) {
+    if (!loadedChunks[p.key]) break;
+    keys.push(p.key);
+  }
+  return keys;
+}
+
+// 全部视图滚动到底部附近时加载下一个时期的分块，并在原位置重新布局（已有图片位置不变）
+let loadingMore = false;
+
+async function loadMoreIfNeeded() {
+  if (!chunkIndex || currentPeriod !== 'all' || loadingMore) return;
+  const next = chunkIndex.periods.find(p => !loadedChunks[p.key]);
+  if (!next) return;
+  const gallery = document.querySelector('.gallery');
+  if (gallery.getBoundingClientRect().bottom > window.innerHeight * 2) return;
+
+  loadingMore = true;
+  const token = displayToken;
+  try {
+    await loadChunks([next]);
+  } catch (error) {
+    console.error('加载时期数据失败:', error);
+    return;
+  } finally {
+    loadingMore = false;
+  }
+  if (token === displayToken) {
+    renderPeriod('all', true);
+  }
+}
+
+window.addEventListener('scroll', () => loadMoreIfNeeded());
+
+// 非分块模式下加载视图需要的时期的图片元数据（每个时期只请求一次）
+async function ensureMeta(period) {
+  if (!metaIndex) return;
+  const keys = period in articles ? [period] : Object.keys(articles);
+  await Promise.all(keys.filter(key => metaIndex[key]).map(key => {
+    if (!metaRequests[key]) {
+      metaRequests[key] = fetch(metaIndex[key])
+        .then(response => (response.ok ? response.json() : {}))
+        .then(meta => { Object.assign(metas, meta); })
+        .catch(error => {
+          delete metaRequests[key];
+          console.warn('加载图片元数据失败:', key, error);
+        });
+    }
+    return metaRequests[key];
+  }));
+}
+
+// 图片改用内容哈希地址（Crawler/content_store.py --rewrite-article）后，把旧路径的收藏迁移过去
+async function migrateFavorites() {
+  const known = new Set();
+  Object.values(articles).forEach(section => Object.values(section).forEach(path => known.add(path)));
+  if (favorites.every(path => known.has(path))) return;
+
+  try {
+    const response = await fetch('cas/map.json');
+    if (!response.ok) return;
+    const files = (await response.json()).files || {};
+    favorites = favorites.map(path => {
+      const entry = files[path.replace(/\\/g, '/')];
+      return entry && known.has(entry.cas) ? entry.cas : path;
+    });
+    localStorage.setItem('favorites', JSON.stringify(favorites));
+  } catch (error) {
+    console.warn('迁移收藏失败:', error);
+  }
+}
+
+// 网格缩略图的目标宽度（CSS 像素）
+const TILE_WIDTH = 320;
+
+// 为网格挑选合适宽度的派生 WebP，返回 { src, width, height }；原图尺寸用于布局和灯箱
+function tileSource(path) {
+  const entry = srcsets[path];
+  if (!entry) return null;
+  const srcset = entry.srcset && entry.srcset['image/webp'];
+  if (!srcset) {
+    return entry.fallback ? { src: entry.fallback, width: entry.width, height: entry.height } : null;
+  }
+  const target = TILE_WIDTH * (window.devicePixelRatio || 1);
+  const candidates = srcset.split(',').map(candidate => {
+    const [url, descriptor] = candidate.trim().split(/\s+/);
+    return { url, width: parseInt(descriptor, 10) };
+  });
+  const pick = candidates.find(c => c.width >= target) || candidates[candidates.length - 1];
+  return { src: pick.url, width: entry.width, height: entry.height };
+}
+
+// 每次切换视图递增，旧视图的数据晚到时不再渲染
+let displayToken = 0;
+let currentPeriod = null;
+
+async function displayImages(period) {
+  const token = ++displayToken;
+  currentPeriod = period;
+  try {
+    await ensurePeriods(period);
+  } catch (error) {
+    console.error('加载时期数据失败:', error);
+  }
+  if (token === displayToken) {
+    renderPeriod(period);
+  }
+}
+
+// “离线可看”开关：打开时让 ServiceWorker 在后台把该时期的原图整批放进缓存，关闭时移出缓存。
+// 原图体积大，所以只在用户明确选择时才下载
+function offlineToggle(period) {
+  if (!offlineReady || !navigator.serviceWorker || !navigator.serviceWorker.controller) return null;
+  const button = document.createElement('button');
+  button.className = 'offline-btn';
+  const update = () => {
+    const on = offlinePeriods.includes(period);
+    button.classList.toggle('active', on);
+    button.textContent = on ? i18n[currentLang].offline.saved : i18n[currentLang].offline.save;
+  };
+  button.addEventListener('click', () => {
+    const on = !offlinePeriods.includes(period);
+    offlinePeriods = on ? [...offlinePeriods, period] : offlinePeriods.filter(p => p !== period);
+    localStorage.setItem('offlinePeriods', JSON.stringify(offlinePeriods));
+    navigator.serviceWorker.controller.postMessage({ type: on ? 'prefetch-period' : 'evict-period', period });
+    update();
+  });
+  update();
+  return button;
+}
+
+// grow：全部视图加载了更多时期后重新布局，保留当前画廊和滚动位置
+function renderPeriod(period, grow = false) {
   const gallery = document.querySelector('.gallery');
   const description = document.querySelector('.description');
   const aboutContainer = document.querySelector('.about-container');
@@ -72,19 +326,21 @@ function displayImages(period) {
   aboutContainer.classList.remove('visible');
 
   // 首先清空gallery、重设高度并添加加载遮罩
-  gallery.style.height = '300px';
-  gallery.innerHTML = `
-    <div class="loading-mask visible">
-      <div class="loading-spinner"></div>
-    </div>
-  `;
+  if (!grow) {
+    gallery.style.height = '300px';
+    gallery.innerHTML = `
+      <div class="loading-mask visible">
+        <div class="loading-spinner"></div>
+      </div>
+    `;
+  }
 
-  const loadingMask = gallery.querySelector('.loading-mask');
+  const loadingMask = gallery.querySelector('.loading-mask') || document.createElement('div');
 
   let images = [];
 
   if (period === 'all') {
-    Object.keys(articles).forEach(key => {
+    allViewPeriods().forEach(key => {
       Object.entries(articles[key]).forEach(([title, path]) => {
         images.push({ title, path, period: key });
       });
@@ -138,6 +394,10 @@ function displayImages(period) {
     const i18nPeriodDesc = (i18n[currentLang] && i18n[currentLang].periodDesc && i18n[currentLang].periodDesc[period]) || null;
     description.textContent = i18nPeriodDesc || descriptions[period] || '';
     description.classList.add('visible');
+    const toggle = offlineToggle(period);
+    if (toggle) {
+      description.appendChild(toggle);
+    }
   }
 
   // 添加 IndexedDB 相关函数
@@ -222,9 +482,22 @@ function displayImages(period) {
   async function loadImages() {
     let loadedCount = 0;
     const imagePromises = images.map(async (image, index) => {
+      // 有派生小图时网格只加载小图，布局和灯箱使用清单里记录的原图尺寸
+      const tile = tileSource(image.path);
+      const src = tile ? tile.src : image.path;
+      if (tile) {
+        image.tileSrc = tile.src;
+      }
+
+      // 已知尺寸时立即返回，图片在渲染时再懒加载
+      const meta = metas[image.path];
+      if (meta) {
+        return { ...image, width: meta.width, height: meta.height };
+      }
+
       try {
         // 首先尝试从 IndexedDB 获取缓存的图片
-        const cachedImage = await imageDB.getImage(image.path);
+        const cachedImage = await imageDB.getImage(src);
 
         if (cachedImage && cachedImage.blob) {
           loadedCount++;
@@ -240,8 +513,8 @@ function displayImages(period) {
               URL.revokeObjectURL(objectUrl);
               resolve({
                 ...image,
-                width: img.width,
-                height: img.height,
+                width: tile ? tile.width : img.width,
+                height: tile ? tile.height : img.height,
                 blob: cachedImage.blob  // 保存 blob 数据以供后续使用
               });
             };
@@ -250,12 +523,12 @@ function displayImages(period) {
         }
 
         // 如果没有缓存，从网络加载
-        const response = await fetch(image.path);
+        const response = await fetch(src);
         const blob = await response.blob();
 
         // 保存到 IndexedDB
         try {
-          await imageDB.saveImage(image.path, blob);
+          await imageDB.saveImage(src, blob);
         } catch (cacheError) {
           console.warn('缓存图片失败:', cacheError);
         }
@@ -270,8 +543,8 @@ function displayImages(period) {
           img.onload = () => {
             resolve({
               ...image,
-              width: img.width,
-              height: img.height,
+              width: tile ? tile.width : img.width,
+              height: tile ? tile.height : img.height,
               blob: blob  // 保存 blob 数据以供后续使用
             });
           };
@@ -283,7 +556,7 @@ function displayImages(period) {
 
         // 网络请求失败时，再次尝试从 IndexedDB 读取
         try {
-          const cachedImage = await imageDB.getImage(image.path);
+          const cachedImage = await imageDB.getImage(src);
           if (cachedImage && cachedImage.blob) {
             loadedCount++;
             if (isFirstLoad) {
@@ -298,8 +571,8 @@ function displayImages(period) {
                 URL.revokeObjectURL(objectUrl);
                 resolve({
                   ...image,
-                  width: img.width,
-                  height: img.height,
+                  width: tile ? tile.width : img.width,
+                  height: tile ? tile.height : img.height,
                   blob: cachedImage.blob  // 保存 blob 数据以供后续使用
                 });
               };
@@ -525,6 +798,14 @@ function displayImages(period) {
           item.style.width = `${positions[index].width}px`;
           item.style.height = `${positions[index].height}px`;
 
+          // 图片到达前先显示主色和模糊占位图
+          const meta = metas[image.path];
+          if (meta) {
+            item.style.backgroundColor = meta.color;
+            item.style.backgroundImage = `url("${meta.lqip}")`;
+            item.style.backgroundSize = 'cover';
+          }
+
           const isFavorite = favorites.includes(image.path);
 
           const createImageElement = async () => {
@@ -545,7 +826,7 @@ function displayImages(period) {
               if (image.blob) {
                 imageBlob = image.blob;
               } else {
-                const cachedImage = await imageDB.getImage(image.path);
+                const cachedImage = await imageDB.getImage(image.tileSrc || image.path);
                 if (cachedImage && cachedImage.blob) {
                   imageBlob = cachedImage.blob;
                 }
@@ -608,8 +889,11 @@ function displayImages(period) {
 
               img.dataset.objectUrl = objectUrl;
               img.src = objectUrl;
-            } else if (!blob) {
-              img.src = image.path;
+            } else if (img) {
+              img.onload = () => {
+                item.classList.remove('placeholder');
+              };
+              img.src = image.tileSrc || image.path;
             }
 
             // 添加收藏按钮点击事件
@@ -629,8 +913,8 @@ function displayImages(period) {
 
             // 准备 PhotoSwipe 的图片数组
             const items = loadedImages.map(img => {
-              // 如果有 blob 数据，使用 blob URL
-              if (img.blob) {
+              // 如果有 blob 数据（且不是网格用的派生小图），使用 blob URL
+              if (img.blob && !img.tileSrc) {
                 const blobUrl = URL.createObjectURL(img.blob);
                 return {
                   src: blobUrl,
@@ -694,7 +978,8 @@ function displayImages(period) {
     }
   }
 
-  renderGallery();
+  // 画面还没填满时继续加载下一个时期
+  renderGallery().then(() => loadMoreIfNeeded());
 }
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -735,6 +1020,10 @@ document.addEventListener('DOMContentLoaded', () => {
       }
     });
 
+    if (!document.querySelector('.period-btn.active')) {
+      displayImages('all');
+    }
+
     // 处理浏览器前进后退
     window.addEventListener('popstate', () => {
       const params = new URLSearchParams(window.location.search);
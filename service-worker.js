@@ -1,4 +1,13 @@
-const CACHE_NAME = 'demotivational-world-v1';
+const CACHE_NAME = 'demotivational-world-v2';
+// 预缓存清单由 Crawler/precache.py 生成，列出每个文件的内容版本和大小
+const MANIFEST_URL = 'precache-manifest.json';
+// 记录缓存中每个 URL 对应的版本，保存在同一个缓存里
+const REVISIONS_KEY = '__precache-revisions';
+// 最近一次同步的清单也存进缓存，ServiceWorker 重启后仍能判断缓存条目是否过期
+const MANIFEST_KEY = '__precache-manifest';
+// 批量预取时的并发请求数
+const PREFETCH_CONCURRENCY = 6;
+// 没有清单时安装阶段预缓存的文件
 const STATIC_ASSETS = [
   '/',
   '/index.html',
@@ -11,11 +20,171 @@ const STATIC_ASSETS = [
   '/modules/photoswipe.min.css',
 ];
 
+// URL -> 版本；与缓存内容一致的条目可以直接从缓存返回
+let revisions = null;
+// 最近一次同步的清单，以及其中每个 URL 的版本
+let manifest = null;
+let manifestRevisions = {};
+let saveTimer = null;
+
+const absoluteUrl = url => new URL(url, self.registration.scope).href;
+
+async function loadRevisions(cache) {
+  if (revisions) return revisions;
+  const response = await cache.match(REVISIONS_KEY);
+  revisions = response ? await response.json() : {};
+  return revisions;
+}
+
+function saveRevisions(cache) {
+  return cache.put(REVISIONS_KEY, new Response(JSON.stringify(revisions), {
+    headers: { 'Content-Type': 'application/json' }
+  }));
+}
+
+// 合并短时间内的多次保存
+function scheduleSaveRevisions(cache) {
+  clearTimeout(saveTimer);
+  saveTimer = setTimeout(() => saveRevisions(cache), 1000);
+}
+
+function useManifest(latest) {
+  manifest = latest;
+  manifestRevisions = {};
+  latest.assets.forEach(entry => { manifestRevisions[absoluteUrl(entry.url)] = entry.revision; });
+  Object.values(latest.periods).forEach(items => {
+    items.forEach(entry => { manifestRevisions[absoluteUrl(entry.url)] = entry.revision; });
+  });
+}
+
+// ServiceWorker 重启后从缓存恢复上次同步的清单
+async function loadManifest(cache) {
+  if (manifest) return manifest;
+  const response = await cache.match(MANIFEST_KEY);
+  if (response) {
+    useManifest(await response.json());
+  }
+  return manifest;
+}
+
+function saveManifest(cache, latest) {
+  return cache.put(MANIFEST_KEY, new Response(JSON.stringify(latest), {
+    headers: { 'Content-Type': 'application/json' }
+  }));
+}
+
+async function fetchManifest() {
+  const response = await fetch(MANIFEST_URL, { cache: 'no-store' });
+  if (!response.ok) {
+    console.warn(`没有 ${MANIFEST_URL}（由 Crawler/precache.py 生成）：只预缓存固定的静态文件，不能离线保存时期`);
+    return null;
+  }
+  return response.json();
+}
+
+// 把一个条目以指定版本放入缓存
+async function cacheEntry(cache, entry) {
+  const url = absoluteUrl(entry.url);
+  const response = await fetch(url, { cache: 'reload' });
+  if (!response.ok) return;
+  await cache.put(url, response);
+  revisions[url] = entry.revision;
+}
+
+// 以有限并发处理一批条目
+async function runLimited(entries, worker) {
+  let next = 0;
+  const runners = Array.from({ length: Math.min(PREFETCH_CONCURRENCY, entries.length) }, async () => {
+    while (next < entries.length) {
+      const entry = entries[next++];
+      try {
+        await worker(entry);
+      } catch (error) {
+        console.warn('预缓存失败:', entry.url, error);
+      }
+    }
+  });
+  await Promise.all(runners);
+}
+
+// 按清单同步缓存：只重新下载版本变化的静态文件，版本变化或已删除的图片直接移出缓存
+async function syncPrecache() {
+  const latest = await fetchManifest();
+  if (!latest) return;
+  const cache = await caches.open(CACHE_NAME);
+  await loadRevisions(cache);
+  useManifest(latest);
+  if (revisions[MANIFEST_URL] === latest.revision) {
+    return;
+  }
+  await saveManifest(cache, latest);
+
+  const staleAssets = latest.assets.filter(entry => revisions[absoluteUrl(entry.url)] !== entry.revision);
+  await runLimited(staleAssets, entry => cacheEntry(cache, entry));
+
+  const keys = await cache.keys();
+  await Promise.all(keys.map(request => {
+    const url = request.url;
+    if (url.endsWith(REVISIONS_KEY) || url.endsWith(MANIFEST_KEY) || !(url in revisions)) return null;
+    if (manifestRevisions[url] !== revisions[url]) {
+      delete revisions[url];
+      return cache.delete(request);
+    }
+    return null;
+  }));
+
+  revisions[MANIFEST_URL] = latest.revision;
+  await saveRevisions(cache);
+}
+
+// 批量预取某个时期的全部图片（已是最新版本的跳过）；只在页面上打开“离线可看”时调用
+async function prefetchPeriod(period) {
+  const cache = await caches.open(CACHE_NAME);
+  await loadManifest(cache);
+  if (!manifest) {
+    const latest = await fetchManifest();
+    if (latest) useManifest(latest);
+  }
+  if (!manifest || !manifest.periods[period]) return;
+  await loadRevisions(cache);
+  const missing = manifest.periods[period].filter(entry => revisions[absoluteUrl(entry.url)] !== entry.revision);
+  await runLimited(missing, entry => cacheEntry(cache, entry));
+  await saveRevisions(cache);
+}
+
+// 关闭“离线可看”：把该时期的图片移出缓存
+async function evictPeriod(period) {
+  const cache = await caches.open(CACHE_NAME);
+  await loadManifest(cache);
+  if (!manifest || !manifest.periods[period]) return;
+  await loadRevisions(cache);
+  await Promise.all(manifest.periods[period].map(entry => {
+    const url = absoluteUrl(entry.url);
+    delete revisions[url];
+    return cache.delete(url);
+  }));
+  await saveRevisions(cache);
+}
+
+// 同步清单后补齐用户选择离线保存的时期
+async function syncAndPrefetch(periods) {
+  await syncPrecache();
+  for (const period of periods || []) {
+    await prefetchPeriod(period);
+  }
+}
+
 // 安装 Service Worker
 self.addEventListener('install', event => {
   event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(cache => cache.addAll(STATIC_ASSETS))
+    syncPrecache()
+      .catch(error => console.warn('同步预缓存清单失败:', error))
+      .then(() => {
+        // 没有清单时退回固定的静态文件列表
+        if (!manifest) {
+          return caches.open(CACHE_NAME).then(cache => cache.addAll(STATIC_ASSETS));
+        }
+      })
   );
 });
 
@@ -32,35 +201,56 @@ self.addEventListener('activate', event => {
   );
 });
 
+// 页面通知：同步清单 / 离线保存或移除某个时期
+self.addEventListener('message', event => {
+  const data = event.data || {};
+  if (data.type === 'sync') {
+    event.waitUntil(syncAndPrefetch(data.periods));
+  } else if (data.type === 'prefetch-period') {
+    event.waitUntil(prefetchPeriod(data.period));
+  } else if (data.type === 'evict-period') {
+    event.waitUntil(evictPeriod(data.period));
+  }
+});
+
 // 处理请求
 self.addEventListener('fetch', event => {
-  event.respondWith(
-    caches.match(event.request)
-      .then(response => {
-        // 如果在缓存中找到响应,则返回缓存的响应
-        if (response) {
-          return response;
-        }
-
-        // 克隆请求,因为请求是一个流,只能使用一次
-        const fetchRequest = event.request.clone();
+  if (event.request.method !== 'GET') return;
 
-        return fetch(fetchRequest).then(response => {
-          // 检查是否是有效的响应
-          if (!response || response.status !== 200 || response.type !== 'basic') {
-            return response;
-          }
+  event.respondWith((async () => {
+    const cache = await caches.open(CACHE_NAME);
+    await loadRevisions(cache);
+    await loadManifest(cache);
+    const url = event.request.url;
 
-          // 克隆响应,因为响应是一个流,只能使用一次
-          const responseToCache = response.clone();
+    // 清单里有版本的条目：缓存中版本与清单一致就直接返回
+    if (url in revisions && (!(url in manifestRevisions) || manifestRevisions[url] === revisions[url])) {
+      const cached = await cache.match(event.request);
+      if (cached) {
+        return cached;
+      }
+    }
 
-          caches.open(CACHE_NAME)
-            .then(cache => {
-              cache.put(event.request, responseToCache);
-            });
-
-          return response;
-        });
-      })
-  );
-}); 
\ No newline at end of file
+    // 其余请求优先走网络，离线时再退回缓存
+    try {
+      const response = await fetch(event.request);
+      // 检查是否是有效的响应
+      if (response && response.status === 200 && response.type === 'basic') {
+        // 克隆响应,因为响应是一个流,只能使用一次
+        cache.put(event.request, response.clone());
+        // 清单里的条目记下版本，下次直接用缓存
+        if (url in manifestRevisions) {
+          revisions[url] = manifestRevisions[url];
+          scheduleSaveRevisions(cache);
+        }
+      }
+      return response;
+    } catch (error) {
+      const cached = await cache.match(event.request);
+      if (cached) {
+        return cached;
+      }
+      throw error;
+    }
+  })());
+});